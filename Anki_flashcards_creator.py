@@ -1,10 +1,29 @@
 import os
-import PyPDF2
-from openai import OpenAI, APIConnectionError
+from openai import APIConnectionError
 from dotenv import load_dotenv
 import json
 import hashlib
 import unicodedata
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from llm_client import chat_completion, is_configured
+from pdf_extraction import OCR_AVAILABLE
+from document_readers import (
+    PPTX_AVAILABLE, SUPPORTED_EXTENSIONS, iter_pdf, iter_pptx, iter_ppt, iter_document_cached
+)
+from extraction_cache import hash_file
+from libreoffice_pool import get_office_pool
+from chunking import iter_token_chunks, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from dedupe import dedupe_flashcards, DEDUPE_ENABLED
+from metrics import timed_iter, timed_stage
+from model_router import get_router
+from structured_output import structured_completion, json_mode_enabled, user_template, parse_cards
+from token_budget import (
+    TokenBudget, BudgetExceededError, generation_max_tokens, DOCUMENT_TOKEN_BUDGET, SESSION_TOKEN_BUDGET
+)
 
 # Language setting: 'en' for English, 'zh' for Chinese
 LANGUAGE = 'zh'  # 可选: 'en' 或 'zh'
@@ -12,147 +31,43 @@ LANGUAGE = 'zh'  # 可选: 'en' 或 'zh'
 # Maximum number of flashcards to generate (set to 0 for unlimited)
 MAX_FLASHCARDS = 0  # 0表示无限制，其他正整数表示最大生成数量
 
-try:
-    import pytesseract
-    from PIL import Image
-    from pdf2image import convert_from_path
-    OCR_AVAILABLE = True
-except ImportError:
-    OCR_AVAILABLE = False
-
-try:
-    from pptx import Presentation
-    PPTX_AVAILABLE = True
-except ImportError:
-    PPTX_AVAILABLE = False
-
 ROOT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
 load_dotenv()
-ARK_BASE_URL = "https://ark.cn-beijing.volces.com/api/v3"
+# The API client, retries and rate limits are configured in llm_client (ARK_BASE_URL can point at
+# any OpenAI-compatible server, e.g. a local stub for testing)
 
-def get_openai_client():
-    api_key = os.environ.get("ARK_API_KEY")
-    if not api_key:
-        raise SystemExit("Set ARK_API_KEY before running this script.")
-    return OpenAI(api_key=api_key, base_url=ARK_BASE_URL)
+# Models are configured in model_router (LLM_MODEL / LLM_FAST_MODEL): short sections go to the fast
+# model when one is set, and are re-sent to the large model if its output yields no cards
+
+# Section generation settings: sections are sent to the API concurrently
+SECTION_SIZE = 1000
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("ARK_MAX_CONCURRENCY", "8"))  # 同时发送的最大请求数
+REQUEST_TIMEOUT = float(os.environ.get("ARK_REQUEST_TIMEOUT", "120"))  # 单个请求的超时时间（秒）
+
+# Batch mode (--batch DIR): documents are extracted in a process pool and generated in a thread pool
+BATCH_EXTRACT_WORKERS = int(os.environ.get("BATCH_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+BATCH_GENERATE_WORKERS = int(os.environ.get("BATCH_GENERATE_WORKERS", "2"))  # 同时生成的文档数
+BATCH_QUEUE_SIZE = int(os.environ.get("BATCH_QUEUE_SIZE", "4"))  # 已提取、等待生成的文档数上限
+BATCH_MANIFEST_NAME = "batch_manifest.jsonl"
 
-client = get_openai_client()
+# The read_* helpers return the whole document as one string.
+# Use document_readers.iter_document to consume page/slide chunks as a stream instead.
 
 # Read PDF with OCR support for scanned documents
-def read_pdf(file_path):
-    text = ""
-    
-    # First, try to extract text directly
-    with open(file_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        for page in reader.pages:
-            extracted = page.extract_text()
-            if extracted:
-                text += extracted + " "
-    
-    # If no text extracted and OCR is available, use OCR on images
-    if not text.strip() and OCR_AVAILABLE:
-        print("No text found. Attempting OCR on scanned document...")
-        try:
-            images = convert_from_path(file_path)
-            for img in images:
-                ocr_text = pytesseract.image_to_string(img, lang='eng+chi_sim')
-                text += ocr_text + " "
-            print(f"OCR extraction completed: {len(text)} characters extracted")
-        except Exception as e:
-            print(f"OCR processing failed: {e}")
-    elif not text.strip():
-        print("Warning: No text extracted and OCR not available. Install: pip install pytesseract pdf2image pillow")
-    
-    return text
+# Pages are extracted in parallel; OCR only runs on pages that returned no text
+def read_pdf(file_path, max_workers=None):
+    return "".join(chunk.text for chunk in timed_iter('read_pdf', iter_pdf(file_path, max_workers=max_workers)))
 
 # Read PowerPoint file
 def read_pptx(file_path):
-    text = ""
-    try:
-        presentation = Presentation(file_path)
-        for slide_num, slide in enumerate(presentation.slides, 1):
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text += shape.text + " "
-        print(f"PPTX extraction completed: {len(text)} characters extracted from {len(presentation.slides)} slides")
-    except Exception as e:
-        print(f"PPTX processing failed: {e}")
-    return text
+    return "".join(chunk.text for chunk in timed_iter('read_pptx', iter_pptx(file_path)))
 
 # Read PowerPoint 97-2003 file (.ppt)
 def read_ppt(file_path):
-    text = ""
-    try:
-        import subprocess
-        import tempfile
-        
-        # Try conversion method 1: unoconv
-        try:
-            subprocess.run(['unoconv', '-f', 'pptx', '-o', file_path.replace('.ppt', '_converted.pptx'), file_path], 
-                          check=True, capture_output=True, timeout=30)
-            converted_file = file_path.replace('.ppt', '_converted.pptx')
-            if os.path.exists(converted_file):
-                text = read_pptx(converted_file)
-                os.remove(converted_file)
-                print(f"PPT conversion successful using unoconv")
-                return text
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            pass
-        
-        # Try conversion method 2: libreoffice soffice
-        try:
-            temp_dir = tempfile.gettempdir()
-            subprocess.run(['soffice', '--headless', '--convert-to', 'pptx', '--outdir', temp_dir, file_path],
-                          check=True, capture_output=True, timeout=30)
-            converted_file = os.path.join(temp_dir, os.path.splitext(os.path.basename(file_path))[0] + '.pptx')
-            if os.path.exists(converted_file):
-                text = read_pptx(converted_file)
-                os.remove(converted_file)
-                print(f"PPT conversion successful using soffice")
-                return text
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            pass
-        
-        # Fallback: Extract using zipfile (PPT files are ZIP archives with OLE streams)
-        try:
-            import zipfile
-            import xml.etree.ElementTree as ET
-            
-            with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                # Try to find slide files
-                slide_files = [f for f in zip_ref.namelist() if f.startswith('ppt/slides/slide') and f.endswith('.xml')]
-                
-                if slide_files:
-                    for slide_file in sorted(slide_files):
-                        try:
-                            with zip_ref.open(slide_file) as xml_file:
-                                root = ET.fromstring(xml_file.read())
-                                # Extract all text elements from the slide
-                                for elem in root.iter():
-                                    if elem.text:
-                                        text += elem.text + " "
-                        except Exception:
-                            pass
-                    
-                    if text.strip():
-                        print(f"PPT extraction completed using zipfile: {len(text)} characters extracted")
-                        return text
-        except (zipfile.BadZipFile, Exception):
-            pass
-        
-        print("Warning: Could not parse PPT file.")
-        print("Recommended solutions:")
-        print("  1. Convert PPT to PPTX manually and use the PPTX file")
-        print("  2. Install unoconv: pip install unoconv (Linux/Mac)")
-        print("  3. Install LibreOffice: sudo apt-get install libreoffice (Linux)")
-    
-    except Exception as e:
-        print(f"PPT processing failed: {e}")
-    
-    return text
+    return "".join(chunk.text for chunk in timed_iter('read_ppt', iter_ppt(file_path)))
 
-# dividing text into smaller chunks:
+# dividing text into smaller chunks (fixed size; generation uses chunking.iter_token_chunks):
+@timed_stage('divide_text')
 def divide_text(text, section_size):
     sections = []
     start = 0
@@ -168,11 +83,14 @@ def divide_text(text, section_size):
 PROMPTS = {
     'en': {
         'system': "You are a helpful assistant.",
-        'user': "Create anki flashcards with the provided text using a format: question;answer newline question;answer etc. Keep question and the corresponding answer on the same line. Do not add any introductory text. Text: {text}"
+        'user': "Create anki flashcards with the provided text using a format: question;answer newline question;answer etc. Keep question and the corresponding answer on the same line. Do not add any introductory text. Text: {text}",
+        # Used in JSON mode, where structured_output appends the JSON output format instead
+        'json_user': "Create anki flashcards with the provided text. Each flashcard has a question and its answer. Do not add any introductory text. Text: {text}"
     },
     'zh': {
         'system': "你是一个有帮助的助手。",
-        'user': "根据提供的文本创建Anki闪卡，使用以下格式：问题;答案 换行 问题;答案 等。确保问题和对应的答案在同一行。不要添加任何介绍文本。文本：{text}"
+        'user': "根据提供的文本创建Anki闪卡，使用以下格式：问题;答案 换行 问题;答案 等。确保问题和对应的答案在同一行。不要添加任何介绍文本。文本：{text}",
+        'json_user': "根据提供的文本创建Anki闪卡，每张闪卡包含一个问题和对应的答案。不要添加任何介绍文本。文本：{text}"
     }
 }
 
@@ -191,63 +109,145 @@ def sanitize_filename(filename):
         hash_suffix = hashlib.md5(base_name.encode('utf-8')).hexdigest()[:8]
         return f"flashcard_{hash_suffix}"
 
-# Create Anki cards and save as JSON
-def create_anki_cards(pdf_text, pdf_filename="document"):
-    SECTION_SIZE = 1000
-    divided_sections = divide_text(pdf_text, SECTION_SIZE)
-    
-    flashcards_list = []
-    
-    # 限制API调用次数，当前只处理第一部分文本
-    for i, text in enumerate(divided_sections):
-        if i > 0:
-            break
-
-        # Get prompts based on language setting
-        lang = LANGUAGE if LANGUAGE in PROMPTS else 'en'
-        prompts = PROMPTS[lang]
-        
-        messages = [
-            {"role": "system", "content": prompts['system']},
-            {"role": "user", "content": prompts['user'].format(text=text)}
-        ]
+# Generate flashcards for a single section of text
+# max_tokens is sized to the expected card density of the section (see token_budget);
+# budget is an optional TokenBudget the request is charged against
+def generate_section_flashcards(text, timeout=REQUEST_TIMEOUT, use_cache=True, budget=None):
+    # Get prompts based on language setting
+    lang = LANGUAGE if LANGUAGE in PROMPTS else 'en'
+    prompts = PROMPTS[lang]
 
-        try:
-            response = client.chat.completions.create(
-                model="doubao-seed-1-6-251015",
-                messages=messages,
-                temperature=0.3,
-                max_tokens=2048,
-            )
-            response_from_api = response.choices[0].message.content.strip()
-            
-            # 解析API返回的字符串
-            lines = response_from_api.split('\n')
-            for line in lines:
-                # Check if max flashcards limit reached
-                if MAX_FLASHCARDS > 0 and len(flashcards_list) >= MAX_FLASHCARDS:
+    # Ask for JSON output when the endpoint supports it; the parser also accepts "question;answer" lines
+    json_mode = json_mode_enabled()
+    user = user_template(prompts, lang)
+    messages = [
+        {"role": "system", "content": prompts['system']},
+        {"role": "user", "content": user.format(text=text)}
+    ]
+
+    def call_api(model):
+        return structured_completion(
+            chat_completion,
+            messages,
+            json_mode,
+            model=model,
+            temperature=0.3,
+            max_tokens=generation_max_tokens(text),
+            timeout=timeout,
+            budget=budget,
+        )
+
+    # Identical requests to the same model are served from the shared response cache
+    router = get_router()
+    template = prompts['system'] + '\n' + user
+    return router.complete(call_api, parse_cards, router.choose(text), template, lang, 0.3, text,
+                           use_cache=use_cache)
+
+# Send all sections to the API concurrently and merge the results in document order
+def generate_flashcards_concurrently(sections, max_workers=None, timeout=None, progress_callback=None,
+                                     use_cache=True, cancel_event=None, budget=None):
+    """
+    sections: list or any iterable of text sections (e.g. a lazy iter_token_chunks stream);
+              sections are pulled only as request slots free up
+    max_workers: concurrency limit (default: MAX_CONCURRENT_REQUESTS)
+    timeout: per-request timeout in seconds (default: REQUEST_TIMEOUT)
+    progress_callback: optional callable(index, cards, done, total) invoked as each section finishes;
+                       for lazy streams, total is the number of sections read so far
+    use_cache: set to False to bypass the response cache
+    cancel_event: optional threading.Event; when set, sections not yet started are skipped
+    budget: optional TokenBudget; once a request would exceed it, the remaining sections are skipped
+    """
+    if isinstance(sections, (list, tuple)):
+        if not sections:
+            return []
+        max_workers = min(max_workers or MAX_CONCURRENT_REQUESTS, len(sections))
+    max_workers = max(1, max_workers or MAX_CONCURRENT_REQUESTS)
+    timeout = timeout or REQUEST_TIMEOUT
+
+    section_iter = iter(sections)
+    section_results = []
+    in_flight = {}
+    done = 0
+    exhausted = False
+    budget_exhausted = False
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            # Keep at most 2 * max_workers sections buffered ahead of the API
+            while not exhausted and len(in_flight) < 2 * max_workers:
+                text = next(section_iter, None)
+                if text is None:
+                    exhausted = True
                     break
-                
-                if ';' in line:
-                    parts = line.split(';', 1)
-                    question = parts[0].strip()
-                    answer = parts[1].strip()
-                    if question and answer:
-                        flashcards_list.append({"question": question, "answer": answer})
-
-        except APIConnectionError as exc:
-            print(f"Connection error while calling the API: {exc}")
-            continue
-        except IndexError:
-            print(f"Could not parse line: {line}")
-            continue
+                in_flight[executor.submit(generate_section_flashcards, text, timeout, use_cache, budget)] = len(section_results)
+                section_results.append([])
+            if not in_flight:
+                break
 
-    # 将卡片列表保存为JSON文件
-    safe_name = sanitize_filename(pdf_filename)
-    output_filename = f"{safe_name}_flashcards.json"
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                i = in_flight.pop(future)
+                if future.cancelled():
+                    continue
+                try:
+                    section_results[i] = future.result()
+                except BudgetExceededError as exc:
+                    if not budget_exhausted:
+                        print(f"Stopping generation at section {i + 1}: {exc}")
+                    budget_exhausted = True
+                except APIConnectionError as exc:
+                    print(f"Connection error while calling the API (section {i + 1}): {exc}")
+                except Exception as exc:
+                    print(f"API call failed (section {i + 1}): {exc}")
+                done += 1
+                if progress_callback:
+                    progress_callback(i, section_results[i], done, len(section_results))
+
+            if budget_exhausted or (cancel_event is not None and cancel_event.is_set()):
+                exhausted = True
+                for pending in in_flight:
+                    pending.cancel()
+
+    flashcards_list = []
+    for cards in section_results:
+        flashcards_list.extend(cards)
+    # Check if max flashcards limit reached
+    if MAX_FLASHCARDS > 0:
+        flashcards_list = flashcards_list[:MAX_FLASHCARDS]
+    return flashcards_list
+
+# Save flashcards as <sanitized name>_flashcards.json in output_dir and return the path
+def save_flashcards(flashcards_list, filename, output_dir=None):
+    output_filename = f"{sanitize_filename(os.path.basename(filename))}_flashcards.json"
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        output_filename = os.path.join(output_dir, output_filename)
     with open(output_filename, "w", encoding='utf-8') as f:
         json.dump(flashcards_list, f, ensure_ascii=False, indent=4)
-    
+    return output_filename
+
+# Create Anki cards and save as JSON
+# pdf_text may be a string or a stream of DocumentChunk (see document_readers.iter_document),
+# in which case generation starts while later pages are still being read.
+# Text is split on paragraph/sentence boundaries into chunks of about chunk_tokens tokens.
+# Duplicate and near-duplicate cards (e.g. from overlapping chunks) are merged unless dedupe=False.
+# API usage is charged against a DOCUMENT_TOKEN_BUDGET budget (unless one is passed in) and reported at the end.
+def create_anki_cards(pdf_text, pdf_filename="document", max_workers=None, timeout=None, use_cache=True,
+                      chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, dedupe=DEDUPE_ENABLED,
+                      budget=None):
+    chunks = [pdf_text] if isinstance(pdf_text, str) else pdf_text
+    sections = iter_token_chunks(chunks, chunk_tokens, overlap_tokens)
+    budget = budget or TokenBudget(DOCUMENT_TOKEN_BUDGET, 'document')
+    print(f"Generating flashcards in chunks of up to {chunk_tokens} tokens...")
+    flashcards_list = generate_flashcards_concurrently(sections, max_workers, timeout,
+                                                      use_cache=use_cache, budget=budget)
+    print(budget.summary())
+    if dedupe:
+        flashcards_list, duplicate_groups = dedupe_flashcards(flashcards_list)
+        if duplicate_groups:
+            print(f"Merged {len(duplicate_groups)} groups of duplicate flashcards")
+
+    # 将卡片列表保存为JSON文件
+    output_filename = save_flashcards(flashcards_list, pdf_filename)
     print(f"Flashcards have been saved to {output_filename}")
     if MAX_FLASHCARDS > 0:
         print(f"Generated {len(flashcards_list)} flashcards (limit: {MAX_FLASHCARDS})")
@@ -256,10 +256,213 @@ def create_anki_cards(pdf_text, pdf_filename="document"):
     # 直接在控制台输出JSON内容
     print("\n--- Generated JSON Output ---")
     print(json.dumps(flashcards_list, ensure_ascii=False, indent=4))
+    return flashcards_list
+
+
+
+# ---------------------------------------------------------------------------
+# Batch directory ingestion
+# Extraction (CPU-bound) runs in a process pool, generation (I/O-bound) in a thread pool;
+# a bounded queue between the stages keeps at most BATCH_QUEUE_SIZE extracted documents in memory.
+# Completed documents are appended to a JSONL manifest so an interrupted run can be resumed.
+# ---------------------------------------------------------------------------
+
+def find_documents(input_dir):
+    """Walk input_dir and return the supported documents in sorted order"""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(input_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                found.append(os.path.join(dirpath, filename))
+    return found
+
+def file_signature(file_path):
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def load_manifest(manifest_path):
+    """Return {relative path: manifest entry} for the documents already completed"""
+    completed = {}
+    if not os.path.exists(manifest_path):
+        return completed
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a truncated last line
+                continue
+            completed[entry['path']] = entry
+    return completed
+
+def is_completed(entry, file_path):
+    if entry is None:
+        return False
+    size, mtime_ns = file_signature(file_path)
+    return entry.get('size') == size and entry.get('mtime_ns') == mtime_ns
+
+# Runs in a worker process (or a parent thread for .ppt): each document is extracted serially,
+# the pool parallelises across documents
+def extract_document_text(file_path):
+    file_hash = hash_file(file_path)
+    text = "".join(chunk.text for chunk in iter_document_cached(file_path, file_hash, max_workers=1))
+    return text, file_hash
+
+def run_batch(input_dir, output_dir=None, manifest_path=None, extract_workers=None, generate_workers=None,
+              queue_size=None, use_cache=True, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+              dedupe=DEDUPE_ENABLED):
+    """
+    Generate flashcards for every supported document under input_dir.
+    One JSON file is written per document, mirroring the directory layout under output_dir.
+    Returns a summary dict with document/card counts and throughput.
+    """
+    input_dir = os.path.abspath(input_dir)
+    output_dir = os.path.abspath(output_dir or os.path.join(input_dir, 'flashcards'))
+    manifest_path = manifest_path or os.path.join(output_dir, BATCH_MANIFEST_NAME)
+    extract_workers = max(1, extract_workers or BATCH_EXTRACT_WORKERS)
+    generate_workers = max(1, generate_workers or BATCH_GENERATE_WORKERS)
+    queue_size = max(1, queue_size or BATCH_QUEUE_SIZE)
+    # Split the request budget between documents so total concurrency stays at MAX_CONCURRENT_REQUESTS
+    requests_per_document = max(1, MAX_CONCURRENT_REQUESTS // generate_workers)
+
+    completed = load_manifest(manifest_path)
+    documents = []
+    skipped = 0
+    for file_path in find_documents(input_dir):
+        if file_path.startswith(output_dir + os.sep):
+            continue
+        if is_completed(completed.get(os.path.relpath(file_path, input_dir)), file_path):
+            skipped += 1
+        else:
+            documents.append(file_path)
+    print(f"Batch: {len(documents)} documents to process, {skipped} already completed")
+
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    text_queue = queue.Queue(maxsize=queue_size)
+    manifest_lock = threading.Lock()
+    stats = {'documents': 0, 'cards': 0, 'failed': 0}
+    # Every document has its own budget; all of them also draw from the budget for the whole run
+    run_budget = TokenBudget(SESSION_TOKEN_BUDGET, 'batch')
+    start_time = time.perf_counter()
+
+    def extract_stage():
+        # Keep at most extract_workers documents in flight; put() blocks while the queue is full.
+        # .ppt files are extracted on threads in this process so they share its warm LibreOffice pool
+        # (worker processes do not use the pool, see libreoffice_pool.get_office_pool)
+        pending = {}
+        paths = iter(documents)
+        office_pool = get_office_pool()
+        try:
+            with ProcessPoolExecutor(max_workers=extract_workers) as executor, \
+                    ThreadPoolExecutor(max_workers=office_pool.size if office_pool else 1) as ppt_executor:
+                while True:
+                    while len(pending) < extract_workers:
+                        file_path = next(paths, None)
+                        if file_path is None:
+                            break
+                        use_pool = office_pool is not None and file_path.lower().endswith('.ppt')
+                        submit = ppt_executor.submit if use_pool else executor.submit
+                        pending[submit(extract_document_text, file_path)] = file_path
+                    if not pending:
+                        break
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        file_path = pending.pop(future)
+                        try:
+                            text, file_hash = future.result()
+                        except Exception as exc:
+                            print(f"Extraction failed: {file_path}: {exc}")
+                            with manifest_lock:
+                                stats['failed'] += 1
+                            continue
+                        text_queue.put((file_path, text, file_hash))
+        finally:
+            for _ in range(generate_workers):
+                text_queue.put(None)
+
+    def generate_stage():
+        while True:
+            item = text_queue.get()
+            if item is None:
+                return
+            file_path, text, file_hash = item
+            relative_path = os.path.relpath(file_path, input_dir)
+            try:
+                if not text.strip():
+                    raise ValueError("no text extracted")
+                sections = iter_token_chunks([text], chunk_tokens, overlap_tokens)
+                budget = TokenBudget(DOCUMENT_TOKEN_BUDGET, relative_path, parent=run_budget)
+                cards = generate_flashcards_concurrently(sections, requests_per_document, use_cache=use_cache,
+                                                         budget=budget)
+                if budget.exceeded:
+                    # Not recorded in the manifest, so a later run with a larger budget picks it up again
+                    # (sections that did complete are served from the response cache)
+                    raise RuntimeError("token budget exhausted before the document was finished")
+                if dedupe:
+                    cards, _ = dedupe_flashcards(cards)
+                # Keep the extension in the output name so notes.pdf and notes.pptx do not collide
+                name, ext = os.path.splitext(os.path.basename(file_path))
+                output_file = save_flashcards(cards, f"{name}_{ext[1:].lower()}{ext}",
+                                              os.path.join(output_dir, os.path.dirname(relative_path)))
+            except Exception as exc:
+                print(f"Generation failed: {relative_path}: {exc}")
+                with manifest_lock:
+                    stats['failed'] += 1
+                continue
+
+            size, mtime_ns = file_signature(file_path)
+            entry = {'path': relative_path, 'size': size, 'mtime_ns': mtime_ns, 'sha256': file_hash,
+                     'output': os.path.relpath(output_file, output_dir), 'cards': len(cards),
+                     'tokens': budget.report(), 'completed_at': time.time()}
+            with manifest_lock:
+                with open(manifest_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                stats['documents'] += 1
+                stats['cards'] += len(cards)
+                print(f"[{stats['documents']}/{len(documents)}] {relative_path}: {len(cards)} cards")
+
+    extractor = threading.Thread(target=extract_stage, daemon=True)
+    extractor.start()
+    with ThreadPoolExecutor(max_workers=generate_workers) as executor:
+        for future in [executor.submit(generate_stage) for _ in range(generate_workers)]:
+            future.result()
+    extractor.join()
+
+    elapsed = time.perf_counter() - start_time
+    minutes = elapsed / 60 if elapsed > 0 else 0
+    summary = dict(stats, skipped=skipped, seconds=round(elapsed, 2), tokens=run_budget.report(),
+                   docs_per_min=round(stats['documents'] / minutes, 2) if minutes else 0.0,
+                   cards_per_min=round(stats['cards'] / minutes, 2) if minutes else 0.0)
+    print(f"Batch finished in {summary['seconds']}s: {stats['documents']} documents, {stats['cards']} cards, "
+          f"{stats['failed']} failed, {skipped} skipped")
+    print(f"Throughput: {summary['docs_per_min']} docs/min, {summary['cards_per_min']} cards/min")
+    print(run_budget.summary())
+    return summary
 
 
 # Main script execution
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate Anki flashcards from documents')
+    parser.add_argument('--batch', metavar='DIR', help='process every PDF/PPTX/PPT/TXT file under DIR')
+    parser.add_argument('--output-dir', help='batch output directory (default: DIR/flashcards)')
+    parser.add_argument('--manifest', help=f'batch manifest path (default: <output-dir>/{BATCH_MANIFEST_NAME})')
+    parser.add_argument('--extract-workers', type=int, help='extraction processes in batch mode')
+    parser.add_argument('--generate-workers', type=int, help='documents generated concurrently in batch mode')
+    parser.add_argument('--queue-size', type=int, help='extracted documents buffered ahead of generation')
+    parser.add_argument('--no-cache', action='store_true', help='bypass the LLM response cache')
+    parser.add_argument('--no-dedupe', action='store_true', help='keep duplicate flashcards')
+    args = parser.parse_args()
+    dedupe = DEDUPE_ENABLED and not args.no_dedupe
+
+    if not is_configured():
+        raise SystemExit("Set ARK_API_KEY before running this script.")
+
+    if args.batch:
+        run_batch(args.batch, args.output_dir, args.manifest, args.extract_workers, args.generate_workers,
+                  args.queue_size, use_cache=not args.no_cache, dedupe=dedupe)
+        raise SystemExit(0)
+
     # 确保SOURCE_DOCUMENTS文件夹存在
     source_docs_path = os.path.join(ROOT_DIRECTORY, 'SOURCE_DOCUMENTS')
     os.makedirs(source_docs_path, exist_ok=True)
@@ -273,19 +476,13 @@ if __name__ == "__main__":
         file_path = os.path.join(source_docs_path, filename)
         print(f"Reading file: {filename}")
         
-        if filename.lower().endswith('.pdf'):
-            text_content = read_pdf(file_path)
-        elif filename.lower().endswith('.pptx'):
-            if not PPTX_AVAILABLE:
-                print("Error: python-pptx not installed. Install with: pip install python-pptx")
-                exit(1)
-            text_content = read_pptx(file_path)
-        elif filename.lower().endswith('.ppt'):
-            text_content = read_ppt(file_path)
+        if filename.lower().endswith('.pptx') and not PPTX_AVAILABLE:
+            print("Error: python-pptx not installed. Install with: pip install python-pptx")
+            exit(1)
         
-        create_anki_cards(text_content, filename)
+        create_anki_cards(iter_document_cached(file_path), filename, use_cache=not args.no_cache, dedupe=dedupe)
     else:
         print("Error: No PDF, PPTX, or PPT files found in SOURCE_DOCUMENTS folder.")
         print("Please add a supported file to the SOURCE_DOCUMENTS folder.")
         text_content = "What is the capital of France?;Paris\nWhat is 2+2?;4"
-        create_anki_cards(text_content)
\ No newline at end of file
+        create_anki_cards(text_content, use_cache=not args.no_cache, dedupe=dedupe)
@@ -16,68 +16,121 @@ JSON 文件格式要求:
 """
 
 import os
-from openai import OpenAI, APIConnectionError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import APIConnectionError
 from dotenv import load_dotenv
 import json
-import csv
 import argparse
+import itertools
+import time
+from llm_cache import get_cache, make_key
+from llm_client import chat_completion, is_configured
+from dedupe import dedupe_flashcards, DEDUPE_THRESHOLD
+from apkg_export import write_apkg, DEFAULT_DECK_NAME
+from exporters import write_exports, TEXT_FORMATS
+from json_stream import iter_flashcards, detect_format, ValidationReport, JsonStreamError
+from chunking import chunk_text
+from metrics import LLM_UNPARSED_RETRIES
+from model_router import get_router, TIER_LARGE, LLM_PARSE_RETRIES
+from structured_output import (
+    structured_completion, json_mode_enabled, user_template, parse_cards, parse_indexed_cards, CardLineParser,
+)
+from token_budget import (
+    TokenBudget, BudgetExceededError, generation_max_tokens, rewrite_max_tokens, plan_generation,
+    DOCUMENT_TOKEN_BUDGET
+)
 
 # Language setting: 'en' for English, 'zh' for Chinese
 LANGUAGE = 'zh'  # 可选: 'en' 或 'zh'
 
 ROOT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
 load_dotenv()
-ARK_BASE_URL = "https://ark.cn-beijing.volces.com/api/v3"
+# 模型在 model_router 中配置（LLM_MODEL / LLM_FAST_MODEL）：增强与短段落优先使用 fast 模型
 
+# 批量增强：每个请求打包的闪卡数量与并发请求数
+ENHANCE_BATCH_SIZE = int(os.environ.get("ENHANCE_BATCH_SIZE", "10"))
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("ARK_MAX_CONCURRENCY", "8"))
 
-def get_openai_client():
-    """获取 OpenAI API 客户端"""
-    api_key = os.environ.get("ARK_API_KEY")
-    if not api_key:
-        print("警告: 未设置 ARK_API_KEY，API 增强功能不可用")
-        return None
-    return OpenAI(api_key=api_key, base_url=ARK_BASE_URL)
+# 无法解析为闪卡的文件交给 API 生成时，最多读取的字符数
+RAW_TEXT_MAX_CHARS = int(os.environ.get("JSON_RAW_TEXT_MAX_CHARS", "2000000"))
+
+# 生成与增强使用的提示模板
+GENERATE_PROMPTS = {
+    'zh': {
+        'system': "你是一个有帮助的助手。",
+        'user': "根据提供的文本创建Anki闪卡，使用以下格式：问题;答案 换行 问题;答案 等。确保问题和对应的答案在同一行。不要添加任何介绍文本。文本：{text}",
+        # JSON 模式下使用（不含行格式要求，由 structured_output 追加 JSON 输出格式）
+        'json_user': "根据提供的文本创建Anki闪卡，每张闪卡包含一个问题和对应的答案。不要添加任何介绍文本。文本：{text}"
+    },
+    'en': {
+        'system': "You are a helpful assistant.",
+        'user': "Create anki flashcards with the provided text using a format: question;answer newline question;answer etc. Keep question and the corresponding answer on the same line. Do not add any introductory text. Text: {text}",
+        'json_user': "Create anki flashcards with the provided text. Each flashcard has a question and its answer. Do not add any introductory text. Text: {text}"
+    }
+}
+
+ENHANCE_PROMPTS = {
+    'zh': {
+        'system': "你是一个有帮助的助手。",
+        'user': "请优化以下闪卡的问题和答案，使其更清晰易懂。保持原意不变。\n问题: {question}\n答案: {answer}\n\n请用格式返回：问题;答案",
+        'json_user': "请优化以下闪卡的问题和答案，使其更清晰易懂。保持原意不变。\n问题: {question}\n答案: {answer}"
+    },
+    'en': {
+        'system': "You are a helpful assistant.",
+        'user': "Please optimize the following flashcard to make it clearer. Keep the original meaning.\nQuestion: {question}\nAnswer: {answer}\n\nReturn in format: question;answer",
+        'json_user': "Please optimize the following flashcard to make it clearer. Keep the original meaning.\nQuestion: {question}\nAnswer: {answer}"
+    }
+}
+
+BATCH_ENHANCE_PROMPTS = {
+    'zh': {
+        'system': "你是一个有帮助的助手。",
+        'user': "请优化以下每张闪卡的问题和答案，使其更清晰易懂。保持原意不变。每张闪卡前有编号。\n请每张闪卡输出一行，保留原编号，格式：编号. 问题;答案。不要添加任何其他文本。\n\n{cards}",
+        'json_user': "请优化以下每张闪卡的问题和答案，使其更清晰易懂。保持原意不变。每张闪卡前有编号，输出时保留原编号。\n\n{cards}"
+    },
+    'en': {
+        'system': "You are a helpful assistant.",
+        'user': "Please optimize each of the following flashcards to make them clearer. Keep the original meaning. Each flashcard is numbered.\nReturn one line per flashcard, keeping its number, in format: number. question;answer. Do not add any other text.\n\n{cards}",
+        'json_user': "Please optimize each of the following flashcards to make them clearer. Keep the original meaning. Each flashcard is numbered; keep its number in the output.\n\n{cards}"
+    }
+}
 
 
-# API 客户端（可选）
-client = None
-try:
-    client = get_openai_client()
-except Exception as e:
-    print(f"警告: API 客户端初始化失败 - {e}")
+def read_raw_text(json_path):
+    """读取无法解析为闪卡的文件内容，超过 RAW_TEXT_MAX_CHARS 的部分被截断"""
+    with open(json_path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        content = f.read(RAW_TEXT_MAX_CHARS + 1)
+    if len(content) > RAW_TEXT_MAX_CHARS:
+        print(f"警告: 文件内容超过 {RAW_TEXT_MAX_CHARS} 个字符，只处理前 {RAW_TEXT_MAX_CHARS} 个字符")
+        content = content[:RAW_TEXT_MAX_CHARS]
+    return content
 
 
 def load_flashcards_from_json(json_path):
-    """从 JSON 文件加载闪卡数据，如果解析失败则返回原始文本"""
+    """
+    从 JSON 数组或 JSON Lines 文件流式加载闪卡，格式不正确的卡片跳过并汇总提示
+    文件无法解析出任何闪卡时返回原始文本（交给 API 生成闪卡）
+    """
+    report = ValidationReport()
+    valid_cards = []
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # 尝试解析 JSON
         try:
-            flashcards = json.loads(content)
-            
-            if not isinstance(flashcards, list):
-                print(f"警告: JSON 格式不是数组，将使用 API 处理原始内容")
-                return {"type": "raw_text", "content": content}
-            
-            valid_cards = []
-            for i, card in enumerate(flashcards):
-                if isinstance(card, dict) and 'question' in card and 'answer' in card:
-                    valid_cards.append(card)
-                else:
-                    print(f"警告: 第 {i+1} 张卡片格式不正确，已跳过")
-            
-            if valid_cards:
-                print(f"成功加载 {len(valid_cards)} 张闪卡")
-                return {"type": "flashcards", "content": valid_cards}
-            else:
-                print(f"警告: 未找到有效闪卡，将使用 API 处理原始内容")
-                return {"type": "raw_text", "content": content}
+            for card in iter_flashcards(json_path, report):
+                valid_cards.append(card)
+        except JsonStreamError as e:
+            if not valid_cards:
+                print(f"警告: JSON 解析失败 ({e})，将使用 API 处理原始内容")
+                return {"type": "raw_text", "content": read_raw_text(json_path)}
+            print(f"警告: JSON 在第 {len(valid_cards)} 张有效卡片之后损坏 ({e})，只保留已读取的卡片")
         
-        except json.JSONDecodeError as e:
-            print(f"警告: JSON 解析失败 ({e})，将使用 API 处理原始内容")
-            return {"type": "raw_text", "content": content}
+        if valid_cards:
+            summary = report.summary()
+            if summary:
+                print(summary)
+            print(f"成功加载 {len(valid_cards)} 张闪卡")
+            return {"type": "flashcards", "content": valid_cards}
+        print(f"警告: 未找到有效闪卡，将使用 API 处理原始内容")
+        return {"type": "raw_text", "content": read_raw_text(json_path)}
     
     except FileNotFoundError:
         print(f"错误: 找不到文件 {json_path}")
@@ -87,108 +140,298 @@ def load_flashcards_from_json(json_path):
         return None
 
 
-def generate_flashcards_from_text(text):
-    """使用 API 从原始文本生成闪卡"""
-    if not client:
-        print("错误: API 不可用，无法处理原始文本")
+def generate_flashcards_from_text(text, use_cache=True, budget=None):
+    """
+    使用 API 从原始文本生成闪卡（use_cache=False 时绕过响应缓存）
+    文本按 token 预算切分后并发请求，结果按原文顺序合并
+    budget: 可选 TokenBudget（默认按 DOCUMENT_TOKEN_BUDGET 新建），超出后剩余的段落不再请求
+    """
+    if not is_configured():
+        print("错误: 未设置 ARK_API_KEY，无法处理原始文本")
         return None
     
-    prompts = {
-        'zh': {
-            'system': "你是一个有帮助的助手。",
-            'user': f"根据提供的文本创建Anki闪卡，使用以下格式：问题;答案 换行 问题;答案 等。确保问题和对应的答案在同一行。不要添加任何介绍文本。文本：{text}"
-        },
-        'en': {
-            'system': "You are a helpful assistant.",
-            'user': f"Create anki flashcards with the provided text using a format: question;answer newline question;answer etc. Keep question and the corresponding answer on the same line. Do not add any introductory text. Text: {text}"
-        }
-    }
+    lang = LANGUAGE if LANGUAGE in GENERATE_PROMPTS else 'en'
+    prompt = GENERATE_PROMPTS[lang]
+    json_mode = json_mode_enabled()
+    user = user_template(prompt, lang)
+    template = prompt['system'] + '\n' + user
     
-    lang = LANGUAGE if LANGUAGE in prompts else 'en'
-    prompt = prompts[lang]
+    def generate_chunk(chunk):
+        def call_api(model):
+            return structured_completion(
+                chat_completion,
+                [
+                    {"role": "system", "content": prompt['system']},
+                    {"role": "user", "content": user.format(text=chunk)}
+                ],
+                json_mode,
+                model=model,
+                temperature=0.3,
+                max_tokens=generation_max_tokens(chunk),
+                budget=budget,
+            )
+        
+        # 解析不出闪卡的段落由路由器单独重试，不影响其他段落
+        router = get_router()
+        try:
+            return router.complete(call_api, parse_cards, router.choose(chunk), template, lang, 0.3, chunk,
+                                   use_cache=use_cache)
+        except BudgetExceededError:
+            return None
+        except APIConnectionError as e:
+            print(f"API 连接错误: {e}")
+            return None
+        except Exception as e:
+            print(f"API 调用失败: {e}")
+            return None
     
-    flashcards_list = []
+    chunks = chunk_text(text)
+    if not chunks:
+        return []
+    budget = budget or TokenBudget(DOCUMENT_TOKEN_BUDGET, 'document')
+    requests, projected = plan_generation(chunks)
+    print(f"正在使用 API 从原始文本生成闪卡（{len(chunks)} 段，预计最多 {projected} token）...")
+    remaining = budget.remaining()
+    if remaining is not None and projected > remaining:
+        print(f"警告: 预计用量超出剩余 token 预算 ({remaining})，超出预算的段落将被跳过")
+    with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_REQUESTS, len(chunks))) as executor:
+        results = list(executor.map(generate_chunk, chunks))
+    print(budget.summary())
+    if all(cards is None for cards in results):
+        return None
+    if budget.exceeded:
+        print(f"警告: token 预算不足，{sum(cards is None for cards in results)} 段未生成闪卡")
     
-    try:
-        print("正在使用 API 从原始文本生成闪卡...")
-        response = client.chat.completions.create(
-            model="doubao-seed-1-6-251015",
-            messages=[
-                {"role": "system", "content": prompt['system']},
-                {"role": "user", "content": prompt['user']}
-            ],
-            temperature=0.3,
-            max_tokens=2048,
-        )
-        result = response.choices[0].message.content.strip()
+    flashcards_list = [card for cards in results if cards for card in cards]
+    print(f"API 生成完成，共 {len(flashcards_list)} 张闪卡")
+    return flashcards_list
+
+
+def stream_flashcards_from_text(text, use_cache=True, budget=None):
+    """
+    流式生成闪卡：文本按 token 预算切分后逐段使用 stream=True 调用 API，每收到完整的一张闪卡就立即产出
+    （流式请求使用行格式，不启用 JSON 模式，否则要等整个 JSON 对象结束才能解析）
+    命中缓存的段落直接逐张产出缓存内容；API 不可用时抛出 RuntimeError，超出 budget 时抛出 BudgetExceededError
+    """
+    if not is_configured():
+        raise RuntimeError("API 不可用，无法处理原始文本")
+    
+    lang = LANGUAGE if LANGUAGE in GENERATE_PROMPTS else 'en'
+    prompt = GENERATE_PROMPTS[lang]
+    cache = get_cache()
+    use_cache = use_cache and cache.enabled
+    for chunk in chunk_text(text):
+        yield from stream_chunk_flashcards(chunk, prompt, lang, cache, use_cache, budget)
+
+
+def stream_chunk_flashcards(chunk, prompt, lang, cache, use_cache, budget):
+    """
+    逐张产出一个段落的闪卡；fast 模型没有产出任何闪卡（或请求失败）时改用 large 模型重新生成，
+    large 模型也没有产出时再重试 LLM_PARSE_RETRIES 次（只缓存产出了闪卡的响应）
+    """
+    router = get_router()
+    template = prompt['system'] + '\n' + prompt['user']
+    tier = router.choose(chunk)
+    retries = LLM_PARSE_RETRIES
+    while True:
+        key = make_key(router.model(tier), template, lang, 0.3, chunk)
+        cached = cache.get(key) if use_cache else None
+        if cached is not None:
+            cards = parse_cards(cached)
+            if cards:
+                yield from cards
+                return
         
-        # 解析 API 返回的字符串
-        lines = result.split('\n')
-        for line in lines:
-            if ';' in line:
-                parts = line.split(';', 1)
-                question = parts[0].strip()
-                answer = parts[1].strip()
-                if question and answer:
-                    flashcards_list.append({"question": question, "answer": answer})
+        received = []
+        count = 0
+        # 耗时包含调用方处理已产出卡片的时间（如推送 SSE），与非流式请求相比略偏大
+        start = time.perf_counter()
+        try:
+            stream = chat_completion(
+                model=router.model(tier),
+                messages=[
+                    {"role": "system", "content": prompt['system']},
+                    {"role": "user", "content": prompt['user'].format(text=chunk)}
+                ],
+                temperature=0.3,
+                max_tokens=generation_max_tokens(chunk),
+                stream=True,
+                budget=budget,
+            )
+            for card in iter_streamed_flashcards(stream, received):
+                count += 1
+                yield card
+        except BudgetExceededError:
+            raise
+        except Exception:
+            router.record(tier, time.perf_counter() - start, False, error=True)
+            if count or tier == TIER_LARGE:
+                raise
+            tier = router.escalate(tier)
+            continue
+        router.record(tier, time.perf_counter() - start, count > 0)
         
-        print(f"API 生成完成，共 {len(flashcards_list)} 张闪卡")
-        return flashcards_list
-    
-    except APIConnectionError as e:
-        print(f"API 连接错误: {e}")
-        return None
-    except Exception as e:
-        print(f"API 调用失败: {e}")
-        return None
+        result = ''.join(received).strip()
+        if use_cache and count:
+            cache.set(key, result)
+        if count:
+            return
+        if tier != TIER_LARGE:
+            tier = router.escalate(tier)
+        elif retries > 0:
+            retries -= 1
+            LLM_UNPARSED_RETRIES.inc(tier=tier)
+        else:
+            return
+
 
+def iter_streamed_flashcards(stream, received):
+    """从流式响应中逐张产出闪卡，收到的文本片段追加到 received"""
+    # 解析器只处理已经结束的行，并且一张卡片要等下一张开始才产出（后面可能还有答案的续行）
+    parser = CardLineParser()
+    for part in stream:
+        if not part.choices:
+            continue
+        delta = part.choices[0].delta.content or ''
+        received.append(delta)
+        yield from parser.feed(delta)
+    yield from parser.close()
 
-def enhance_flashcard_with_api(card):
-    """使用 API 增强闪卡内容（可选功能）"""
-    if not client:
+
+def enhance_flashcard_with_api(card, use_cache=True, budget=None):
+    """使用 API 增强闪卡内容（可选功能）；失败或超出 budget 时返回原卡片"""
+    if not is_configured():
         return card
     
-    prompts = {
-        'zh': {
-            'system': "你是一个有帮助的助手。",
-            'user': f"请优化以下闪卡的问题和答案，使其更清晰易懂。保持原意不变。\n问题: {card['question']}\n答案: {card['answer']}\n\n请用格式返回：问题;答案"
-        },
-        'en': {
-            'system': "You are a helpful assistant.",
-            'user': f"Please optimize the following flashcard to make it clearer. Keep the original meaning.\nQuestion: {card['question']}\nAnswer: {card['answer']}\n\nReturn in format: question;answer"
-        }
-    }
+    lang = LANGUAGE if LANGUAGE in ENHANCE_PROMPTS else 'en'
+    prompt = ENHANCE_PROMPTS[lang]
     
-    lang = LANGUAGE if LANGUAGE in prompts else 'en'
-    prompt = prompts[lang]
+    json_mode = json_mode_enabled()
+    user = user_template(prompt, lang)
+    content = user.format(question=card['question'], answer=card['answer'])
     
-    try:
-        response = client.chat.completions.create(
-            model="doubao-seed-1-6-251015",
-            messages=[
+    def call_api(model):
+        return structured_completion(
+            chat_completion,
+            [
                 {"role": "system", "content": prompt['system']},
-                {"role": "user", "content": prompt['user']}
+                {"role": "user", "content": content}
             ],
+            json_mode,
+            model=model,
             temperature=0.3,
-            max_tokens=512,
+            max_tokens=rewrite_max_tokens(card['question'] + card['answer']),
+            budget=budget,
         )
-        result = response.choices[0].message.content.strip()
-        
-        if ';' in result:
-            parts = result.split(';', 1)
-            return {"question": parts[0].strip(), "answer": parts[1].strip()}
+    
+    def parse(result):
+        cards = parse_cards(result)
+        return cards[0] if cards else None
+    
+    try:
+        router = get_router()
+        template = prompt['system'] + '\n' + user
+        card_text = json.dumps([card['question'], card['answer']], ensure_ascii=False)
+        enhanced = router.complete(call_api, parse, router.choose(), template, lang, 0.3, card_text,
+                                   use_cache=use_cache)
+        if enhanced:
+            return enhanced
+    except BudgetExceededError:
+        pass
     except Exception as e:
         print(f"API 增强失败: {e}")
     
     return card
 
 
+def enhance_batch_with_api(cards, use_cache=True, budget=None):
+    """把多张闪卡打包进一个请求增强，返回与输入等长的列表，未能匹配的位置为 None"""
+    lang = LANGUAGE if LANGUAGE in BATCH_ENHANCE_PROMPTS else 'en'
+    prompt = BATCH_ENHANCE_PROMPTS[lang]
+    cards_text = '\n'.join(
+        f"{i + 1}. {card['question'].replace(chr(10), ' ')};{card['answer'].replace(chr(10), ' ')}"
+        for i, card in enumerate(cards)
+    )
+    
+    json_mode = json_mode_enabled()
+    user = user_template(prompt, lang, indexed=True)
+    
+    def call_api(model):
+        return structured_completion(
+            chat_completion,
+            [
+                {"role": "system", "content": prompt['system']},
+                {"role": "user", "content": user.format(cards=cards_text)}
+            ],
+            json_mode,
+            model=model,
+            temperature=0.3,
+            max_tokens=rewrite_max_tokens(cards_text),
+            budget=budget,
+        )
+    
+    # 一张都匹配不上时改用 large 模型重试；部分匹配时由调用方逐张补齐
+    router = get_router()
+    template = prompt['system'] + '\n' + user
+    matched = router.complete(call_api, lambda result: parse_indexed_cards(result, len(cards)), router.choose(),
+                              template, lang, 0.3, cards_text, use_cache=use_cache)
+    return [matched.get(i) for i in range(len(cards))]
+
+
+def enhance_flashcards_batch(flashcards, batch_size=None, max_workers=None, progress_callback=None,
+                             use_cache=True, cancel_event=None, budget=None):
+    """
+    批量并发增强闪卡，返回与输入顺序一致的新列表
+    batch_size: 每个请求包含的闪卡数 (默认: ENHANCE_BATCH_SIZE)
+    max_workers: 并发请求数 (默认: MAX_CONCURRENT_REQUESTS)
+    progress_callback: 可选，callable(start, cards, done, total)，每个批次完成时调用，
+                       start 为该批次第一张卡片的序号，done/total 按卡片计数
+    cancel_event: 可选 threading.Event，置位后尚未开始的批次将被跳过（保留原卡片）
+    budget: 可选 TokenBudget，超出后剩余的批次保留原卡片
+    批次返回中无法匹配的卡片会退回到逐张增强
+    """
+    if not is_configured() or not flashcards:
+        return list(flashcards)
+    batch_size = max(1, batch_size or ENHANCE_BATCH_SIZE)
+    batches = [(start, flashcards[start:start + batch_size]) for start in range(0, len(flashcards), batch_size)]
+    max_workers = max(1, min(max_workers or MAX_CONCURRENT_REQUESTS, len(batches)))
+    
+    def enhance_one_batch(cards):
+        try:
+            enhanced = enhance_batch_with_api(cards, use_cache=use_cache, budget=budget)
+        except BudgetExceededError:
+            return list(cards)
+        except Exception as e:
+            print(f"批量增强失败，改为逐张处理: {e}")
+            enhanced = [None] * len(cards)
+        return [result if result else enhance_flashcard_with_api(card, use_cache=use_cache, budget=budget)
+                for card, result in zip(cards, enhanced)]
+    
+    enhanced_cards = list(flashcards)
+    done = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(enhance_one_batch, cards): start for start, cards in batches}
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            start = futures[future]
+            cards = future.result()
+            enhanced_cards[start:start + len(cards)] = cards
+            done += len(cards)
+            if progress_callback:
+                progress_callback(start, cards, done, len(flashcards))
+            if (cancel_event is not None and cancel_event.is_set()) or (budget is not None and budget.exceeded):
+                for pending in futures:
+                    pending.cancel()
+    if budget is not None and budget.exceeded:
+        print("警告: token 预算不足，部分闪卡未增强")
+    return enhanced_cards
+
+
 def export_to_json(flashcards, output_path):
     """导出为 JSON 格式"""
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(flashcards, f, ensure_ascii=False, indent=4)
-        
+        write_exports(flashcards, {'json': output_path})
         print(f"已导出 JSON 文件: {output_path}")
         return True
     except Exception as e:
@@ -199,12 +442,7 @@ def export_to_json(flashcards, output_path):
 def export_to_anki_txt(flashcards, output_path):
     """导出为 Anki 可导入的 TXT 格式 (分号分隔)"""
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            for card in flashcards:
-                question = card['question'].replace('\n', ' ').replace(';', '；')
-                answer = card['answer'].replace('\n', ' ').replace(';', '；')
-                f.write(f"{question};{answer}\n")
-        
+        write_exports(flashcards, {'txt': output_path})
         print(f"已导出 Anki TXT 文件: {output_path}")
         print(f"导入说明: 在 Anki 中选择 '文件' -> '导入'，分隔符设为 ';'")
         return True
@@ -216,12 +454,7 @@ def export_to_anki_txt(flashcards, output_path):
 def export_to_anki_tsv(flashcards, output_path):
     """导出为 Anki 可导入的 TSV 格式 (制表符分隔)"""
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            for card in flashcards:
-                question = card['question'].replace('\n', '<br>').replace('\t', ' ')
-                answer = card['answer'].replace('\n', '<br>').replace('\t', ' ')
-                f.write(f"{question}\t{answer}\n")
-        
+        write_exports(flashcards, {'tsv': output_path})
         print(f"已导出 Anki TSV 文件: {output_path}")
         return True
     except Exception as e:
@@ -232,14 +465,7 @@ def export_to_anki_tsv(flashcards, output_path):
 def export_to_csv(flashcards, output_path):
     """导出为 CSV 格式"""
     try:
-        with open(output_path, 'w', encoding='utf-8', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Front', 'Back'])
-            for card in flashcards:
-                question = card['question'].replace('\n', '<br>')
-                answer = card['answer'].replace('\n', '<br>')
-                writer.writerow([question, answer])
-        
+        write_exports(flashcards, {'csv': output_path})
         print(f"已导出 CSV 文件: {output_path}")
         return True
     except Exception as e:
@@ -247,6 +473,29 @@ def export_to_csv(flashcards, output_path):
         return False
 
 
+def export_to_all(flashcards, paths):
+    """paths: {格式: 输出路径}；一次遍历闪卡同时写出所有文本格式"""
+    try:
+        write_exports(flashcards, paths)
+        for output_path in paths.values():
+            print(f"已导出: {output_path}")
+        return True
+    except Exception as e:
+        print(f"错误: 导出失败 - {e}")
+        return False
+
+
+def export_to_apkg(flashcards, output_path, deck_name=None):
+    """导出为 Anki 牌组包 (.apkg)，可在 Anki 中直接打开导入，无需设置分隔符"""
+    try:
+        write_apkg(flashcards, output_path, deck_name or DEFAULT_DECK_NAME)
+        print(f"已导出 Anki 牌组包: {output_path}")
+        return True
+    except Exception as e:
+        print(f"错误: 导出 APKG 失败 - {e}")
+        return False
+
+
 def print_flashcards_preview(flashcards, max_display=5):
     """预览闪卡内容"""
     print("\n--- 闪卡预览 ---")
@@ -280,19 +529,27 @@ def main():
 示例:
   python Anki_flashcards_from_json.py flashcards.json
   python Anki_flashcards_from_json.py flashcards.json -f tsv
+  python Anki_flashcards_from_json.py flashcards.json -f apkg
   python Anki_flashcards_from_json.py flashcards.json --enhance
+  python Anki_flashcards_from_json.py flashcards.json --dedupe --enhance
   python Anki_flashcards_from_json.py --list
         """
     )
     
     parser.add_argument('json_file', nargs='?', help='JSON 闪卡文件路径')
-    parser.add_argument('-f', '--format', choices=['json', 'txt', 'tsv', 'csv', 'all'], 
+    parser.add_argument('-f', '--format', choices=['json', 'txt', 'tsv', 'csv', 'apkg', 'all'], 
                         default='json', help='输出格式 (默认: json)')
     parser.add_argument('-o', '--output', help='输出文件路径')
     parser.add_argument('--list', action='store_true', help='列出可用的 JSON 文件')
     parser.add_argument('--preview', action='store_true', help='预览闪卡内容')
     parser.add_argument('--no-export', action='store_true', help='只预览不导出')
     parser.add_argument('--enhance', action='store_true', help='使用 API 增强闪卡内容')
+    parser.add_argument('--batch-size', type=int, default=ENHANCE_BATCH_SIZE,
+                        help=f'增强时每个请求包含的闪卡数 (默认: {ENHANCE_BATCH_SIZE})')
+    parser.add_argument('--no-cache', action='store_true', help='绕过 API 响应缓存')
+    parser.add_argument('--dedupe', action='store_true', help='合并重复和近似重复的闪卡（在增强之前执行）')
+    parser.add_argument('--dedupe-threshold', type=float, default=DEDUPE_THRESHOLD,
+                        help=f'近似重复的相似度阈值 (默认: {DEDUPE_THRESHOLD})')
     
     args = parser.parse_args()
     
@@ -329,34 +586,54 @@ def main():
             print("错误: 请指定 JSON 文件路径")
             return
     
+    # 生成输出文件名
+    base_name = os.path.splitext(os.path.basename(args.json_file))[0]
+    if base_name.endswith('_flashcards'):
+        base_name = base_name[:-11]
+    
+    # 不需要对闪卡整体处理时，直接把文件中的闪卡流式写入导出文件，内存占用与文件大小无关；
+    # 流式导出失败（例如文件在读到一部分卡片后损坏）时改为整体加载，保留能解析出的卡片
+    if not (args.dedupe or args.enhance or args.preview or args.no_export):
+        if export_streaming(args.json_file, base_name, args.format, args.output):
+            return
+    
     # 加载闪卡
     result = load_flashcards_from_json(args.json_file)
     if not result:
         return
     
+    # 生成与增强共用一个文档级 token 预算
+    budget = TokenBudget(DOCUMENT_TOKEN_BUDGET, 'document')
+    
     # 根据加载结果处理
     if result["type"] == "flashcards":
         flashcards = result["content"]
     elif result["type"] == "raw_text":
-        flashcards = generate_flashcards_from_text(result["content"])
+        flashcards = generate_flashcards_from_text(result["content"], use_cache=not args.no_cache, budget=budget)
         if not flashcards:
             print("错误: 无法从原始文本生成闪卡")
             return
     else:
         return
     
+    # 去重（可选），放在增强之前以免为重复卡片消耗请求
+    if args.dedupe:
+        flashcards, duplicate_groups = dedupe_flashcards(flashcards, args.dedupe_threshold)
+        removed = sum(len(group) - 1 for group in duplicate_groups)
+        print(f"去重完成：移除 {removed} 张重复闪卡，剩余 {len(flashcards)} 张")
+    
     # 使用 API 增强（可选）
     if args.enhance:
-        if client:
+        if is_configured():
             print("正在使用 API 增强闪卡...")
-            enhanced_cards = []
-            for i, card in enumerate(flashcards):
-                print(f"  处理卡片 {i+1}/{len(flashcards)}...")
-                enhanced_cards.append(enhance_flashcard_with_api(card))
-            flashcards = enhanced_cards
+            flashcards = enhance_flashcards_batch(
+                flashcards, batch_size=args.batch_size, use_cache=not args.no_cache, budget=budget,
+                progress_callback=lambda start, cards, done, total: print(f"  已处理 {done}/{total} 张卡片...")
+            )
             print("API 增强完成")
+            print(budget.summary())
         else:
-            print("警告: API 不可用，跳过增强步骤")
+            print("警告: 未设置 ARK_API_KEY，跳过增强步骤")
     
     # 预览
     if args.preview or args.no_export:
@@ -365,31 +642,68 @@ def main():
     if args.no_export:
         return
     
-    # 生成输出文件名
-    base_name = os.path.splitext(os.path.basename(args.json_file))[0]
-    if base_name.endswith('_flashcards'):
-        base_name = base_name[:-11]
-    
-    # 导出
-    formats = ['json', 'txt', 'tsv', 'csv'] if args.format == 'all' else [args.format]
-    
-    for fmt in formats:
-        if args.output and len(formats) == 1:
-            output_path = args.output
+    export_flashcards(flashcards, base_name, args.format, args.output)
+    print(f"\n完成! 共处理 {len(flashcards)} 张闪卡")
+
+
+def export_flashcards(flashcards, base_name, fmt, output=None):
+    """按 -f/-o 参数导出闪卡（flashcards 可以是列表或可迭代对象），返回是否成功"""
+    formats = list(TEXT_FORMATS) if fmt == 'all' else [fmt]
+    paths = {}
+    for export_fmt in formats:
+        if output and len(formats) == 1:
+            paths[export_fmt] = output
         else:
-            output_path = os.path.join(ROOT_DIRECTORY, f"{base_name}_anki.{fmt}")
-        
-        if fmt == 'json':
-            export_to_json(flashcards, output_path)
-        elif fmt == 'txt':
-            export_to_anki_txt(flashcards, output_path)
-        elif fmt == 'tsv':
-            export_to_anki_tsv(flashcards, output_path)
-        elif fmt == 'csv':
-            export_to_csv(flashcards, output_path)
+            paths[export_fmt] = os.path.join(ROOT_DIRECTORY, f"{base_name}_anki.{export_fmt}")
     
-    print(f"\n完成! 共处理 {len(flashcards)} 张闪卡")
+    if len(paths) > 1:
+        return export_to_all(flashcards, paths)
+    elif fmt == 'json':
+        return export_to_json(flashcards, paths['json'])
+    elif fmt == 'txt':
+        return export_to_anki_txt(flashcards, paths['txt'])
+    elif fmt == 'tsv':
+        return export_to_anki_tsv(flashcards, paths['tsv'])
+    elif fmt == 'csv':
+        return export_to_csv(flashcards, paths['csv'])
+    elif fmt == 'apkg':
+        return export_to_apkg(flashcards, paths['apkg'], deck_name=base_name)
+    return False
+
 
+def export_streaming(json_path, base_name, fmt, output=None):
+    """
+    边读取边导出 JSON 数组 / JSON Lines 中的闪卡，不把整个文件载入内存，返回是否导出成功
+    文件不是闪卡文件、没有有效闪卡或导出失败时返回 False，由调用方整体加载后处理
+    """
+    try:
+        if detect_format(json_path) is None:
+            return False
+        report = ValidationReport()
+        cards = iter_flashcards(json_path, report)
+        first = next(cards, None)
+    except (OSError, UnicodeDecodeError, JsonStreamError):
+        return False
+    if first is None:
+        return False
+    
+    count = 0
+    
+    def counted():
+        nonlocal count
+        for card in itertools.chain([first], cards):
+            count += 1
+            yield card
+    
+    print(f"正在流式导出 {os.path.basename(json_path)} ...")
+    if not export_flashcards(counted(), base_name, fmt, output):
+        print("流式导出失败，改为整体加载文件")
+        return False
+    summary = report.summary()
+    if summary:
+        print(summary)
+    print(f"\n完成! 共处理 {count} 张闪卡")
+    return True
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,24 +2,38 @@
 Flask API 后端 - Anki 闪卡生成器
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, stream_with_context, g
 from flask_cors import CORS
 import os
 import json
-import tempfile
 import uuid
+import time
+from bisect import bisect_right
+from itertools import islice
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 
-from Anki_flashcards_creator import (
-    read_pdf, read_pptx, read_ppt,
-    get_openai_client, PROMPTS, LANGUAGE, OCR_AVAILABLE, PPTX_AVAILABLE
-)
+from llm_cache import get_cache
+from llm_client import is_configured, get_rate_limiter
+from model_router import get_router
+from structured_output import parse_cards, DEFAULT_SEPARATORS
+from jobs import JobManager, QueueFullError
+from session_store import create_session_store
+from search_index import SearchIndexCache, MATCH_MODES, MATCH_SUBSTRING
+from extraction_cache import save_stream_with_hash
+from document_readers import iter_document_cached
+from dedupe import dedupe_flashcards, DEDUPE_ENABLED, DEDUPE_THRESHOLD
+from token_budget import TokenBudget, BudgetExceededError, DOCUMENT_TOKEN_BUDGET, SESSION_TOKEN_BUDGET
+
+from Anki_flashcards_creator import generate_flashcards_concurrently, OCR_AVAILABLE, PPTX_AVAILABLE
+from chunking import chunk_text
 from Anki_flashcards_from_json import (
-    load_flashcards_from_json, generate_flashcards_from_text,
-    enhance_flashcard_with_api, export_to_json, export_to_anki_txt,
-    export_to_anki_tsv, export_to_csv
+    load_flashcards_from_json, enhance_flashcards_batch, stream_flashcards_from_text
 )
+from exporters import ENCODERS, TEXT_FORMATS, iter_export, iter_export_zip
+from apkg_export import iter_apkg
+import metrics
 
 load_dotenv()
 
@@ -28,22 +42,92 @@ CORS(app)
 
 ROOT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
 UPLOAD_FOLDER = os.path.join(ROOT_DIRECTORY, 'uploads')
-ALLOWED_EXTENSIONS = {'pdf', 'pptx', 'ppt', 'json', 'txt'}
+ALLOWED_EXTENSIONS = {'pdf', 'pptx', 'ppt', 'json', 'jsonl', 'txt'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
+# 上传文件边接收边写入磁盘，JSON 闪卡文件流式解析，上限可按需调整
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', '1024')) * 1024 * 1024
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-sessions = {}
+# 会话存储（内存 LRU/TTL 或多进程共享的 SQLite，见 session_store.py）
+sessions = create_session_store()
+job_manager = JobManager()
+search_indexes = SearchIndexCache()
+
+# 分页读取闪卡时每页的最大卡片数，以及可选的返回字段
+MAX_PAGE_SIZE = 1000
+CARD_FIELDS = ('id', 'question', 'answer')
+# 批量编辑一次最多包含的操作数
+MAX_BATCH_OPS = 10000
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def get_session(session_id):
-    if session_id not in sessions:
-        sessions[session_id] = {'flashcards': [], 'filename': None, 'text_content': ''}
-    return sessions[session_id]
+    return sessions.get_or_create(session_id)
+
+def set_flashcards(session_id, flashcards):
+    def apply(session):
+        # 替换卡片而不是新建容器：卡片 ID 与版本号继续递增，旧的 ETag 和卡片 ID 不会被误认为仍然有效
+        session['flashcards'].replace(flashcards)
+    sessions.update(session_id, apply, create=True)
+
+def token_budget(session_id):
+    """
+    一次生成/增强的 token 预算：文档预算之上是会话预算，会话此前的用量保存在会话的 tokens_used 中
+    （并发的任务各自按开始时的用量检查会话预算）
+    """
+    used = sessions.read(session_id, lambda session: session.get('tokens_used', 0)) or 0
+    return TokenBudget(DOCUMENT_TOKEN_BUDGET, 'document', parent=TokenBudget(SESSION_TOKEN_BUDGET, 'session', used=used))
+
+def record_token_usage(session_id, budget):
+    """把本次实际消耗的 token 数累加到会话，返回用量报告"""
+    if budget.spent:
+        def apply(session):
+            session['tokens_used'] = session.get('tokens_used', 0) + budget.spent
+        sessions.update(session_id, apply)
+    return dict(budget.report(), session_used=budget.parent.used, session_limit=budget.parent.limit or None)
+
+def card_page(flashcards, cursor=None, limit=None, fields=CARD_FIELDS, card_ids=None):
+    """
+    返回 (卡片列表, next_cursor)：从 ID 为 cursor 的卡片之后取最多 limit 张，只保留 fields 中的字段
+    card_ids 为搜索结果（按顺序排列的卡片 ID）时只在其中分页；没有下一页时 next_cursor 为 None
+    """
+    if card_ids is None:
+        items = flashcards.items_after(cursor)
+    else:
+        start = 0 if cursor is None else bisect_right(card_ids, cursor)
+        items = ((card_id, flashcards.get(card_id)) for card_id in card_ids[start:])
+    items = list(islice(items, limit + 1)) if limit else list(items)
+    next_cursor = None
+    if limit and len(items) > limit:
+        items = items[:limit]
+        next_cursor = items[-1][0]
+    page = []
+    for card_id, card in items:
+        card['id'] = card_id
+        page.append({field: card[field] for field in fields})
+    return page, next_cursor
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    # 按路由模板（而不是实际路径）分组，避免卡片 ID 等参数让标签无限增长；流式响应只计到开始发送为止
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint,
+                                             method=request.method, status=response.status_code)
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 文本格式的处理阶段耗时、LLM 请求延迟与 token 用量、API 请求延迟"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -51,7 +135,11 @@ def health_check():
         'status': 'ok',
         'ocr_available': OCR_AVAILABLE,
         'pptx_available': PPTX_AVAILABLE,
-        'api_available': os.environ.get("ARK_API_KEY") is not None
+        'api_available': is_configured(),
+        'llm_cache': get_cache().stats(),
+        'rate_limit': get_rate_limiter().stats(),
+        'model_routing': get_router().stats(),
+        'sessions': sessions.stats()
     })
 
 @app.route('/api/upload', methods=['POST'])
@@ -70,19 +158,16 @@ def upload_file():
         session_id = str(uuid.uuid4())
         filename = secure_filename(file.filename)
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{session_id}_{filename}")
-        file.save(filepath)
+        # 边保存边计算内容哈希，用于命中提取缓存
+        file_hash = save_stream_with_hash(file.stream, filepath)
         
         ext = filename.rsplit('.', 1)[1].lower()
         text_content = ""
         flashcards = []
         
-        if ext == 'pdf':
-            text_content = read_pdf(filepath)
-        elif ext == 'pptx':
-            text_content = read_pptx(filepath) if PPTX_AVAILABLE else ""
-        elif ext == 'ppt':
-            text_content = read_ppt(filepath)
-        elif ext == 'json':
+        if ext in ('pdf', 'ppt') or (ext == 'pptx' and PPTX_AVAILABLE):
+            text_content = "".join(chunk.text for chunk in iter_document_cached(filepath, file_hash))
+        elif ext in ('json', 'jsonl'):
             result = load_flashcards_from_json(filepath)
             if result and result['type'] == 'flashcards':
                 flashcards = result['content']
@@ -92,10 +177,8 @@ def upload_file():
             with open(filepath, 'r', encoding='utf-8') as f:
                 text_content = f.read()
         
-        session = get_session(session_id)
-        session['filename'] = filename
-        session['text_content'] = text_content
-        session['flashcards'] = flashcards
+        sessions.save(session_id, {'filename': filename, 'flashcards': flashcards})
+        sessions.set_text(session_id, text_content)
         
         os.remove(filepath)
         
@@ -110,76 +193,218 @@ def upload_file():
     except Exception as e:
         return jsonify({'error': f'处理文件失败: {str(e)}'}), 500
 
+def run_generate_job(job, text, use_cache):
+    """后台任务：分段并发生成闪卡，每完成一段即可通过任务接口读取部分结果"""
+    sections = chunk_text(text)
+    job.set_total(len(sections))
+    
+    def on_section(index, cards, done, total):
+        job.add_partial(index, cards, done)
+    
+    budget = token_budget(job.session_id)
+    try:
+        flashcards = generate_flashcards_concurrently(
+            sections, progress_callback=on_section, use_cache=use_cache, cancel_event=job.cancel_event,
+            budget=budget
+        )
+    finally:
+        job.usage = record_token_usage(job.session_id, budget)
+    if job.cancelled:
+        return flashcards
+    if not flashcards:
+        raise RuntimeError('生成闪卡失败：token 预算不足' if budget.exceeded else '生成闪卡失败')
+    if DEDUPE_ENABLED:
+        flashcards, _ = dedupe_flashcards(flashcards)
+    set_flashcards(job.session_id, flashcards)
+    return flashcards
+
 @app.route('/api/generate', methods=['POST'])
 def generate_flashcards():
     data = request.get_json()
-    session_id = data.get('session_id')
+    session_id = data.get('session_id') or str(uuid.uuid4())
     text = data.get('text', '')
+    use_cache = not data.get('no_cache', False)
     
-    if session_id and session_id in sessions:
-        if not text:
-            text = sessions[session_id].get('text_content', '')
+    if not text:
+        text = sessions.get_text(session_id)
     
     if not text:
         return jsonify({'error': '没有可处理的文本'}), 400
     
     try:
-        flashcards = generate_flashcards_from_text(text)
-        if not flashcards:
-            return jsonify({'error': '生成闪卡失败'}), 500
-        
-        if session_id:
-            get_session(session_id)['flashcards'] = flashcards
-        
-        return jsonify({'success': True, 'flashcards': flashcards, 'count': len(flashcards)})
-    except Exception as e:
-        return jsonify({'error': f'生成失败: {str(e)}'}), 500
+        get_session(session_id)
+        job = job_manager.submit('generate', run_generate_job, text, use_cache, session_id=session_id)
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    return jsonify({'success': True, 'job_id': job.id, 'session_id': session_id, 'status': job.status}), 202
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/generate/stream', methods=['GET', 'POST'])
+def generate_flashcards_stream():
+    """以 Server-Sent Events 推送生成的闪卡：每生成一行即发送一个 card 事件，结束时发送 done 事件"""
+    data = request.get_json(silent=True) or request.args
+    session_id = data.get('session_id') or str(uuid.uuid4())
+    text = data.get('text', '')
+    use_cache = str(data.get('no_cache', '')).lower() not in ('1', 'true')
+    
+    if not text:
+        text = sessions.get_text(session_id)
+    if not text:
+        return jsonify({'error': '没有可处理的文本'}), 400
+    
+    def events():
+        flashcards = []
+        yield sse_event('session', {'session_id': session_id})
+        get_session(session_id)
+        budget = token_budget(session_id)
+        try:
+            try:
+                for card in stream_flashcards_from_text(text, use_cache=use_cache, budget=budget):
+                    flashcards.append(card)
+                    yield sse_event('card', {'index': len(flashcards) - 1, **card})
+            except BudgetExceededError:
+                # 预算用完时保留已生成的卡片，done 事件中 usage.exceeded 为 true
+                pass
+        except Exception as e:
+            yield sse_event('error', {'error': f'生成失败: {str(e)}'})
+            return
+        finally:
+            # 客户端中途断开时也记下已消耗的 token
+            usage = record_token_usage(session_id, budget)
+        # 去重后的卡片数少于已推送的数量时，客户端应重新拉取闪卡列表
+        duplicates_removed = 0
+        if flashcards and DEDUPE_ENABLED:
+            unique, _ = dedupe_flashcards(flashcards)
+            duplicates_removed = len(flashcards) - len(unique)
+            flashcards = unique
+        if flashcards:
+            set_flashcards(session_id, flashcards)
+        yield sse_event('done', {'session_id': session_id, 'count': len(flashcards),
+                                 'duplicates_removed': duplicates_removed, 'usage': usage})
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/flashcards', methods=['GET'])
 def get_flashcards():
-    session_id = request.args.get('session_id')
-    if not session_id or session_id not in sessions:
-        return jsonify({'error': '会话不存在'}), 404
+    """
+    查询参数（除 session_id 外均可选）:
+      limit   每页卡片数（最多 MAX_PAGE_SIZE），未指定时返回全部
+      cursor  上一页返回的 next_cursor
+      fields  逗号分隔的返回字段（id,question,answer）
+      q       在问题和答案中搜索（不区分大小写），match=prefix 时按前缀匹配，默认按子串
+    响应带有卡片集合版本的 ETag，If-None-Match 命中时返回 304
+    """
+    args = request.args
+    session_id = args.get('session_id')
+    try:
+        limit = int(args['limit']) if args.get('limit') else None
+        cursor = int(args['cursor']) if args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': 'limit 和 cursor 必须是整数'}), 400
+    if limit is not None and not 0 < limit <= MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit 必须在 1 到 {MAX_PAGE_SIZE} 之间'}), 400
+    fields = tuple(field for field in args.get('fields', '').split(',') if field) or CARD_FIELDS
+    if not all(field in CARD_FIELDS for field in fields):
+        return jsonify({'error': f"fields 只能包含 {', '.join(CARD_FIELDS)}"}), 400
+    query = args.get('q', '')
+    match = args.get('match', MATCH_SUBSTRING)
+    if match not in MATCH_MODES:
+        return jsonify({'error': f"match 只能是 {' 或 '.join(MATCH_MODES)}"}), 400
     
-    session = sessions[session_id]
-    return jsonify({
-        'flashcards': session['flashcards'],
-        'filename': session['filename'],
-        'count': len(session['flashcards'])
-    })
+    def read(session):
+        flashcards = session['flashcards']
+        etag = f"{flashcards.epoch}-{flashcards.revision}"
+        if request.if_none_match.contains(etag):
+            return etag, None
+        card_ids = search_indexes.search(session_id, flashcards, query, match) if query else None
+        page, next_cursor = card_page(flashcards, cursor, limit, fields, card_ids)
+        body = {
+            'flashcards': page,
+            'filename': session['filename'],
+            'count': len(flashcards),
+            'revision': flashcards.revision,
+            'next_cursor': next_cursor,
+        }
+        if card_ids is not None:
+            body['matched'] = len(card_ids)
+        return etag, body
+    
+    result = sessions.read(session_id, read) if session_id else None
+    if result is None:
+        return jsonify({'error': '会话不存在'}), 404
+    etag, body = result
+    response = jsonify(body) if body is not None else app.response_class(status=304)
+    response.set_etag(etag)
+    # 浏览器每次都带 If-None-Match 重新验证，牌组未变化时只返回 304
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/flashcards', methods=['POST'])
 def save_flashcards():
     data = request.get_json()
     session_id = data.get('session_id') or str(uuid.uuid4())
-    get_session(session_id)['flashcards'] = data.get('flashcards', [])
+    set_flashcards(session_id, data.get('flashcards', []))
     return jsonify({'success': True, 'session_id': session_id})
 
+def update_card(session_id, locate, data):
+    """修改 locate(flashcards) 返回的 ID 对应的卡片；会话不存在返回 None，卡片不存在返回 False"""
+    def apply(session):
+        flashcards = session['flashcards']
+        card_id = locate(flashcards)
+        return card_id is not None and flashcards.update(card_id, data.get('question', ''), data.get('answer', ''))
+    return sessions.update(session_id, apply) if session_id else None
+
+def delete_card(session_id, locate):
+    """删除 locate(flashcards) 返回的 ID 对应的卡片，返回剩余卡片数；卡片不存在返回 -1"""
+    def apply(session):
+        flashcards = session['flashcards']
+        card_id = locate(flashcards)
+        if card_id is not None and flashcards.delete(card_id):
+            return len(flashcards)
+        return -1
+    return sessions.update(session_id, apply) if session_id else None
+
 @app.route('/api/flashcards/<int:index>', methods=['PUT'])
 def update_flashcard(index):
     data = request.get_json()
-    session_id = data.get('session_id')
-    if not session_id or session_id not in sessions:
+    updated = update_card(data.get('session_id'), lambda flashcards: flashcards.id_at(index), data)
+    if updated is None:
         return jsonify({'error': '会话不存在'}), 404
-    
-    flashcards = sessions[session_id]['flashcards']
-    if 0 <= index < len(flashcards):
-        flashcards[index] = {'question': data.get('question', ''), 'answer': data.get('answer', '')}
+    if updated:
         return jsonify({'success': True})
     return jsonify({'error': '索引超出范围'}), 400
 
 @app.route('/api/flashcards/<int:index>', methods=['DELETE'])
 def delete_flashcard(index):
-    session_id = request.args.get('session_id')
-    if not session_id or session_id not in sessions:
+    count = delete_card(request.args.get('session_id'), lambda flashcards: flashcards.id_at(index))
+    if count is None:
         return jsonify({'error': '会话不存在'}), 404
-    
-    flashcards = sessions[session_id]['flashcards']
-    if 0 <= index < len(flashcards):
-        flashcards.pop(index)
-        return jsonify({'success': True, 'count': len(flashcards)})
+    if count >= 0:
+        return jsonify({'success': True, 'count': count})
     return jsonify({'error': '索引超出范围'}), 400
 
+@app.route('/api/flashcards/id/<int:card_id>', methods=['PUT'])
+def update_flashcard_by_id(card_id):
+    data = request.get_json()
+    updated = update_card(data.get('session_id'), lambda flashcards: card_id, data)
+    if updated is None:
+        return jsonify({'error': '会话不存在'}), 404
+    if updated:
+        return jsonify({'success': True, 'id': card_id})
+    return jsonify({'error': '闪卡不存在'}), 404
+
+@app.route('/api/flashcards/id/<int:card_id>', methods=['DELETE'])
+def delete_flashcard_by_id(card_id):
+    count = delete_card(request.args.get('session_id'), lambda flashcards: card_id)
+    if count is None:
+        return jsonify({'error': '会话不存在'}), 404
+    if count >= 0:
+        return jsonify({'success': True, 'count': count})
+    return jsonify({'error': '闪卡不存在'}), 404
+
 @app.route('/api/flashcards/add', methods=['POST'])
 def add_flashcard():
     data = request.get_json()
@@ -188,63 +413,244 @@ def add_flashcard():
         return jsonify({'error': '问题和答案不能为空'}), 400
     
     session_id = data.get('session_id') or str(uuid.uuid4())
-    session = get_session(session_id)
-    session['flashcards'].append({'question': question, 'answer': answer})
-    return jsonify({'success': True, 'session_id': session_id, 'count': len(session['flashcards'])})
+    
+    def apply(session):
+        card_id = session['flashcards'].append(question, answer)
+        return card_id, len(session['flashcards'])
+    
+    card_id, count = sessions.update(session_id, apply, create=True)
+    return jsonify({'success': True, 'session_id': session_id, 'id': card_id, 'count': count})
+
+def validate_batch_ops(operations):
+    """检查批量操作的结构，返回错误信息（含操作序号），合法时返回 None"""
+    if not isinstance(operations, list) or not operations:
+        return 'operations 必须是非空列表'
+    if len(operations) > MAX_BATCH_OPS:
+        return f'一次最多 {MAX_BATCH_OPS} 个操作'
+    for i, op in enumerate(operations):
+        kind = op.get('op') if isinstance(op, dict) else None
+        if kind not in ('add', 'update', 'delete'):
+            return f'操作 {i}: op 必须是 add、update 或 delete'
+        if kind != 'add' and not isinstance(op.get('id'), int):
+            return f'操作 {i}: 缺少卡片 id'
+        fields = [op.get(field) for field in ('question', 'answer') if field in op]
+        if not all(isinstance(value, str) for value in fields):
+            return f'操作 {i}: question/answer 必须是字符串'
+        if kind == 'add' and not (op.get('question') and op.get('answer')):
+            return f'操作 {i}: 问题和答案不能为空'
+    return None
+
+@app.route('/api/flashcards/batch', methods=['PATCH'])
+def batch_edit_flashcards():
+    """
+    一次请求内原子地执行多个 add/update/delete 操作:
+      {"session_id", "base_revision", "operations": [
+          {"op": "add", "question", "answer"},
+          {"op": "update", "id", "question"?, "answer"?},
+          {"op": "delete", "id"}]}
+    base_revision（GET /api/flashcards 返回的 revision）与当前版本不一致时返回 409，不做任何修改；
+    任一操作引用的卡片不存在时返回 400，同样不做任何修改。
+    成功时返回紧凑的差异：新增卡片的 ID（按 add 操作的顺序）、修改与删除的 ID，以及新的 revision。
+    """
+    data = request.get_json()
+    session_id = data.get('session_id')
+    operations = data.get('operations')
+    base_revision = data.get('base_revision')
+    error = validate_batch_ops(operations)
+    if error:
+        return jsonify({'error': error}), 400
+    if base_revision is not None and not isinstance(base_revision, int):
+        return jsonify({'error': 'base_revision 必须是整数'}), 400
+    
+    def apply(session):
+        flashcards = session['flashcards']
+        if base_revision is not None and base_revision != flashcards.revision:
+            return 'conflict', flashcards.revision
+        # 先检查全部操作引用的卡片，全部合法才开始修改，保证要么全部生效、要么都不生效
+        deleted = set()
+        for i, op in enumerate(operations):
+            if op['op'] != 'add' and (op['id'] in deleted or op['id'] not in flashcards):
+                return 'missing', f"操作 {i}: 闪卡 {op['id']} 不存在"
+            if op['op'] == 'delete':
+                deleted.add(op['id'])
+        diff = {'added': [], 'updated': [], 'deleted': []}
+        for op in operations:
+            if op['op'] == 'add':
+                diff['added'].append(flashcards.append(op['question'], op['answer']))
+            elif op['op'] == 'update':
+                card = flashcards.get(op['id'])
+                flashcards.update(op['id'], op.get('question', card['question']), op.get('answer', card['answer']))
+                diff['updated'].append(op['id'])
+            else:
+                flashcards.delete(op['id'])
+                diff['deleted'].append(op['id'])
+        diff.update(revision=flashcards.revision, count=len(flashcards))
+        return 'ok', diff
+    
+    result = sessions.update(session_id, apply) if session_id else None
+    if result is None:
+        return jsonify({'error': '会话不存在'}), 404
+    status, detail = result
+    if status == 'conflict':
+        return jsonify({'error': '闪卡已被其他请求修改，请重新读取后再提交', 'revision': detail}), 409
+    if status == 'missing':
+        return jsonify({'error': detail}), 400
+    return jsonify({'success': True, **detail})
+
+@app.route('/api/dedupe', methods=['POST'])
+def dedupe_session_flashcards():
+    """合并会话中完全重复与近似重复的闪卡，每组保留最先出现的一张；dry_run 为真时只返回分组（卡片 ID）"""
+    data = request.get_json()
+    session_id = data.get('session_id')
+    dry_run = bool(data.get('dry_run', False))
+    try:
+        threshold = float(data.get('threshold', DEDUPE_THRESHOLD))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'threshold 必须是数字'}), 400
+    if not 0 < threshold <= 1:
+        return jsonify({'error': 'threshold 必须在 (0, 1] 范围内'}), 400
+    
+    # 分组在锁外对快照计算（10 万张卡片需要数秒），写回时卡片集合已被修改则返回 409
+    def snapshot(session):
+        flashcards = session['flashcards']
+        return (flashcards.epoch, flashcards.revision), list(flashcards.items())
+    
+    result = sessions.read(session_id, snapshot) if session_id else None
+    if result is None:
+        return jsonify({'error': '会话不存在'}), 404
+    version, items = result
+    unique, groups = dedupe_flashcards([card for _, card in items], threshold)
+    
+    def apply(session):
+        flashcards = session['flashcards']
+        if (flashcards.epoch, flashcards.revision) != version:
+            return False
+        for members in groups:
+            for i in members[1:]:
+                flashcards.delete(items[i][0])
+        return True
+    
+    if not dry_run and groups:
+        applied = sessions.update(session_id, apply)
+        if applied is None:
+            return jsonify({'error': '会话不存在'}), 404
+        if not applied:
+            return jsonify({'error': '去重期间闪卡已被其他请求修改，请重试'}), 409
+    return jsonify({'success': True, 'count': len(unique), 'removed': sum(len(g) - 1 for g in groups),
+                    'groups': [[items[i][0] for i in g] for g in groups], 'dry_run': dry_run})
+
+def run_enhance_job(job, selected, card_ids, use_cache):
+    """后台任务：批量并发增强选中的闪卡，每完成一批即按卡片 ID 写回会话"""
+    job.set_total(len(selected))
+    
+    def on_batch(start, cards, done, total):
+        def apply(session):
+            flashcards = session['flashcards']
+            for offset, card in enumerate(cards):
+                card_id = card_ids[start + offset]
+                # 闪卡在增强期间被删除或修改时不覆盖
+                if flashcards.get(card_id) == selected[start + offset]:
+                    flashcards.update(card_id, card['question'], card['answer'])
+        sessions.update(job.session_id, apply)
+        job.add_partial(start, cards, done)
+    
+    budget = token_budget(job.session_id)
+    try:
+        enhance_flashcards_batch(selected, progress_callback=on_batch, use_cache=use_cache,
+                                 cancel_event=job.cancel_event, budget=budget)
+    finally:
+        job.usage = record_token_usage(job.session_id, budget)
+    return job.partial_results()
 
 @app.route('/api/enhance', methods=['POST'])
 def enhance_flashcards():
     data = request.get_json()
     session_id = data.get('session_id')
-    if not session_id or session_id not in sessions:
-        return jsonify({'error': '会话不存在'}), 404
+    use_cache = not data.get('no_cache', False)
     
-    flashcards = sessions[session_id]['flashcards']
-    if not flashcards:
-        return jsonify({'error': '没有可增强的闪卡'}), 400
+    # 只处理 ids（卡片 ID）或 indices（序号）指定的闪卡，都未指定时处理全部；
+    # 在会话锁内选取并复制卡片，并发的删除压缩卡片列时不会漏选或重复
+    def select(session):
+        flashcards = session['flashcards']
+        if not flashcards:
+            return '没有可增强的闪卡', None
+        all_ids = flashcards.ids()
+        if data.get('ids'):
+            card_ids = data['ids']
+            if not all(isinstance(card_id, int) and card_id in flashcards for card_id in card_ids):
+                return '闪卡不存在', None
+        else:
+            indices = data.get('indices') or list(range(len(all_ids)))
+            if not all(isinstance(i, int) and 0 <= i < len(all_ids) for i in indices):
+                return '索引超出范围', None
+            card_ids = [all_ids[i] for i in indices]
+        card_ids = sorted(set(card_ids))
+        return card_ids, [flashcards.get(card_id) for card_id in card_ids]
+    
+    result = sessions.read(session_id, select) if session_id else None
+    if result is None:
+        return jsonify({'error': '会话不存在'}), 404
+    card_ids, selected = result
+    if selected is None:
+        return jsonify({'error': card_ids}), 400
     
     try:
-        for i in range(len(flashcards)):
-            flashcards[i] = enhance_flashcard_with_api(flashcards[i])
-        return jsonify({'success': True, 'count': len(flashcards)})
-    except Exception as e:
-        return jsonify({'error': f'增强失败: {str(e)}'}), 500
+        job = job_manager.submit('enhance', run_enhance_job, selected, card_ids, use_cache, session_id=session_id)
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    return jsonify({'success': True, 'job_id': job.id, 'session_id': session_id, 'status': job.status}), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在'}), 404
+    include_results = request.args.get('results', '1') != '0'
+    return jsonify(job.to_dict(include_results=include_results))
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify({'success': True, 'job_id': job.id, 'status': job.status})
+
+def attachment_headers(filename):
+    # filename* 按 RFC 5987 编码，非 ASCII 文件名也能正确下载
+    fallback = filename.encode('ascii', 'ignore').decode().strip() or 'flashcards'
+    return {'Content-Disposition': f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"}
 
 @app.route('/api/export', methods=['POST'])
 def export_flashcards():
+    """以分块响应流式返回导出文件；format=zip 时打包 json/txt/tsv/csv 四种格式，各条目边编码边发送"""
     data = request.get_json()
     session_id = data.get('session_id')
     format_type = data.get('format', 'json')
     
-    if not session_id or session_id not in sessions:
+    # 在会话锁内复制卡片，导出过程中会话被修改（包括删除触发的压缩）也不影响本次输出
+    result = sessions.read(session_id, lambda session: (list(session['flashcards']), session.get('filename'))) \
+        if session_id else None
+    if result is None:
         return jsonify({'error': '会话不存在'}), 404
-    
-    flashcards = sessions[session_id]['flashcards']
+    flashcards, filename = result
     if not flashcards:
         return jsonify({'error': '没有可导出的闪卡'}), 400
     
-    try:
-        base_name = sessions[session_id].get('filename', 'flashcards')
-        if '.' in base_name:
-            base_name = base_name.rsplit('.', 1)[0]
-        
-        temp_dir = tempfile.mkdtemp()
-        output_path = os.path.join(temp_dir, f"{base_name}_anki.{format_type}")
-        
-        if format_type == 'json':
-            export_to_json(flashcards, output_path)
-        elif format_type == 'txt':
-            export_to_anki_txt(flashcards, output_path)
-        elif format_type == 'tsv':
-            export_to_anki_tsv(flashcards, output_path)
-        elif format_type == 'csv':
-            export_to_csv(flashcards, output_path)
-        else:
-            return jsonify({'error': '不支持的格式'}), 400
-        
-        return send_file(output_path, as_attachment=True, download_name=os.path.basename(output_path))
-    except Exception as e:
-        return jsonify({'error': f'导出失败: {str(e)}'}), 500
+    base_name = filename or 'flashcards'
+    if '.' in base_name:
+        base_name = base_name.rsplit('.', 1)[0]
+    
+    if format_type in TEXT_FORMATS:
+        body, mimetype = iter_export(flashcards, format_type), ENCODERS[format_type].mimetype
+    elif format_type == 'apkg':
+        body, mimetype = iter_apkg(flashcards, deck_name=base_name), 'application/octet-stream'
+    elif format_type == 'zip':
+        body, mimetype = iter_export_zip(flashcards, base_name), 'application/zip'
+    else:
+        return jsonify({'error': '不支持的格式'}), 400
+    
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers=attachment_headers(f"{base_name}_anki.{format_type}"))
 
 @app.route('/api/import-json', methods=['POST'])
 def import_json():
@@ -258,7 +664,7 @@ def import_json():
         return jsonify({'error': '没有有效的闪卡数据'}), 400
     
     session_id = str(uuid.uuid4())
-    get_session(session_id)['flashcards'] = valid_cards
+    set_flashcards(session_id, valid_cards)
     return jsonify({'success': True, 'session_id': session_id, 'count': len(valid_cards)})
 
 @app.route('/api/parse-text', methods=['POST'])
@@ -270,20 +676,18 @@ def parse_text():
     if not text:
         return jsonify({'error': '没有可解析的文本'}), 400
     
-    flashcards = []
-    for line in text.strip().split('\n'):
-        if separator in line:
-            parts = line.split(separator, 1)
-            q, a = parts[0].strip(), parts[1].strip()
-            if q and a:
-                flashcards.append({'question': q, 'answer': a})
+    # 与模型输出共用解析器：默认分隔符同时接受 ; ； 和制表符，也能识别粘贴的 JSON、编号和 Markdown 表格
+    flashcards = parse_cards(text, None if separator in DEFAULT_SEPARATORS else (separator,))
     
     if not flashcards:
         return jsonify({'error': '未能解析出任何闪卡'}), 400
     
     session_id = str(uuid.uuid4())
-    get_session(session_id)['flashcards'] = flashcards
-    return jsonify({'success': True, 'session_id': session_id, 'flashcards': flashcards, 'count': len(flashcards)})
+    set_flashcards(session_id, flashcards)
+    # 只返回第一页（带卡片 ID），其余通过 GET /api/flashcards 的 next_cursor 分页读取
+    page, next_cursor = sessions.read(session_id, lambda session: card_page(session['flashcards'], limit=MAX_PAGE_SIZE))
+    return jsonify({'success': True, 'session_id': session_id, 'flashcards': page, 'count': len(flashcards),
+                    'next_cursor': next_cursor})
 
 if __name__ == '__main__':
     print("=" * 50)
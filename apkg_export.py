@@ -0,0 +1,204 @@
+"""
+Anki .apkg 导出
+直接写出 Anki 集合数据库（schema 11，Anki 2.1 导入器兼容），笔记与卡片在一个事务内用 executemany 批量插入，
+数据库写在临时目录中（导出结束后删除），再分块压缩为 zip 字节流，
+内存中只保留每个问题的出现次数（用于区分同问题的卡片），卡片内容不驻留内存。
+
+笔记 GUID 由牌组名、问题文本及该问题在本次导出中的出现序号计算得出，同一张卡片重复导出时 GUID 不变，
+再次导入 Anki 会更新已有笔记（例如增强后的答案）而不是新建重复卡片；
+问题相同而答案不同的卡片（未去重时）序号不同，GUID 也不同，不会在导入时被合并或跳过；
+笔记类型与牌组 ID 同样由固定名称计算，多次导入落在同一个牌组中。
+"""
+
+import os
+import html
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+
+from zip_stream import iter_zip
+from exporters import open_output
+from metrics import timed_stage
+
+DEFAULT_DECK_NAME = "Flashcards"
+MODEL_NAME = "Anki FlashCard Generator (Basic)"
+
+# 压缩集合数据库时每次读取的字节数
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Anki 使用的 base91 字符表（与 anki.utils.guid64 相同）
+GUID_ALPHABET = ("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+                 "!#$%&()*+,-./:;<=>?@[]^_`{|}~")
+
+SCHEMA = """
+CREATE TABLE col (
+    id integer primary key, crt integer not null, mod integer not null, scm integer not null,
+    ver integer not null, dty integer not null, usn integer not null, ls integer not null,
+    conf text not null, models text not null, decks text not null, dconf text not null, tags text not null
+);
+CREATE TABLE notes (
+    id integer primary key, guid text not null, mid integer not null, mod integer not null,
+    usn integer not null, tags text not null, flds text not null, sfld integer not null,
+    csum integer not null, flags integer not null, data text not null
+);
+CREATE TABLE cards (
+    id integer primary key, nid integer not null, did integer not null, ord integer not null,
+    mod integer not null, usn integer not null, type integer not null, queue integer not null,
+    due integer not null, ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null, odid integer not null,
+    flags integer not null, data text not null
+);
+CREATE TABLE revlog (
+    id integer primary key, cid integer not null, usn integer not null, ease integer not null,
+    ivl integer not null, lastIvl integer not null, factor integer not null, time integer not null,
+    type integer not null
+);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn ON notes (usn);
+CREATE INDEX ix_cards_usn ON cards (usn);
+CREATE INDEX ix_revlog_usn ON revlog (usn);
+CREATE INDEX ix_cards_nid ON cards (nid);
+CREATE INDEX ix_cards_sched ON cards (did, queue, due);
+CREATE INDEX ix_revlog_cid ON revlog (cid);
+CREATE INDEX ix_notes_csum ON notes (csum);
+"""
+
+CARD_CSS = """.card {
+ font-family: arial;
+ font-size: 20px;
+ text-align: center;
+ color: black;
+ background-color: white;
+}
+"""
+
+# 默认的牌组选项组（与新建 Anki 集合的 "Default" 选项相同）
+DEFAULT_DECK_CONFIG = {
+    "id": 1, "name": "Default", "mod": 0, "usn": 0, "maxTaken": 60, "autoplay": True, "timer": 0,
+    "replayq": True, "dyn": False,
+    "new": {"bury": True, "delays": [1, 10], "initialFactor": 2500, "ints": [1, 4, 7],
+            "order": 1, "perDay": 20, "separate": True},
+    "lapse": {"delays": [10], "leechAction": 0, "leechFails": 8, "minInt": 1, "mult": 0},
+    "rev": {"bury": True, "ease4": 1.3, "fuzz": 0.05, "ivlFct": 1, "maxIvl": 36500,
+            "minSpace": 1, "perDay": 100},
+}
+
+
+def stable_id(name):
+    """由名称计算稳定的正整数 ID（取值范围与 Anki 的毫秒时间戳 ID 相当）"""
+    digest = hashlib.sha1(name.encode('utf-8')).digest()
+    return (1 << 30) + int.from_bytes(digest[:5], 'big') % (1 << 40)
+
+
+def note_guid(deck_name, question, occurrence=0):
+    """由牌组名、问题文本和该问题的出现序号计算稳定的笔记 GUID（64 位整数的 base91 表示）
+
+    首次出现的问题（occurrence=0）与不带序号时的 GUID 相同，之后的同问题卡片依次加上序号
+    """
+    key = f"{deck_name}\x1f{question}" if not occurrence else f"{deck_name}\x1f{question}\x1f{occurrence}"
+    value = int.from_bytes(hashlib.sha1(key.encode('utf-8')).digest()[:8], 'big')
+    chars = []
+    while value:
+        value, remainder = divmod(value, len(GUID_ALPHABET))
+        chars.append(GUID_ALPHABET[remainder])
+    return ''.join(reversed(chars)) or GUID_ALPHABET[0]
+
+
+def field_html(text):
+    return html.escape(text, quote=False).replace('\n', '<br>')
+
+
+def field_checksum(text):
+    return int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def collection_row(deck_id, deck_name, model_id, card_count, now):
+    deck = {
+        "id": deck_id, "name": deck_name, "desc": "", "mod": now, "usn": -1, "collapsed": False,
+        "browserCollapsed": False, "dyn": 0, "conf": 1, "extendNew": 0, "extendRev": 0,
+        "newToday": [0, 0], "revToday": [0, 0], "lrnToday": [0, 0], "timeToday": [0, 0],
+    }
+    default_deck = dict(deck, id=1, name="Default")
+    field = {"sticky": False, "rtl": False, "font": "Arial", "size": 20, "media": []}
+    model = {
+        "id": model_id, "name": MODEL_NAME, "type": 0, "mod": now, "usn": -1, "sortf": 0, "did": deck_id,
+        "flds": [dict(field, name="Front", ord=0), dict(field, name="Back", ord=1)],
+        "tmpls": [{"name": "Card 1", "ord": 0, "qfmt": "{{Front}}",
+                   "afmt": "{{FrontSide}}\n\n<hr id=answer>\n\n{{Back}}",
+                   "bqfmt": "", "bafmt": "", "did": None, "bfont": "", "bsize": 0}],
+        "css": CARD_CSS, "latexPre": "\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n"
+        "\\usepackage{amssymb,amsmath}\n\\pagestyle{empty}\n\\setlength{\\parindent}{0in}\n\\begin{document}\n",
+        "latexPost": "\\end{document}", "latexsvg": False, "req": [[0, "any", [0]]], "tags": [], "vers": [],
+    }
+    conf = {
+        "activeDecks": [deck_id], "curDeck": deck_id, "curModel": str(model_id), "nextPos": card_count + 1,
+        "estTimes": True, "sortType": "noteFld", "sortBackwards": False, "timeLim": 0, "addToCur": True,
+        "newBury": True, "newSpread": 0, "dueCounts": True, "collapseTime": 1200,
+    }
+    return (1, now, now * 1000, now * 1000, 11, 0, 0, 0, json.dumps(conf),
+            json.dumps({str(model_id): model}), json.dumps({"1": default_deck, str(deck_id): deck}),
+            json.dumps({"1": DEFAULT_DECK_CONFIG}), json.dumps({}))
+
+
+@timed_stage('export_apkg')
+def write_collection(flashcards, db_path, deck_name=DEFAULT_DECK_NAME):
+    """把闪卡（列表或任意可迭代对象）写入 db_path 处新建的 Anki 集合数据库，返回写入的笔记数"""
+    now = int(time.time())
+    deck_id = stable_id(f"deck:{deck_name}")
+    model_id = stable_id(f"model:{MODEL_NAME}")
+    # 笔记/卡片 ID 只需在集合内唯一，Anki 导入时按 GUID 匹配已有笔记
+    base_id = now * 1000
+    count = 0
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.executescript(SCHEMA)
+        conn.execute('BEGIN')
+
+        def note_rows():
+            nonlocal count
+            # 以问题的摘要计数，同一问题的第 n 张卡片使用第 n 个 GUID
+            occurrences = {}
+            for i, card in enumerate(flashcards):
+                question, answer = card['question'], card['answer']
+                count = i + 1
+                digest = hashlib.sha1(question.encode('utf-8')).digest()
+                occurrence = occurrences.get(digest, 0)
+                occurrences[digest] = occurrence + 1
+                yield (base_id + i, note_guid(deck_name, question, occurrence), model_id, now, -1, '',
+                       field_html(question) + '\x1f' + field_html(answer), question,
+                       field_checksum(question), 0, '')
+
+        conn.executemany('INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)', note_rows())
+        conn.executemany('INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)',
+                         ((base_id + i, base_id + i, deck_id, 0, now, -1, 0, 0, i + 1, 0, 0, 0, 0, 0, 0, 0, 0, '')
+                          for i in range(count)))
+        # 卡片数在遍历完笔记后才知道，集合行最后写入
+        conn.execute('INSERT INTO col VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)',
+                     collection_row(deck_id, deck_name, model_id, count, now))
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    return count
+
+
+def iter_apkg(flashcards, deck_name=DEFAULT_DECK_NAME):
+    """产出 .apkg 文件内容的字节块，可直接作为 HTTP 分块响应发送"""
+    with tempfile.TemporaryDirectory(prefix='apkg_') as temp_dir:
+        db_path = os.path.join(temp_dir, 'collection.anki2')
+        write_collection(flashcards, db_path, deck_name)
+        # 集合数据库边读边压缩发送，发送结束（或客户端断开）后删除临时目录
+        with open(db_path, 'rb') as src:
+            yield from iter_zip([('collection.anki2', iter(lambda: src.read(COPY_CHUNK_SIZE), b'')),
+                                 ('media', [b'{}'])])
+
+
+def write_apkg(flashcards, output_path, deck_name=DEFAULT_DECK_NAME):
+    """把闪卡打包为 .apkg 写入 output_path（失败时不留下不完整的文件）"""
+    with open_output(output_path) as f:
+        for chunk in iter_apkg(flashcards, deck_name):
+            f.write(chunk)
@@ -0,0 +1,105 @@
+"""
+会话闪卡容器基准：比较 list of dict 与 card_store.CardStore
+
+统计每 10 万张卡片的内存占用（tracemalloc，不含问题/答案字符串本身），以及随机修改、
+随机删除的平均延迟。list of dict 的删除是 list.pop(序号)，CardStore 按 ID 删除（打标记 + 定期压缩）。
+
+用法:
+  python benchmarks/bench_card_store.py
+  python benchmarks/bench_card_store.py --cards 200000 --edits 20000 --json result.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from card_store import CardStore
+
+
+def make_texts(count):
+    return [(f"问题 {i}: What is item {i}?", f"答案 {i}: item {i} is a synthetic card") for i in range(count)]
+
+
+def measure_memory(build, texts):
+    """只统计容器本身：字符串在 tracemalloc 开始前已经创建"""
+    tracemalloc.start()
+    container = build(texts)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return container, current
+
+
+def build_list(texts):
+    return [{'question': q, 'answer': a} for q, a in texts]
+
+
+def build_store(texts):
+    store = CardStore()
+    for q, a in texts:
+        store.append(q, a)
+    return store
+
+
+def time_per_op(func, targets):
+    start = time.perf_counter()
+    for target in targets:
+        func(target)
+    return (time.perf_counter() - start) / len(targets) * 1e6
+
+
+def run(card_count, edit_count, seed=0):
+    texts = make_texts(card_count)
+    rng = random.Random(seed)
+    per_100k = 100000 / card_count
+
+    cards, list_bytes = measure_memory(build_list, texts)
+    store, store_bytes = measure_memory(build_store, texts)
+
+    # 修改：list 按序号赋值，CardStore 按 ID 二分查找后赋值
+    positions = [rng.randrange(card_count) for _ in range(edit_count)]
+    list_update = time_per_op(lambda i: cards.__setitem__(i, {'question': 'q', 'answer': 'a'}), positions)
+    ids = store.ids()
+    store_update = time_per_op(lambda i: store.update(ids[i], 'q', 'a'), positions)
+
+    # 删除：list.pop 需要移动后面的元素；CardStore 打标记，超过阈值时压缩
+    delete_positions = [rng.randrange(card_count - i) for i in range(edit_count)]
+    list_delete = time_per_op(cards.pop, delete_positions)
+    delete_ids = rng.sample(ids, edit_count)
+    store_delete = time_per_op(store.delete, delete_ids)
+
+    assert len(cards) == len(store) == card_count - edit_count
+    return {
+        'cards': card_count,
+        'edits': edit_count,
+        'list_of_dicts': {'bytes_per_100k': round(list_bytes * per_100k), 'update_us': round(list_update, 3),
+                          'delete_us': round(list_delete, 3)},
+        'card_store': {'bytes_per_100k': round(store_bytes * per_100k), 'update_us': round(store_update, 3),
+                       'delete_us': round(store_delete, 3)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较会话闪卡容器的内存与编辑延迟')
+    parser.add_argument('--cards', type=int, default=100000, help='卡片数 (默认: 100000)')
+    parser.add_argument('--edits', type=int, default=10000, help='修改/删除次数 (默认: 10000)')
+    parser.add_argument('--json', help='把结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    result = run(args.cards, min(args.edits, args.cards // 2))
+    for name in ('list_of_dicts', 'card_store'):
+        stats = result[name]
+        print(f"{name:14s} 内存 {stats['bytes_per_100k'] / 1024 / 1024:7.2f} MB/10万张  "
+              f"修改 {stats['update_us']:7.3f} µs  删除 {stats['delete_us']:8.3f} µs")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+切分策略基准：比较固定 1000 字符的 divide_text 与按 token 预算切分的 chunking.iter_token_chunks
+
+统计每种策略的请求数、估算的 prompt token 数（含提示模板开销）、平均填充率，以及
+在句子中间被切断的块数。加 --live 时会真正调用 API（可指向本地兼容服务），并统计每千 token 生成的卡片数。
+
+用法:
+  python benchmarks/bench_chunker.py                      # 使用内置的中英文合成文本
+  python benchmarks/bench_chunker.py doc.pdf slides.pptx  # 使用真实文档
+  python benchmarks/bench_chunker.py --tokens 1500 --overlap 100 --live
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from chunking import iter_token_chunks, estimate_tokens, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from document_readers import iter_document
+from Anki_flashcards_creator import divide_text, generate_flashcards_concurrently, PROMPTS, LANGUAGE
+
+SENTENCE_ENDINGS = ('。', '！', '？', '；', '.', '!', '?', ';')
+
+
+def synthetic_corpus(paragraphs=200):
+    """生成中英文混合的合成文本：长短段落交替"""
+    zh = "光合作用是植物利用光能把二氧化碳和水转化为有机物并释放氧气的过程。叶绿体是进行光合作用的场所。"
+    en = ("The mitochondrion is the powerhouse of the cell; it produces ATP through oxidative phosphorylation. "
+          "Enzymes lower the activation energy of chemical reactions. ")
+    parts = []
+    for i in range(paragraphs):
+        base = zh if i % 2 else en
+        parts.append(base * (1 + i % 5))
+    return "\n\n".join(parts)
+
+
+def template_overhead():
+    prompts = PROMPTS[LANGUAGE if LANGUAGE in PROMPTS else 'en']
+    return estimate_tokens(prompts['system'] + prompts['user'].format(text=''))
+
+
+def measure(name, chunks, budget, live=False):
+    overhead = template_overhead()
+    text_tokens = [estimate_tokens(chunk) for chunk in chunks]
+    split_mid_sentence = sum(1 for chunk in chunks[:-1] if not chunk.rstrip().endswith(SENTENCE_ENDINGS))
+    result = {
+        'strategy': name,
+        'requests': len(chunks),
+        'prompt_tokens': sum(text_tokens) + overhead * len(chunks),
+        'template_overhead_tokens': overhead * len(chunks),
+        'avg_fill': round(sum(text_tokens) / (budget * len(chunks)), 3) if chunks else 0,
+        'split_mid_sentence': split_mid_sentence,
+    }
+    if live:
+        start = time.perf_counter()
+        cards = generate_flashcards_concurrently(chunks, use_cache=False)
+        result['cards'] = len(cards)
+        result['cards_per_1k_prompt_tokens'] = round(1000 * len(cards) / result['prompt_tokens'], 2)
+        result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较 divide_text 与按 token 切分的效果')
+    parser.add_argument('files', nargs='*', help='PDF/PPTX/PPT/TXT 文件（默认使用合成文本）')
+    parser.add_argument('--tokens', type=int, default=CHUNK_TOKENS, help='每块的 token 预算')
+    parser.add_argument('--overlap', type=int, default=CHUNK_OVERLAP_TOKENS, help='相邻块重叠的 token 数')
+    parser.add_argument('--section-size', type=int, default=1000, help='divide_text 的段落字符数')
+    parser.add_argument('--live', action='store_true', help='实际调用 API 统计卡片数')
+    args = parser.parse_args()
+
+    if args.files:
+        text = "".join(chunk.text for path in args.files for chunk in iter_document(path))
+    else:
+        text = synthetic_corpus()
+
+    results = []
+    strategies = [
+        ('divide_text', lambda: divide_text(text, args.section_size)),
+        ('iter_token_chunks', lambda: list(iter_token_chunks([text], args.tokens, args.overlap))),
+    ]
+    for name, split in strategies:
+        start = time.perf_counter()
+        chunks = split()
+        chunking_seconds = round(time.perf_counter() - start, 4)
+        result = measure(name, chunks, args.tokens, args.live)
+        result['chunking_seconds'] = chunking_seconds
+        results.append(result)
+
+    print(json.dumps({'characters': len(text), 'estimated_tokens': estimate_tokens(text), 'results': results},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
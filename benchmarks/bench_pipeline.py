@@ -0,0 +1,354 @@
+"""
+离线端到端基准：合成文档 + 本地模拟 API，测量整条流水线与各阶段的耗时
+
+阶段: extract_pdf / extract_pptx（文档读取）、chunk（divide_text 与按 token 切分）、llm（并发生成，含逐请求延迟）、
+parse（行解析器）、load_deck（流式读取 JSON 闪卡文件）、export（全部文本格式与 .apkg），以及 API 的每秒请求数。
+每个规模在独立的子进程中运行，peak_rss_mb 是该子进程的内存峰值。结果写为 JSON，可用 --compare 与上次结果比较。
+
+需要的外部服务都在本地启动（benchmarks/mock_llm_server.py），不访问网络，不使用响应缓存和提取缓存。
+
+用法:
+  python benchmarks/bench_pipeline.py                                  # small + medium，结果写入 bench_results.json
+  python benchmarks/bench_pipeline.py --sizes large --latency 0.5 --tps 100 --error-rate 0.05
+  python benchmarks/bench_pipeline.py --output new.json --compare bench_results.json --max-regression 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import platform
+import tempfile
+import argparse
+import threading
+import subprocess
+import http.client
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIRECTORY = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIRECTORY)
+sys.path.insert(0, BENCH_DIR)
+
+from mock_llm_server import MockLLMServer
+from fixtures import SIZES, make_pdf, make_pptx, make_deck
+
+DEFAULT_SIZES = ('small', 'medium')
+# API 压测时导入会话的闪卡数上限
+API_DECK_CARDS = 10000
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class StageTimer:
+    """记录各阶段的耗时、处理量与此时的内存峰值"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, unit, func, count=len):
+        """执行 func()，count(结果) 为处理量"""
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        items = count(result)
+        self.stages[name] = {
+            'seconds': round(seconds, 4),
+            'items': items,
+            'unit': unit,
+            'per_second': round(items / seconds, 2) if seconds > 0 else None,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        return result
+
+
+def configure_environment(base_url, args):
+    """在导入项目模块之前设置环境变量：指向模拟服务，关闭缓存，缩短重试等待"""
+    os.environ.update({
+        'ARK_API_KEY': 'mock',
+        'ARK_BASE_URL': base_url,
+        'ARK_MAX_CONCURRENCY': str(args.concurrency),
+        'ARK_BACKOFF_BASE': '0.01',
+        'ARK_BACKOFF_MAX': '0.1',
+        'LLM_CACHE_DISABLED': '1',
+        'EXTRACTION_CACHE_DISABLED': '1',
+    })
+
+
+def bench_api(deck_path, seconds, clients):
+    """在本地启动 Flask 服务，多个客户端并发请求闪卡分页读取与健康检查，返回每秒请求数与延迟分位"""
+    from werkzeug.serving import make_server
+    from json_stream import iter_flashcards
+    from itertools import islice
+    import api
+
+    server = make_server('127.0.0.1', 0, api.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    def request(method, path, body=None):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        try:
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+
+    cards = list(islice(iter_flashcards(deck_path), API_DECK_CARDS))
+    _, body = request('POST', '/api/import-json', {'flashcards': cards})
+    session_id = json.loads(body)['session_id']
+    paths = [f'/api/flashcards?session_id={session_id}&limit=100&fields=id,question', '/api/health']
+
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(worker):
+        local, failed, i = [], 0, worker
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status, _ = request('GET', paths[i % len(paths)])
+            local.append(time.perf_counter() - start)
+            failed += status != 200
+            i += 1
+        with lock:
+            latencies.extend(local)
+            failures[0] += failed
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    return {
+        'requests': len(latencies),
+        'failures': failures[0],
+        'clients': clients,
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'latency_p50_ms': round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+        'latency_p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+    }
+
+
+def run_size(size, args):
+    """在当前进程中运行一个规模的全部阶段（由子进程调用）"""
+    spec = SIZES[size]
+    work_dir = tempfile.mkdtemp(prefix=f'bench_{size}_')
+    mock = MockLLMServer(latency=args.latency, tokens_per_second=args.tps, error_rate=args.error_rate,
+                         cards_per_request=args.cards_per_request).start()
+    configure_environment(mock.base_url, args)
+    try:
+        import Anki_flashcards_creator as creator
+        from document_readers import iter_document, PPTX_AVAILABLE
+        from chunking import chunk_text
+        from json_stream import iter_flashcards
+        from exporters import write_exports, TEXT_FORMATS
+        from apkg_export import write_apkg
+        from structured_output import parse_cards
+
+        pdf_path = make_pdf(os.path.join(work_dir, 'doc.pdf'), spec['pdf_pages'])
+        pptx_path = make_pptx(os.path.join(work_dir, 'slides.pptx'), spec['pptx_slides']) if PPTX_AVAILABLE else None
+        deck_path = make_deck(os.path.join(work_dir, 'deck.json'), spec['deck_cards'])
+
+        timer = StageTimer()
+        pages = timer.run('extract_pdf', 'pages', lambda: list(iter_document(pdf_path)))
+        text = ''.join(chunk.text for chunk in pages)
+        if pptx_path:
+            timer.run('extract_pptx', 'slides', lambda: list(iter_document(pptx_path)))
+        sections = timer.run('chunk_divide_text', 'sections', lambda: creator.divide_text(text, creator.SECTION_SIZE))
+        timer.run('chunk_token_budget', 'chunks', lambda: chunk_text(text))
+
+        # 逐请求计时：包装生成模块引用的 chat_completion
+        request_latencies = []
+        chat_completion = creator.chat_completion
+
+        def timed_chat_completion(*a, **kw):
+            start = time.perf_counter()
+            try:
+                return chat_completion(*a, **kw)
+            finally:
+                request_latencies.append(time.perf_counter() - start)
+
+        creator.chat_completion = timed_chat_completion
+        try:
+            cards = timer.run('llm', 'requests', lambda: creator.generate_flashcards_concurrently(sections, use_cache=False),
+                              count=lambda _: len(sections))
+        finally:
+            creator.chat_completion = chat_completion
+
+        responses = list(mock.responses)
+        timer.run('parse', 'cards', lambda: [card for r in responses for card in parse_cards(r)])
+
+        deck = timer.run('load_deck', 'cards', lambda: list(iter_flashcards(deck_path)))
+        export_paths = {fmt: os.path.join(work_dir, f'deck_anki.{fmt}') for fmt in TEXT_FORMATS}
+        timer.run('export_text', 'cards', lambda: write_exports(deck, export_paths), count=lambda _: len(deck))
+        timer.run('export_apkg', 'cards', lambda: write_apkg(deck, os.path.join(work_dir, 'deck.apkg')),
+                  count=lambda _: len(deck))
+
+        pipeline_stages = [name for name in ('extract_pdf', 'chunk_divide_text', 'llm', 'parse') if name in timer.stages]
+        pipeline_seconds = sum(timer.stages[name]['seconds'] for name in pipeline_stages)
+        result = {
+            'size': size,
+            'fixtures': dict(spec, pptx=bool(pptx_path), text_chars=len(text)),
+            'stages': timer.stages,
+            'pipeline': {
+                'stages': pipeline_stages,
+                'seconds': round(pipeline_seconds, 4),
+                'pages_per_second': round(spec['pdf_pages'] / pipeline_seconds, 2),
+                'cards': len(cards),
+                'cards_per_minute': round(len(cards) / pipeline_seconds * 60, 1),
+            },
+            'llm_requests': dict(mock.stats(),
+                                 latency_p50_ms=round(percentile(request_latencies, 0.5) * 1000, 2),
+                                 latency_p95_ms=round(percentile(request_latencies, 0.95) * 1000, 2)),
+        }
+        if not args.skip_api:
+            result['api'] = bench_api(deck_path, args.api_seconds, args.api_clients)
+        result['peak_rss_mb'] = peak_rss_mb()
+        return result
+    finally:
+        mock.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_in_subprocess(size, args):
+    command = [sys.executable, os.path.realpath(__file__), '--worker', size,
+               '--latency', str(args.latency), '--tps', str(args.tps), '--error-rate', str(args.error_rate),
+               '--cards-per-request', str(args.cards_per_request), '--concurrency', str(args.concurrency),
+               '--api-seconds', str(args.api_seconds), '--api-clients', str(args.api_clients)]
+    if args.skip_api:
+        command.append('--skip-api')
+    completed = subprocess.run(command, capture_output=True, text=True, cwd=ROOT_DIRECTORY)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{size} 基准失败:\n{completed.stderr[-2000:]}")
+    # 项目代码会打印进度，结果是输出的最后一行
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=ROOT_DIRECTORY).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, max_regression):
+    """打印与基准结果的耗时对比，返回超过 max_regression 的退化项"""
+    regressions = []
+    for size, result in results.items():
+        old = baseline.get('results', {}).get(size)
+        if not old:
+            continue
+        print(f"\n[{size}] 与基准对比（耗时，负数为更快）")
+        for name, stage in result['stages'].items():
+            old_stage = old['stages'].get(name)
+            if not old_stage or not old_stage['seconds']:
+                continue
+            change = stage['seconds'] / old_stage['seconds'] - 1
+            print(f"  {name:20s} {old_stage['seconds']:9.4f}s -> {stage['seconds']:9.4f}s  {change:+7.1%}")
+            if max_regression is not None and change > max_regression:
+                regressions.append(f"{size}.{name} {change:+.1%}")
+        if 'api' in result and 'api' in old:
+            change = old['api']['requests_per_second'] / result['api']['requests_per_second'] - 1
+            print(f"  {'api (rps)':20s} {old['api']['requests_per_second']:9.1f}  -> "
+                  f"{result['api']['requests_per_second']:9.1f}   {-change:+7.1%}")
+            if max_regression is not None and change > max_regression:
+                regressions.append(f"{size}.api {-change:+.1%} rps")
+    return regressions
+
+
+def print_summary(result):
+    print(f"\n[{result['size']}] 峰值内存 {result['peak_rss_mb']} MB")
+    for name, stage in result['stages'].items():
+        print(f"  {name:20s} {stage['seconds']:9.4f}s  {stage['items']:>8} {stage['unit']:9s} "
+              f"{stage['per_second'] or 0:>12.1f}/s")
+    pipeline = result['pipeline']
+    print(f"  流水线: {pipeline['seconds']}s, {pipeline['pages_per_second']} 页/s, "
+          f"{pipeline['cards_per_minute']} 卡片/分钟")
+    llm = result['llm_requests']
+    print(f"  模拟 API: {llm['requests']} 次请求, {llm['errors']} 次注入错误, "
+          f"p50 {llm['latency_p50_ms']} ms, p95 {llm['latency_p95_ms']} ms")
+    if 'api' in result:
+        api_stats = result['api']
+        print(f"  Flask API: {api_stats['requests_per_second']} 请求/s, p50 {api_stats['latency_p50_ms']} ms, "
+              f"p95 {api_stats['latency_p95_ms']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线端到端基准（本地模拟 API + 合成文档）')
+    parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES),
+                        help=f"逗号分隔的规模: {', '.join(SIZES)} (默认: {','.join(DEFAULT_SIZES)})")
+    parser.add_argument('--latency', type=float, default=0.05, help='模拟 API 每个请求的固定延迟秒数 (默认: 0.05)')
+    parser.add_argument('--tps', type=float, default=0, help='模拟 API 的生成速度 token/秒，0 为不限 (默认: 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟 API 返回 429/503 的比例 (默认: 0)')
+    parser.add_argument('--cards-per-request', type=int, default=5, help='每个生成请求返回的闪卡数 (默认: 5)')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发请求数 ARK_MAX_CONCURRENCY (默认: 8)')
+    parser.add_argument('--api-seconds', type=float, default=3.0, help='API 压测时长 (默认: 3 秒)')
+    parser.add_argument('--api-clients', type=int, default=4, help='API 压测的并发客户端数 (默认: 4)')
+    parser.add_argument('--skip-api', action='store_true', help='跳过 API 压测')
+    parser.add_argument('--output', default='bench_results.json', help='结果 JSON 文件 (默认: bench_results.json)')
+    parser.add_argument('--compare', help='与之前的结果 JSON 比较')
+    parser.add_argument('--max-regression', type=float,
+                        help='与 --compare 一起使用：任一阶段耗时增加超过该比例（如 0.2）时以状态码 1 退出')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_size(args.worker, args)))
+        return
+
+    sizes = [size.strip() for size in args.sizes.split(',') if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"未知的规模: {', '.join(unknown)}")
+
+    results = {}
+    for size in sizes:
+        print(f"运行 {size} ...")
+        results[size] = run_in_subprocess(size, args)
+        print_summary(results[size])
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'config': {key: getattr(args, key) for key in ('latency', 'tps', 'error_rate', 'cards_per_request',
+                                                       'concurrency', 'api_seconds', 'api_clients')},
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print(f"\n性能退化超过 {args.max_regression:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+基准测试用的合成数据：多页 PDF、PPTX 和不同大小的 JSON / JSON Lines 闪卡文件
+
+PDF 由标准库直接写出（Helvetica 字体，只含 ASCII 文本），不依赖任何 PDF 库；
+PPTX 需要 python-pptx，未安装时 make_pptx 返回 None。内容由固定种子生成，每次运行完全相同。
+"""
+
+import json
+import random
+
+try:
+    from pptx import Presentation
+    from pptx.util import Inches
+    PPTX_AVAILABLE = True
+except ImportError:
+    PPTX_AVAILABLE = False
+
+# 各规模的文档页数 / 幻灯片数 / 闪卡数
+SIZES = {
+    'small': {'pdf_pages': 10, 'pptx_slides': 10, 'deck_cards': 1000},
+    'medium': {'pdf_pages': 100, 'pptx_slides': 50, 'deck_cards': 10000},
+    'large': {'pdf_pages': 500, 'pptx_slides': 200, 'deck_cards': 100000},
+}
+
+WORDS = ("cell membrane protein enzyme energy light carbon oxygen water glucose mitochondria chloroplast "
+         "nucleus gene sequence replication transcription translation ribosome molecule reaction "
+         "catalyst gradient transport diffusion osmosis pressure temperature equilibrium structure").split()
+
+
+def sentences(rng, count, words_per_sentence=14):
+    result = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(words_per_sentence)]
+        result.append(' '.join(words).capitalize() + '.')
+    return result
+
+
+def page_lines(rng, lines=40):
+    return sentences(rng, lines)
+
+
+def pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def make_pdf(path, pages, seed=0):
+    """写出 pages 页的 PDF，每页约 40 行文本"""
+    rng = random.Random(seed)
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>']
+    kids = ' '.join(f'{3 + 2 * i} 0 R' for i in range(pages))
+    objects.append(f'<< /Type /Pages /Kids [{kids}] /Count {pages} >>')
+    font_id = 3 + 2 * pages
+    for _ in range(pages):
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       f'/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {len(objects) + 2} 0 R >>')
+        text = ' T* '.join(f'({pdf_escape(line)}) Tj' for line in page_lines(rng))
+        stream = f'BT /F1 9 Tf 11 TL 36 760 Td {text} ET'
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+    objects.append('<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += f'{i + 1} 0 obj\n{obj}\nendobj\n'.encode('latin-1')
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets).encode()
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    with open(path, 'wb') as f:
+        f.write(out)
+    return path
+
+
+def make_pptx(path, slides, seed=0):
+    """写出 slides 张幻灯片的 PPTX（标题 + 文本框），未安装 python-pptx 时返回 None"""
+    if not PPTX_AVAILABLE:
+        return None
+    rng = random.Random(seed)
+    presentation = Presentation()
+    layout = presentation.slide_layouts[5]
+    for i in range(slides):
+        slide = presentation.slides.add_slide(layout)
+        slide.shapes.title.text = f"Slide {i + 1}: {' '.join(rng.choice(WORDS) for _ in range(3))}"
+        body = slide.shapes.add_textbox(Inches(0.5), Inches(1.5), Inches(9), Inches(5)).text_frame
+        body.text = '\n'.join(sentences(rng, 8))
+    presentation.save(path)
+    return path
+
+
+def make_cards(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {'question': f"Q{i}: what links {rng.choice(WORDS)} and {rng.choice(WORDS)}?",
+               'answer': ' '.join(sentences(rng, 2))}
+
+
+def make_deck(path, cards, seed=0, jsonl=False):
+    """写出 cards 张闪卡的 JSON 数组（jsonl=True 时为 JSON Lines），逐张写入不占用额外内存"""
+    with open(path, 'w', encoding='utf-8') as f:
+        if jsonl:
+            for card in make_cards(cards, seed):
+                f.write(json.dumps(card, ensure_ascii=False) + '\n')
+            return path
+        f.write('[')
+        for i, card in enumerate(make_cards(cards, seed)):
+            f.write((',\n' if i else '\n') + json.dumps(card, ensure_ascii=False))
+        f.write('\n]')
+    return path
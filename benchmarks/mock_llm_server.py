@@ -0,0 +1,206 @@
+"""
+本地 OpenAI 兼容的 chat completions 模拟服务，供基准测试离线运行
+
+- 普通请求按提示中的文本生成 "问题;答案" 行；带编号的闪卡列表（批量增强）按原编号逐行返回；
+  请求带 response_format={"type": "json_object"} 时以 {"cards": [...]} 返回同样的内容；
+- 可配置固定延迟、生成速度（token/秒）和错误注入（按比例返回 429/503，带 Retry-After: 0）；
+- 支持 stream=true 的 SSE 流式响应；响应中的 usage 按字符数估算 token 数，流式响应只在请求带
+  stream_options={"include_usage": true} 时以最后一个（choices 为空的）块返回 usage，与 OpenAI 接口一致。
+
+用法（单独运行，把 ARK_BASE_URL 指向它）:
+  python benchmarks/mock_llm_server.py --port 8765 --latency 0.2 --tps 200 --error-rate 0.05
+  ARK_API_KEY=mock ARK_BASE_URL=http://127.0.0.1:8765/v1 python Anki_flashcards_creator.py doc.pdf
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 估算 token 数时每个 token 对应的字符数（与真实分词无关，只用于模拟生成耗时）
+CHARS_PER_TOKEN = 4
+NUMBERED_LINE = re.compile(r'^(\d+)\.\s*(.+?);(.+)$', re.MULTILINE)
+WORD = re.compile(r'\w+')
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def fake_completion(prompt, cards_per_request, json_mode=False):
+    """根据提示生成模拟的模型输出"""
+    numbered = NUMBERED_LINE.findall(prompt)
+    if numbered:
+        cards = [{'index': int(number), 'question': f"{question.strip()}（优化）", 'answer': answer.strip()}
+                 for number, question, answer in numbered]
+    else:
+        words = WORD.findall(prompt[-2000:]) or ['text']
+        cards = []
+        for i in range(cards_per_request):
+            topic = ' '.join(words[(i * 7) % len(words):(i * 7) % len(words) + 5])
+            cards.append({'question': f"What is described by \"{topic}\"?",
+                          'answer': f"It is part {i + 1} of the source text about {topic}."})
+    if json_mode:
+        return json.dumps({'cards': cards}, ensure_ascii=False)
+    return '\n'.join((f"{card['index']}. " if 'index' in card else '') + f"{card['question']};{card['answer']}"
+                     for card in cards)
+
+
+class MockLLMServer:
+    """在后台线程中运行的模拟服务；可用作上下文管理器"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.05, tokens_per_second=0, error_rate=0.0,
+                 cards_per_request=5, seed=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.cards_per_request = cards_per_request
+        self.requests = 0
+        self.errors = 0
+        self.completion_tokens = 0
+        self.responses = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=()):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if not self.path.endswith('/chat/completions'):
+                    return self._send_json(404, {'error': {'message': 'not found'}})
+                fail_status = server._next_failure()
+                if fail_status:
+                    return self._send_json(fail_status, {'error': {'message': 'injected error', 'type': 'mock'}},
+                                           headers=[('Retry-After', '0')])
+
+                prompt = '\n'.join(str(message.get('content', '')) for message in request.get('messages', []))
+                json_mode = (request.get('response_format') or {}).get('type') == 'json_object'
+                content = fake_completion(prompt, server.cards_per_request, json_mode)
+                usage = {'prompt_tokens': estimate_tokens(prompt), 'completion_tokens': estimate_tokens(content)}
+                usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+                server._record(content, usage)
+                time.sleep(server.latency)
+                if request.get('stream'):
+                    self._stream(request, content, usage)
+                else:
+                    server._generation_delay(usage['completion_tokens'])
+                    self._send_json(200, {
+                        'id': 'chatcmpl-mock', 'object': 'chat.completion', 'created': int(time.time()),
+                        'model': request.get('model', 'mock'),
+                        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                                     'finish_reason': 'stop'}],
+                        'usage': usage,
+                    })
+
+            def _stream(self, request, content, usage):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                pieces = [content[i:i + CHARS_PER_TOKEN * 8] for i in range(0, len(content), CHARS_PER_TOKEN * 8)]
+                for i, piece in enumerate(pieces):
+                    server._generation_delay(estimate_tokens(piece))
+                    chunk = {'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                             'model': request.get('model', 'mock'),
+                             'choices': [{'index': 0, 'delta': {'content': piece},
+                                          'finish_reason': 'stop' if i == len(pieces) - 1 else None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                if (request.get('stream_options') or {}).get('include_usage'):
+                    chunk = {'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                             'model': request.get('model', 'mock'), 'choices': [], 'usage': usage}
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+    def _next_failure(self):
+        with self._lock:
+            self.requests += 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors += 1
+                return self._random.choice((429, 503))
+        return None
+
+    def _record(self, content, usage):
+        with self._lock:
+            self.responses.append(content)
+            self.completion_tokens += usage['completion_tokens']
+
+    def _generation_delay(self, tokens):
+        if self.tokens_per_second:
+            time.sleep(tokens / self.tokens_per_second)
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'errors': self.errors, 'completion_tokens': self.completion_tokens}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 OpenAI 兼容的 chat completions 模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help='每个请求的固定延迟（秒）')
+    parser.add_argument('--tps', type=float, default=0, help='生成速度 token/秒（0 表示不限）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 429/503 的请求比例')
+    parser.add_argument('--cards', type=int, default=5, help='每个生成请求返回的闪卡数')
+    args = parser.parse_args()
+
+    server = MockLLMServer(args.host, args.port, args.latency, args.tps, args.error_rate, args.cards)
+    print(f"模拟服务已启动: {server.base_url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+        print(json.dumps(server.stats()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+紧凑的闪卡容器
+CardStore 按列保存闪卡：问题与答案各一个字符串列表，卡片 ID 存在 array('q') 中，删除标记是一个 bytearray。
+每张卡片的固定开销约 25 字节（list of dict 约 250 字节），删除只打标记 (O(1))，
+标记数超过阈值时整体压缩一次。
+
+卡片 ID 在会话内单调递增、删除后不会复用，压缩后也保持不变，所以 ID 数组始终有序，
+按 ID 查找用二分即可，不需要额外的字典。并发编辑按 ID 定位卡片，不会因为别人的删除而改到别的卡片。
+
+每次增删改都会递增 revision；epoch 在容器创建时随机生成，(epoch, revision) 唯一标识卡片集合的一个版本，
+用作 HTTP ETag 与搜索索引的失效判断。修改过的卡片 ID 记录在一个有长度上限的变更日志中，
+搜索索引据此增量更新，不必在每次编辑后重建。
+"""
+
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+
+# 删除标记数超过 max(COMPACT_MIN_DELETED, 存活卡片数 × COMPACT_RATIO) 时压缩
+COMPACT_MIN_DELETED = 1024
+COMPACT_RATIO = 0.25
+
+# 变更日志最多保留的修改记录数，超出后丢弃较早的一半
+MAX_CHANGES = 1024
+
+# 估算内存占用时每张卡片的固定开销：两个列表指针 + 8 字节 ID + 1 字节标记 + 两个 str 对象头
+SLOT_OVERHEAD = 8 * 2 + 8 + 1 + 49 * 2
+
+
+def log_change(changes, changes_floor, revision, card_id):
+    """把一次修改追加到变更日志，超出 MAX_CHANGES 时丢弃较早的一半，返回 (变更日志, 日志起点 revision)"""
+    changes.append((revision, card_id))
+    if len(changes) > MAX_CHANGES:
+        changes_floor = changes[MAX_CHANGES // 2 - 1][0]
+        changes = changes[MAX_CHANGES // 2:]
+    return changes, changes_floor
+
+
+class CardStore:
+    """按列存储的闪卡集合，迭代时产出 {'question', 'answer'} 字典"""
+
+    __slots__ = ('_ids', '_questions', '_answers', '_deleted', '_deleted_count', '_next_id', '_chars', '_changes', '_changes_floor',
+                 'revision', 'epoch')
+
+    def __init__(self, flashcards=(), next_id=1):
+        self._ids = array('q')
+        self._questions = []
+        self._answers = []
+        self._deleted = bytearray()
+        self._deleted_count = 0
+        self._next_id = next_id
+        # 存活卡片的文本总长度，estimate_size 不需要遍历
+        self._chars = 0
+        self.revision = 0
+        self.epoch = uuid.uuid4().hex[:12]
+        # [(修改后的 revision, 卡片 ID)]；早于 _changes_floor 的修改已不在日志中
+        self._changes = []
+        self._changes_floor = 0
+        self.extend(flashcards)
+
+    def __len__(self):
+        return len(self._ids) - self._deleted_count
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        for _, card in self.items():
+            yield card
+
+    def items(self):
+        """按顺序产出 (卡片 ID, 卡片)"""
+        deleted = self._deleted
+        for slot, card_id in enumerate(self._ids):
+            if not deleted[slot]:
+                yield card_id, {'question': self._questions[slot], 'answer': self._answers[slot]}
+
+    def items_after(self, after=None):
+        """从 ID 为 after 的卡片之后开始按顺序产出 (卡片 ID, 卡片)，after 为 None 时从头开始（用于游标分页）"""
+        start = 0 if after is None else bisect_right(self._ids, after)
+        ids, deleted = self._ids, self._deleted
+        for slot in range(start, len(ids)):
+            if not deleted[slot]:
+                yield ids[slot], {'question': self._questions[slot], 'answer': self._answers[slot]}
+
+    @property
+    def last_id(self):
+        """已分配的最大卡片 ID，此后追加的卡片 ID 都比它大"""
+        return self._next_id - 1
+
+    def changed_since(self, revision):
+        """返回 revision 之后被修改过的卡片 ID（不含新增与删除）；日志已不完整时返回 None"""
+        if revision < self._changes_floor:
+            return None
+        return [card_id for changed, card_id in self._changes if changed > revision]
+
+    def ids(self):
+        """按顺序返回存活卡片的 ID 列表"""
+        if not self._deleted_count:
+            return self._ids.tolist()
+        return [card_id for card_id, deleted in zip(self._ids, self._deleted) if not deleted]
+
+    def _slot(self, card_id):
+        slot = bisect_left(self._ids, card_id)
+        if slot < len(self._ids) and self._ids[slot] == card_id and not self._deleted[slot]:
+            return slot
+        return None
+
+    def __contains__(self, card_id):
+        return self._slot(card_id) is not None
+
+    def append(self, question, answer):
+        """追加一张卡片，返回新卡片的 ID"""
+        card_id = self._next_id
+        self._next_id += 1
+        self._ids.append(card_id)
+        self._questions.append(question)
+        self._answers.append(answer)
+        self._deleted.append(0)
+        self._chars += len(question) + len(answer)
+        self.revision += 1
+        return card_id
+
+    def extend(self, flashcards):
+        """追加多张卡片（{'question', 'answer'} 字典），返回新卡片的 ID 列表"""
+        return [self.append(card['question'], card['answer']) for card in flashcards]
+
+    def get(self, card_id):
+        slot = self._slot(card_id)
+        if slot is None:
+            return None
+        return {'question': self._questions[slot], 'answer': self._answers[slot]}
+
+    def update(self, card_id, question, answer):
+        """修改卡片内容，卡片不存在时返回 False"""
+        slot = self._slot(card_id)
+        if slot is None:
+            return False
+        self._chars += len(question) + len(answer) - len(self._questions[slot]) - len(self._answers[slot])
+        self._questions[slot] = question
+        self._answers[slot] = answer
+        self.revision += 1
+        self._changes, self._changes_floor = log_change(self._changes, self._changes_floor, self.revision, card_id)
+        return True
+
+    def delete(self, card_id):
+        """删除卡片（只打标记），卡片不存在时返回 False"""
+        slot = self._slot(card_id)
+        if slot is None:
+            return False
+        self._deleted[slot] = 1
+        self._chars -= len(self._questions[slot]) + len(self._answers[slot])
+        # 释放字符串，压缩前也不再占用内存
+        self._questions[slot] = self._answers[slot] = ''
+        self._deleted_count += 1
+        self.revision += 1
+        if self._deleted_count > max(COMPACT_MIN_DELETED, len(self) * COMPACT_RATIO):
+            self.compact()
+        return True
+
+    def replace(self, flashcards):
+        """用 flashcards 替换全部卡片；新卡片的 ID 接着已分配的 ID 递增，旧 ID 不会被复用"""
+        revision = self.revision
+        self._ids = array('q')
+        self._questions = []
+        self._answers = []
+        self._deleted = bytearray()
+        self._deleted_count = 0
+        self._chars = 0
+        self.extend(flashcards)
+        self.revision = revision + 1
+        self._changes = []
+        self._changes_floor = self.revision
+
+    def compact(self):
+        """去掉已删除的槽位，卡片 ID 与顺序不变"""
+        if not self._deleted_count:
+            return
+        keep = [slot for slot, deleted in enumerate(self._deleted) if not deleted]
+        self._ids = array('q', [self._ids[slot] for slot in keep])
+        self._questions = [self._questions[slot] for slot in keep]
+        self._answers = [self._answers[slot] for slot in keep]
+        self._deleted = bytearray(len(keep))
+        self._deleted_count = 0
+
+    def id_at(self, index):
+        """第 index 张存活卡片的 ID（兼容按序号访问的接口），越界时返回 None"""
+        if not 0 <= index < len(self):
+            return None
+        # 槽位 = 序号 + 其前面的删除标记数；依次跳过删除标记（bytearray.find 在 C 层扫描），不需要压缩
+        slot = index
+        deleted = self._deleted.find(1)
+        while 0 <= deleted <= slot:
+            slot += 1
+            deleted = self._deleted.find(1, deleted + 1)
+        return self._ids[slot]
+
+    def estimate_size(self):
+        """粗略估算占用的字节数"""
+        return len(self._ids) * SLOT_OVERHEAD + self._chars
+
+    def to_dict(self):
+        """可 JSON 序列化的列式表示（用于 SQLite 会话存储）"""
+        self.compact()
+        return {'ids': self._ids.tolist(), 'questions': self._questions, 'answers': self._answers,
+                'next_id': self._next_id, 'revision': self.revision, 'epoch': self.epoch,
+                'changes': self._changes, 'changes_floor': self._changes_floor}
+
+    @classmethod
+    def from_dict(cls, data):
+        store = cls(next_id=data['next_id'])
+        store._ids = array('q', data['ids'])
+        store._questions = list(data['questions'])
+        store._answers = list(data['answers'])
+        store._deleted = bytearray(len(store._ids))
+        store._chars = sum(map(len, store._questions)) + sum(map(len, store._answers))
+        store.revision = data.get('revision', 0)
+        store.epoch = data.get('epoch', store.epoch)
+        store._changes = [tuple(change) for change in data.get('changes', [])]
+        store._changes_floor = data.get('changes_floor', store.revision)
+        return store
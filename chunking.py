@@ -0,0 +1,149 @@
+"""
+按 token 预算切分文本
+在段落/句子边界（含中文标点）处切分，把短段落打包到同一个请求中，可配置相邻块之间的重叠。
+token 数按字符类型估算：CJK 字符约 1 token/字，其他文字约 4 字符/token。
+"""
+
+import os
+import re
+
+from document_readers import DocumentChunk
+from metrics import timed_stage
+
+# 每个请求的目标 token 数与相邻块的重叠 token 数
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", "1200"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "0"))
+
+CHARS_PER_TOKEN = 4
+CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+# 句末标点（含中文标点及其后的引号/括号）或段落分隔（空行）
+SENTENCE_END = re.compile(
+    r'((?:[。！？；!?]+[”’"\'）)\]』」]*|\.{1,3}(?=\s)|;(?=\s))[ \t]*(?:\n\s*\n\s*|\n)?|\n\s*\n\s*)'
+)
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+def estimate_tokens(text):
+    """估算文本的 token 数"""
+    cjk = len(CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_units(text):
+    """
+    把文本切成句子单元，返回 [(文本, 是否段落结尾), ...]
+    单元保留原有的标点和空白，拼接后与原文一致；最后一个单元可能是不完整的句子
+    """
+    parts = SENTENCE_END.split(text)
+    units = []
+    for i in range(0, len(parts), 2):
+        delimiter = parts[i + 1] if i + 1 < len(parts) else ''
+        unit = parts[i] + delimiter
+        if unit:
+            units.append((unit, bool(PARAGRAPH_BREAK.search(delimiter))))
+    return units
+
+
+def split_oversized(text, max_tokens):
+    """把超出预算的单个句子按 token 预算硬切分，英文尽量在空白处断开"""
+    pieces = []
+    start = 0
+    while start < len(text):
+        end = start
+        tokens = 0
+        other = 0
+        while end < len(text):
+            if CJK_PATTERN.match(text[end]):
+                tokens += 1
+            else:
+                other += 1
+                if other == CHARS_PER_TOKEN:
+                    tokens += 1
+                    other = 0
+            if tokens >= max_tokens:
+                break
+            end += 1
+        if end < len(text):
+            space = text.rfind(' ', start + 1, end)
+            if space > start + (end - start) // 2:
+                end = space + 1
+        end = max(end, start + 1)
+        pieces.append(text[start:end])
+        start = end
+    return pieces
+
+
+class ChunkPacker:
+    """把句子单元贪心地打包成不超过 max_tokens 的块"""
+
+    def __init__(self, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+        self.max_tokens = max(1, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self.units = []
+        self.tokens = 0
+        self.fresh = False
+
+    def add(self, unit, paragraph_end=False):
+        """加入一个句子单元，产出已装满的块"""
+        unit_tokens = estimate_tokens(unit)
+        if unit_tokens > self.max_tokens:
+            for piece in split_oversized(unit, self.max_tokens):
+                yield from self.add(piece)
+            return
+        if self.fresh and self.tokens + unit_tokens > self.max_tokens:
+            yield self._emit()
+        self.units.append((unit, unit_tokens))
+        self.tokens += unit_tokens
+        self.fresh = True
+        # 块已接近装满时优先在段落边界结束
+        if paragraph_end and self.tokens >= self.max_tokens * 0.8:
+            yield self._emit()
+
+    def flush(self):
+        if self.fresh:
+            yield self._emit()
+
+    def _emit(self):
+        chunk = ''.join(unit for unit, _ in self.units)
+        # 保留末尾若干句作为下一块的重叠上下文
+        carried = []
+        carried_tokens = 0
+        for unit, tokens in reversed(self.units):
+            if carried_tokens + tokens > self.overlap_tokens:
+                break
+            carried.insert(0, (unit, tokens))
+            carried_tokens += tokens
+        self.units = carried
+        self.tokens = carried_tokens
+        self.fresh = False
+        return chunk
+
+
+def iter_token_chunks(chunks, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    把文本流（字符串或 DocumentChunk）切分成按 token 预算打包的块
+    跨页/幻灯片的句子会被拼接完整后再切分，只缓存最后一个未结束的句子
+    """
+    packer = ChunkPacker(max_tokens, overlap_tokens)
+    pending = ''
+    for chunk in chunks:
+        pending += chunk.text if isinstance(chunk, DocumentChunk) else chunk
+        units = split_units(pending)
+        pending = units.pop()[0] if units else ''
+        for unit, paragraph_end in units:
+            yield from packer.add(unit, paragraph_end)
+        # 没有句末标点的超长文本（如 OCR 结果）不再等待，直接按预算切分
+        if estimate_tokens(pending) > max_tokens:
+            yield from packer.add(pending)
+            pending = ''
+    if pending:
+        yield from packer.add(pending)
+    yield from packer.flush()
+
+
+@timed_stage('chunk_text')
+def chunk_text(text, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """把整段文本切分成块列表"""
+    return list(iter_token_chunks([text], max_tokens, overlap_tokens))
@@ -0,0 +1,162 @@
+"""
+闪卡去重
+1. 规范化文本（NFKC、大小写折叠、去掉标点和空白）后按哈希合并完全重复的卡片；
+2. 对剩余卡片的字符 n-gram（中文同样适用）计算 MinHash 签名，用 LSH 分桶只比较同桶的候选对，
+   签名相似度达到阈值的卡片视为近似重复；
+3. 答案相同的卡片再按问题文本的编辑相似度比较。短问句（尤其是中文）只换一个疑问词时
+   （"光合作用的场所是什么" / "光合作用的场所是哪里"），n-gram 的 Jaccard 相似度只有 0.4 左右，
+   LSH 找不到这类重复，问题的编辑相似度则为 0.8。只比较问题是因为共同的答案会抬高整卡文本的相似度，
+   "Who wrote Hamlet?" / "Who wrote Macbeth?" 连同答案 "Shakespeare" 会超过阈值，而问题本身只有 0.76。
+
+MinHash 使用单次哈希分桶（one permutation hashing），每个 n-gram 只哈希一次，
+总耗时与卡片数近似线性，10 万张卡片也不需要两两比较。每组重复卡片保留最先出现的一张。
+
+环境变量:
+  DEDUPE_THRESHOLD  近似重复的相似度阈值 (默认: 0.8)
+  DEDUPE_ENABLED    生成后是否自动去重 (默认: 1)
+"""
+
+import os
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+DEDUPE_THRESHOLD = float(os.environ.get("DEDUPE_THRESHOLD", "0.8"))
+DEDUPE_ENABLED = os.environ.get("DEDUPE_ENABLED", "1") not in ('0', 'false', 'no')
+
+SHINGLE_SIZE = 3
+NUM_BINS = 64
+# 8 个 band × 8 行：相似度约 0.77 以上的卡片几乎总会落入同一个桶
+LSH_BANDS = 8
+LSH_ROWS = NUM_BINS // LSH_BANDS
+# 每张卡片在单个桶内最多比较的候选数，避免大量卡片共用同一个桶时退化为平方复杂度
+MAX_BUCKET_CHECKS = 32
+# 按答案比较时只处理每个答案最先出现的若干张卡片：很多卡片共用的答案（"是"、"正确"）不说明它们重复
+SAME_ANSWER_CHECKS = 8
+
+NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize_text(text):
+    """NFKC 规范化、大小写折叠，并去掉标点与空白"""
+    return NON_WORD.sub('', unicodedata.normalize('NFKC', text).casefold())
+
+
+def card_text(card):
+    return normalize_text(card['question']) + '\x1f' + normalize_text(card['answer'])
+
+
+def edit_similar(a, b, threshold):
+    """编辑相似度 2M/T（difflib）是否达到阈值，先用长度与字符计数给出的上界排除明显不相似的文本"""
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    return (matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold
+            and matcher.ratio() >= threshold)
+
+
+# 预先构造的切片对象，用 map 在 C 层完成 n-gram 切分
+_SLICES = [slice(i, i + SHINGLE_SIZE) for i in range(4096)]
+
+
+def shingles(text):
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    count = len(text) - SHINGLE_SIZE + 1
+    if count > len(_SLICES):
+        return {text[i:i + SHINGLE_SIZE] for i in range(count)}
+    return set(map(text.__getitem__, _SLICES[:count]))
+
+
+def minhash_signature(text):
+    """
+    单次哈希分桶的 MinHash 签名：按 n-gram 哈希值分到 NUM_BINS 个桶，每桶取最小哈希，
+    没有 n-gram 落入的桶为 None（估计相似度时不计入）
+    """
+    # 同一桶内哈希值按降序写入，最后留下的就是最小值
+    bins = {h % NUM_BINS: h for h in sorted(map(hash, shingles(text)), reverse=True)}
+    return list(map(bins.get, range(NUM_BINS)))
+
+
+def signature_similarity(a, b):
+    """估计两个签名对应 n-gram 集合的 Jaccard 相似度，两边都为空的桶不计入"""
+    matched = occupied = 0
+    for x, y in zip(a, b):
+        if x is not None or y is not None:
+            occupied += 1
+            matched += x == y
+    return matched / occupied if occupied else 0.0
+
+
+class _DisjointSet:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # 以较早出现的卡片为根，保证每组保留第一张
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def find_duplicate_groups(flashcards, threshold=DEDUPE_THRESHOLD):
+    """返回重复卡片的序号分组 [[i, j, ...], ...]，每组按出现顺序排列且至少两张"""
+    groups = _DisjointSet(len(flashcards))
+
+    # 完全重复：规范化文本相同
+    first_seen = {}
+    for i, card in enumerate(flashcards):
+        text = card_text(card)
+        if text in first_seen:
+            groups.union(first_seen[text], i)
+        else:
+            first_seen[text] = i
+
+    # 近似重复：只在代表卡片之间做 LSH
+    if threshold < 1:
+        signatures = {}
+        buckets = {}
+        for text, i in first_seen.items():
+            if len(text) <= 1:
+                continue
+            signature = minhash_signature(text)
+            signatures[i] = signature
+            for band, rows in enumerate(zip(*[iter(signature)] * LSH_ROWS)):
+                # 全空的 band 不携带信息，跳过以免短文本都挤进同一个桶
+                if rows.count(None) == LSH_ROWS:
+                    continue
+                members = buckets.setdefault((band, rows), [])
+                for j in members[:MAX_BUCKET_CHECKS]:
+                    if groups.find(i) != groups.find(j) and signature_similarity(signature, signatures[j]) >= threshold:
+                        groups.union(i, j)
+                members.append(i)
+
+        # 答案相同的卡片按问题的编辑相似度比较
+        same_answer = {}
+        for text, i in first_seen.items():
+            question, _, answer = text.partition('\x1f')
+            if not answer:
+                continue
+            members = same_answer.setdefault(answer, [])
+            if len(members) >= SAME_ANSWER_CHECKS:
+                continue
+            for j, other in members:
+                if groups.find(i) != groups.find(j) and edit_similar(question, other, threshold):
+                    groups.union(i, j)
+            members.append((i, question))
+
+    clusters = {}
+    for i in range(len(flashcards)):
+        clusters.setdefault(groups.find(i), []).append(i)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+def dedupe_flashcards(flashcards, threshold=DEDUPE_THRESHOLD):
+    """去掉重复卡片，返回 (保留的卡片列表, 重复分组)，每组保留最先出现的一张"""
+    duplicate_groups = find_duplicate_groups(flashcards, threshold)
+    removed = {i for members in duplicate_groups for i in members[1:]}
+    return [card for i, card in enumerate(flashcards) if i not in removed], duplicate_groups
@@ -0,0 +1,205 @@
+"""
+统一的文档读取接口
+每种格式都提供一个生成器，按页/幻灯片逐块产出 DocumentChunk（文本 + 来源信息），
+调用方可以边提取边处理，内存占用只与当前窗口有关，而不是整个文档。
+"""
+
+import os
+import hashlib
+import subprocess
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+from pdf_extraction import iter_pdf_pages
+from extraction_cache import get_extraction_cache, hash_file
+from libreoffice_pool import get_office_pool
+from metrics import timed_iter
+
+try:
+    from pptx import Presentation
+    PPTX_AVAILABLE = True
+except ImportError:
+    PPTX_AVAILABLE = False
+
+# text: 该页/幻灯片的文本; source: 文件名; page / slide: 页码或幻灯片编号（从 1 开始，不适用时为 None）
+# key: 页面内容指纹（使用提取缓存时才有）
+DocumentChunk = namedtuple('DocumentChunk', ['text', 'source', 'page', 'slide', 'key'], defaults=(None,))
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.pptx', '.ppt', '.txt')
+
+# 读取纯文本文件时每块的字符数
+TEXT_BLOCK_SIZE = 64 * 1024
+# PDF 页面之间的分隔符（追加在每页文本之后；提取缓存中保存的是不含分隔符的页面文本）
+PAGE_SEPARATOR = " "
+
+
+def iter_pdf(file_path, max_workers=None, cache=None):
+    """逐页产出 PDF 文本（页面并行提取，没有文本的页面自动 OCR；传入 cache 时按页复用提取结果）"""
+    source = os.path.basename(file_path)
+    cache_path = cache.path if cache is not None else None
+    for page_number, text, key in iter_pdf_pages(file_path, max_workers=max_workers, cache_path=cache_path):
+        if text:
+            yield DocumentChunk(text + PAGE_SEPARATOR, source, page_number, None, key)
+
+
+def iter_pptx(file_path, source=None, cache=None):
+    """逐张幻灯片产出 PPTX 文本（传入 cache 时按幻灯片 XML 内容复用提取结果）"""
+    source = source or os.path.basename(file_path)
+    try:
+        presentation = Presentation(file_path)
+        total_chars = 0
+        for slide_num, slide in enumerate(presentation.slides, 1):
+            key = hashlib.sha256(slide.part.blob).hexdigest() if cache is not None else None
+            text = cache.get_page(key) if key else None
+            if text is None:
+                text = "".join(shape.text + " " for shape in slide.shapes if hasattr(shape, "text"))
+                if key:
+                    cache.put_page(key, text)
+            total_chars += len(text)
+            yield DocumentChunk(text, source, None, slide_num, key)
+        print(f"PPTX extraction completed: {total_chars} characters extracted from {len(presentation.slides)} slides")
+    except Exception as e:
+        print(f"PPTX processing failed: {e}")
+
+
+def convert_ppt_to_pptx(file_path, output_dir):
+    """把 .ppt 转换为 .pptx 写入 output_dir，返回转换后的文件路径，失败时返回 None"""
+    converted_file = os.path.join(output_dir, os.path.splitext(os.path.basename(file_path))[0] + '.pptx')
+
+    # Preferred: hand the job to a warm LibreOffice listener
+    pool = get_office_pool()
+    if pool is not None and pool.convert(file_path, output_dir) == converted_file:
+        print("PPT conversion successful using LibreOffice pool")
+        return converted_file
+
+    # Try conversion method 1: unoconv
+    try:
+        subprocess.run(['unoconv', '-f', 'pptx', '-o', converted_file, file_path],
+                       check=True, capture_output=True, timeout=30)
+        if os.path.exists(converted_file):
+            print("PPT conversion successful using unoconv")
+            return converted_file
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+        pass
+
+    # Try conversion method 2: libreoffice soffice
+    try:
+        subprocess.run(['soffice', '--headless', '--convert-to', 'pptx', '--outdir', output_dir, file_path],
+                       check=True, capture_output=True, timeout=30)
+        if os.path.exists(converted_file):
+            print("PPT conversion successful using soffice")
+            return converted_file
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+        pass
+
+    return None
+
+
+def iter_ppt_xml_slides(file_path, source):
+    """Fallback: 直接从 ZIP 包中的幻灯片 XML 提取文本"""
+    try:
+        with zipfile.ZipFile(file_path, 'r') as zip_ref:
+            # Try to find slide files
+            slide_files = [f for f in zip_ref.namelist() if f.startswith('ppt/slides/slide') and f.endswith('.xml')]
+            for slide_num, slide_file in enumerate(sorted(slide_files), 1):
+                try:
+                    with zip_ref.open(slide_file) as xml_file:
+                        root = ET.fromstring(xml_file.read())
+                    # Extract all text elements from the slide
+                    text = "".join(elem.text + " " for elem in root.iter() if elem.text)
+                except Exception:
+                    continue
+                if text.strip():
+                    yield DocumentChunk(text, source, None, slide_num)
+    except (zipfile.BadZipFile, Exception):
+        pass
+
+
+def iter_ppt(file_path):
+    """逐张幻灯片产出 PowerPoint 97-2003 (.ppt) 文本，转换结果放在独立的临时目录中"""
+    source = os.path.basename(file_path)
+    try:
+        with tempfile.TemporaryDirectory(prefix='ppt_convert_') as temp_dir:
+            converted_file = convert_ppt_to_pptx(file_path, temp_dir)
+            if converted_file and PPTX_AVAILABLE:
+                yield from iter_pptx(converted_file, source)
+                return
+
+        found = False
+        for chunk in iter_ppt_xml_slides(file_path, source):
+            found = True
+            yield chunk
+        if found:
+            print("PPT extraction completed using zipfile")
+            return
+
+        print("Warning: Could not parse PPT file.")
+        print("Recommended solutions:")
+        print("  1. Convert PPT to PPTX manually and use the PPTX file")
+        print("  2. Install unoconv: pip install unoconv (Linux/Mac)")
+        print("  3. Install LibreOffice: sudo apt-get install libreoffice (Linux)")
+    except Exception as e:
+        print(f"PPT processing failed: {e}")
+
+
+def iter_text_file(file_path):
+    """按固定大小分块产出纯文本文件内容"""
+    source = os.path.basename(file_path)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        while True:
+            block = f.read(TEXT_BLOCK_SIZE)
+            if not block:
+                break
+            yield DocumentChunk(block, source, None, None)
+
+
+def iter_document(file_path, max_workers=None, cache=None):
+    """根据扩展名选择读取器，逐块产出文档内容（读取耗时记为 read_<扩展名> 阶段）"""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == '.pdf':
+        return timed_iter('read_pdf', iter_pdf(file_path, max_workers=max_workers, cache=cache))
+    if ext == '.pptx':
+        if not PPTX_AVAILABLE:
+            raise RuntimeError("python-pptx not installed. Install with: pip install python-pptx")
+        return timed_iter('read_pptx', iter_pptx(file_path, cache=cache))
+    if ext == '.ppt':
+        return timed_iter('read_ppt', iter_ppt(file_path))
+    if ext == '.txt':
+        return timed_iter('read_txt', iter_text_file(file_path))
+    raise ValueError(f"Unsupported file type: {ext}")
+
+
+def iter_document_cached(file_path, file_hash=None, max_workers=None):
+    """
+    带提取缓存的 iter_document
+    file_hash 为文件内容的 SHA-256（上传时边保存边计算，未提供时读取文件计算）；
+    同一文件再次读取时直接从缓存产出，内容部分变化的文件只重新提取变化的页面/幻灯片
+    """
+    cache = get_extraction_cache()
+    if cache is None or file_path.lower().endswith('.txt'):
+        yield from iter_document(file_path, max_workers=max_workers)
+        return
+
+    source = os.path.basename(file_path)
+    file_hash = file_hash or hash_file(file_path)
+    cached = cache.get_document(file_hash)
+    if cached is not None:
+        print(f"Extraction cache hit: {source}")
+        for text, page, slide in cached:
+            # PDF 页面缓存的是原始页面文本，与 iter_pdf 一样在页尾补上分隔符
+            yield DocumentChunk(text + PAGE_SEPARATOR if page is not None else text, source, page, slide)
+        return
+
+    entries = []
+    for chunk in iter_document(file_path, max_workers=max_workers, cache=cache):
+        key = chunk.key
+        if key is None:
+            # 没有指纹的页面按内容缓存，PDF 页面同样只保存不含分隔符的文本
+            text = chunk.text[:-len(PAGE_SEPARATOR)] if chunk.page is not None else chunk.text
+            key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+            cache.put_page(key, text)
+        entries.append((key, chunk.page, chunk.slide))
+        yield chunk
+    cache.put_document(file_hash, entries)
@@ -0,0 +1,191 @@
+"""
+流式导出
+每种文本格式是一个编码器（header / encode(一批卡片) / footer），导出时按批次产出 UTF-8 字节块：
+- iter_export: 单一格式的字节流，可直接作为 HTTP 分块响应发送；
+- iter_export_zip: 把多种格式打包为 zip 字节流，每个条目边编码边压缩边产出；
+- write_exports: 一次遍历卡片同时写出多个文件（CLI 的 -f all）。
+写文件时先写入 <路径>.part，全部成功后再改名为目标文件，导出失败不会留下空的或不完整的输出文件。
+apkg 格式由 apkg_export.iter_apkg 生成。
+"""
+
+import io
+import os
+import csv
+import json
+import time
+import textwrap
+from itertools import islice
+from collections.abc import Sequence
+from contextlib import ExitStack, contextmanager
+
+from zip_stream import iter_zip
+from metrics import STAGE_SECONDS
+
+# 每批编码的卡片数
+EXPORT_BATCH_SIZE = 1000
+
+
+class JsonEncoder:
+    """与 json.dump(flashcards, indent=4, ensure_ascii=False) 的输出相同"""
+    extension = 'json'
+    mimetype = 'application/json'
+
+    def __init__(self):
+        self.count = 0
+
+    def header(self):
+        return ''
+
+    def encode(self, cards):
+        parts = []
+        for card in cards:
+            parts.append('[\n' if self.count == 0 else ',\n')
+            parts.append(textwrap.indent(json.dumps(card, ensure_ascii=False, indent=4), '    '))
+            self.count += 1
+        return ''.join(parts)
+
+    def footer(self):
+        return '\n]' if self.count else '[]'
+
+
+class TxtEncoder:
+    """Anki 可导入的 TXT 格式（分号分隔）"""
+    extension = 'txt'
+    mimetype = 'text/plain'
+
+    def header(self):
+        return ''
+
+    def encode(self, cards):
+        return ''.join(
+            f"{card['question'].replace(chr(10), ' ').replace(';', '；')};"
+            f"{card['answer'].replace(chr(10), ' ').replace(';', '；')}\n"
+            for card in cards
+        )
+
+    def footer(self):
+        return ''
+
+
+class TsvEncoder:
+    """Anki 可导入的 TSV 格式（制表符分隔，换行转为 <br>）"""
+    extension = 'tsv'
+    mimetype = 'text/tab-separated-values'
+
+    def header(self):
+        return ''
+
+    def encode(self, cards):
+        return ''.join(
+            f"{card['question'].replace(chr(10), '<br>').replace(chr(9), ' ')}\t"
+            f"{card['answer'].replace(chr(10), '<br>').replace(chr(9), ' ')}\n"
+            for card in cards
+        )
+
+    def footer(self):
+        return ''
+
+
+class CsvEncoder:
+    """带 Front/Back 表头的 CSV 格式"""
+    extension = 'csv'
+    mimetype = 'text/csv'
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _drain(self):
+        text = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return text
+
+    def header(self):
+        self._writer.writerow(['Front', 'Back'])
+        return self._drain()
+
+    def encode(self, cards):
+        self._writer.writerows([card['question'].replace('\n', '<br>'), card['answer'].replace('\n', '<br>')]
+                               for card in cards)
+        return self._drain()
+
+    def footer(self):
+        return ''
+
+
+ENCODERS = {encoder.extension: encoder for encoder in (JsonEncoder, TxtEncoder, TsvEncoder, CsvEncoder)}
+TEXT_FORMATS = tuple(ENCODERS)
+
+
+def iter_batches(flashcards, batch_size=EXPORT_BATCH_SIZE):
+    """按批产出卡片，flashcards 可以是列表或任意可迭代对象（如 json_stream.iter_flashcards）"""
+    iterator = iter(flashcards)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_encoded(flashcards, formats):
+    """
+    一次遍历卡片，同时驱动多个编码器，产出 (格式, 字节块)
+    每种格式的字节块按顺序拼接即为完整文件
+    """
+    encoders = {fmt: ENCODERS[fmt]() for fmt in formats}
+    # 每种格式只累计编码本身的耗时，不含读取卡片和调用方写出字节的时间
+    elapsed = dict.fromkeys(encoders, 0.0)
+    try:
+        for fmt, encoder in encoders.items():
+            yield fmt, encoder.header().encode('utf-8')
+        for batch in iter_batches(flashcards):
+            for fmt, encoder in encoders.items():
+                start = time.perf_counter()
+                chunk = encoder.encode(batch).encode('utf-8')
+                elapsed[fmt] += time.perf_counter() - start
+                yield fmt, chunk
+        for fmt, encoder in encoders.items():
+            yield fmt, encoder.footer().encode('utf-8')
+    finally:
+        for fmt, seconds in elapsed.items():
+            STAGE_SECONDS.observe(seconds, stage=f'export_{fmt}')
+
+
+def iter_export(flashcards, fmt):
+    """单一文本格式的导出字节流"""
+    for _, chunk in iter_encoded(flashcards, [fmt]):
+        if chunk:
+            yield chunk
+
+
+def iter_export_zip(flashcards, base_name, formats=TEXT_FORMATS):
+    """
+    产出包含 <base_name>_anki.<格式> 各文件的 zip 字节流
+    zip 条目必须连续存放，为了让每个条目直接流式发送而不先缓存，每种格式各遍历一次卡片
+    （flashcards 不是序列时先转为列表）
+    """
+    cards = flashcards if isinstance(flashcards, Sequence) else list(flashcards)
+    yield from iter_zip((f"{base_name}_anki.{fmt}", iter_export(cards, fmt)) for fmt in formats)
+
+
+@contextmanager
+def open_output(path):
+    """以二进制写方式打开 path 对应的 .part 临时文件，正常退出时改名为 path，出错时删除临时文件"""
+    part_path = f"{path}.part"
+    try:
+        with open(part_path, 'wb') as f:
+            yield f
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+
+def write_exports(flashcards, paths):
+    """paths: {格式: 输出路径}；一次遍历卡片写出全部文件，任一格式失败时不产生任何输出文件"""
+    with ExitStack() as stack:
+        files = {fmt: stack.enter_context(open_output(path)) for fmt, path in paths.items()}
+        for fmt, chunk in iter_encoded(flashcards, list(paths)):
+            files[fmt].write(chunk)
@@ -0,0 +1,158 @@
+"""
+文档提取结果缓存
+- 以上传文件的内容哈希为键记录整份文档的页面列表，重复上传同一文件时直接返回缓存文本；
+- 以页面内容指纹为键缓存每一页的文本，文件只有少数页面变化时只重新提取这些页面；
+- 与 LLM 响应缓存一样按大小和时间淘汰：超出上限时按最近访问时间删除页面，再删除引用了已删除页面的文档记录。
+
+环境变量:
+  EXTRACTION_CACHE_PATH       缓存文件路径 (默认: <项目目录>/.cache/extraction_cache.sqlite3)
+  EXTRACTION_CACHE_MAX_BYTES  缓存页面文本的最大字节数 (默认: 512MB)
+  EXTRACTION_CACHE_TTL        缓存有效期（秒，按最近访问时间计），0 表示永不过期 (默认: 30 天)
+  EXTRACTION_CACHE_DISABLED   设为 1 时不使用缓存
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+ROOT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(ROOT_DIRECTORY, '.cache', 'extraction_cache.sqlite3')
+# 工作进程按路径创建实例，上限从环境变量读取，与主进程一致
+DEFAULT_MAX_BYTES = int(os.environ.get('EXTRACTION_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+DEFAULT_TTL = float(os.environ.get('EXTRACTION_CACHE_TTL', 30 * 24 * 3600))
+
+# 流式保存/哈希上传文件时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def save_stream_with_hash(stream, file_path):
+    """把上传流分块写入文件，同时计算 SHA-256，返回十六进制哈希"""
+    sha = hashlib.sha256()
+    with open(file_path, 'wb') as f:
+        for block in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+            sha.update(block)
+            f.write(block)
+    return sha.hexdigest()
+
+
+class ExtractionCache:
+    """SQLite 提取缓存，进程池中的工作进程各自打开连接；淘汰在主进程写入文档记录时进行"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS documents ('
+                         ' file_hash TEXT PRIMARY KEY, entries TEXT NOT NULL, created_at REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS pages (page_key TEXT PRIMARY KEY, text TEXT NOT NULL)')
+            # 早期版本的缓存文件没有大小和访问时间列
+            columns = {
+                'documents': {'accessed_at': 'REAL NOT NULL DEFAULT 0'},
+                'pages': {'size': 'INTEGER NOT NULL DEFAULT 0', 'accessed_at': 'REAL NOT NULL DEFAULT 0'},
+            }
+            for table, added in columns.items():
+                existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+                for column, definition in added.items():
+                    if column not in existing:
+                        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_pages_accessed ON pages(accessed_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_documents_accessed ON documents(accessed_at)')
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def get_page(self, page_key):
+        conn = self._connect()
+        row = conn.execute('SELECT text FROM pages WHERE page_key = ?', (page_key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE pages SET accessed_at = ? WHERE page_key = ?', (time.time(), page_key))
+        conn.commit()
+        return row[0]
+
+    def put_page(self, page_key, text):
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO pages (page_key, text, size, accessed_at) VALUES (?, ?, ?, ?)',
+                     (page_key, text, len(text.encode('utf-8')), time.time()))
+        conn.commit()
+
+    def get_document(self, file_hash):
+        """返回 [(text, page, slide), ...]，未缓存或页面缺失时返回 None"""
+        conn = self._connect()
+        row = conn.execute('SELECT entries FROM documents WHERE file_hash = ?', (file_hash,)).fetchone()
+        if row is None:
+            return None
+        chunks = []
+        for page_key, page, slide in json.loads(row[0]):
+            text = self.get_page(page_key)
+            if text is None:
+                return None
+            chunks.append((text, page, slide))
+        conn.execute('UPDATE documents SET accessed_at = ? WHERE file_hash = ?', (time.time(), file_hash))
+        conn.commit()
+        return chunks
+
+    def put_document(self, file_hash, entries):
+        """entries: [(page_key, page, slide), ...]，按文档顺序"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('INSERT OR REPLACE INTO documents (file_hash, entries, created_at, accessed_at) '
+                     'VALUES (?, ?, ?, ?)', (file_hash, json.dumps(entries), now, now))
+        conn.commit()
+        self.evict()
+
+    def evict(self):
+        """删除过期和超出大小上限的页面（按最近访问时间从旧到新），以及最近访问早于被删页面的文档记录"""
+        conn = self._connect()
+        now = time.time()
+        cutoff = now - self.ttl if self.ttl else 0
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM pages WHERE accessed_at >= ?', (cutoff,)).fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            freed = 0
+            for accessed_at, size in conn.execute(
+                    'SELECT accessed_at, size FROM pages WHERE accessed_at >= ? ORDER BY accessed_at', (cutoff,)):
+                freed += size
+                cutoff = accessed_at
+                if freed >= excess:
+                    break
+            conn.execute('DELETE FROM pages WHERE accessed_at <= ?', (cutoff,))
+        elif cutoff:
+            conn.execute('DELETE FROM pages WHERE accessed_at < ?', (cutoff,))
+        # 文档读取时会同时更新其页面的访问时间，更早的文档记录引用的页面已被删除
+        conn.execute('DELETE FROM documents WHERE accessed_at < ?', (cutoff,))
+        conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_extraction_cache():
+    """获取共享的提取缓存实例；EXTRACTION_CACHE_DISABLED=1 时返回 None"""
+    global _cache
+    if os.environ.get('EXTRACTION_CACHE_DISABLED', '') in ('1', 'true', 'yes'):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExtractionCache(os.environ.get('EXTRACTION_CACHE_PATH', DEFAULT_CACHE_PATH))
+        return _cache
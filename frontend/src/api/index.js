@@ -14,6 +14,8 @@ api.interceptors.response.use(
   }
 )
 
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms))
+
 export default {
   healthCheck() {
     return api.get('/health')
@@ -32,8 +34,54 @@ export default {
     return api.post('/generate', { session_id: sessionId, text })
   },
 
-  getFlashcards(sessionId) {
-    return api.get('/flashcards', { params: { session_id: sessionId } })
+  // 通过 SSE 流式生成闪卡，每收到一张卡片调用一次 onCard，结束时返回 { session_id, count }
+  async streamFlashcards(sessionId, text, onCard) {
+    const response = await fetch('/api/generate/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+      body: JSON.stringify({ session_id: sessionId, text })
+    })
+    if (!response.ok) {
+      const data = await response.json().catch(() => ({}))
+      throw new Error(data.error || '请求失败')
+    }
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+    let buffer = ''
+    let result = null
+    for (;;) {
+      const { value, done } = await reader.read()
+      if (done) break
+      buffer += value
+      let boundary
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const message = buffer.slice(0, boundary)
+        buffer = buffer.slice(boundary + 2)
+        const event = (message.match(/^event: (.*)$/m) || [])[1]
+        const data = JSON.parse((message.match(/^data: (.*)$/m) || [])[1] || '{}')
+        if (event === 'card') onCard && onCard({ question: data.question, answer: data.answer })
+        else if (event === 'error') throw new Error(data.error)
+        else if (event === 'done') result = data
+      }
+    }
+    return result
+  },
+
+  // params 可包含 limit、cursor、fields、q、match，见 GET /api/flashcards
+  getFlashcards(sessionId, params = {}) {
+    return api.get('/flashcards', { params: { session_id: sessionId, ...params } })
+  },
+
+  // 按游标分页读取全部闪卡，first 为已拿到的第一页（如 parseText 的返回值）
+  async getAllFlashcards(sessionId, first = null, pageSize = 1000) {
+    const page = first || await this.getFlashcards(sessionId, { limit: pageSize })
+    const cards = [...page.flashcards]
+    let cursor = page.next_cursor
+    while (cursor != null) {
+      const next = await this.getFlashcards(sessionId, { limit: pageSize, cursor })
+      cards.push(...next.flashcards)
+      cursor = next.next_cursor
+    }
+    return cards
   },
 
   saveFlashcards(sessionId, flashcards) {
@@ -48,6 +96,19 @@ export default {
     return api.delete(`/flashcards/${index}`, { params: { session_id: sessionId } })
   },
 
+  updateFlashcardById(sessionId, id, question, answer) {
+    return api.put(`/flashcards/id/${id}`, { session_id: sessionId, question, answer })
+  },
+
+  deleteFlashcardById(sessionId, id) {
+    return api.delete(`/flashcards/id/${id}`, { params: { session_id: sessionId } })
+  },
+
+  // operations: [{ op: 'add'|'update'|'delete', id?, question?, answer? }]，版本冲突时请求以 409 失败
+  batchEditFlashcards(sessionId, operations, baseRevision = null) {
+    return api.patch('/flashcards/batch', { session_id: sessionId, operations, base_revision: baseRevision })
+  },
+
   addFlashcard(sessionId, question, answer) {
     return api.post('/flashcards/add', { session_id: sessionId, question, answer })
   },
@@ -56,6 +117,30 @@ export default {
     return api.post('/enhance', { session_id: sessionId, indices })
   },
 
+  dedupeFlashcards(sessionId, threshold) {
+    return api.post('/dedupe', { session_id: sessionId, threshold })
+  },
+
+  getJob(jobId) {
+    return api.get(`/jobs/${jobId}`)
+  },
+
+  cancelJob(jobId) {
+    return api.delete(`/jobs/${jobId}`)
+  },
+
+  // 轮询后台任务直到结束，onProgress 会收到每次的任务状态（含部分结果）
+  async waitForJob(jobId, onProgress, interval = 1000) {
+    for (;;) {
+      const job = await this.getJob(jobId)
+      onProgress && onProgress(job)
+      if (job.status === 'completed') return job
+      if (job.status === 'failed') throw new Error(job.error || '任务失败')
+      if (job.status === 'cancelled') throw new Error('任务已取消')
+      await sleep(interval)
+    }
+  },
+
   exportFlashcards(sessionId, format) {
     return api.post('/export', { session_id: sessionId, format }, { responseType: 'blob' })
   },
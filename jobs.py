@@ -0,0 +1,149 @@
+"""
+后台任务队列
+把耗时的 LLM 调用（生成、增强）放到有界线程池中执行，HTTP 请求立即返回任务 ID，
+客户端通过任务 ID 轮询状态、进度和部分结果，并可取消任务。
+"""
+
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 后台执行器的线程数与最多排队的任务数
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+MAX_PENDING_JOBS = int(os.environ.get("MAX_PENDING_JOBS", "64"))
+# 已结束任务的保留时间（秒）
+JOB_RETENTION = int(os.environ.get("JOB_RETENTION", "3600"))
+
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class QueueFullError(Exception):
+    """排队任务数已达上限"""
+
+
+class Job:
+    """一个后台任务：记录状态、进度 (done/total) 以及按段落序号保存的部分结果"""
+
+    def __init__(self, kind, session_id=None):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.session_id = session_id
+        self.status = PENDING
+        self.done = 0
+        self.total = 0
+        self.error = None
+        self.result = None
+        # 任务的 token 用量（token_budget.TokenBudget.report()），未调用 API 的任务为 None
+        self.usage = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self._partial = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def set_total(self, total):
+        with self._lock:
+            self.total = total
+
+    def add_partial(self, index, items, done=None):
+        """保存第 index 段的结果；done 为已完成段数（默认加一）"""
+        with self._lock:
+            self._partial[index] = items
+            self.done = done if done is not None else self.done + 1
+
+    def partial_results(self):
+        """按段落顺序合并已完成的部分结果"""
+        with self._lock:
+            merged = []
+            for index in sorted(self._partial):
+                merged.extend(self._partial[index])
+            return merged
+
+    def to_dict(self, include_results=True):
+        with self._lock:
+            data = {
+                'job_id': self.id,
+                'kind': self.kind,
+                'session_id': self.session_id,
+                'status': self.status,
+                'progress': {'done': self.done, 'total': self.total},
+                'error': self.error,
+                'usage': self.usage,
+            }
+        if include_results:
+            results = self.result if self.status == COMPLETED and self.result is not None else self.partial_results()
+            data['results'] = results
+            data['count'] = len(results)
+        return data
+
+
+class JobManager:
+    """有界后台执行器 + 任务登记表"""
+
+    def __init__(self, max_workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS, retention=JOB_RETENTION):
+        self.max_pending = max_pending
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, func, *args, session_id=None):
+        """
+        提交任务，func(job, *args) 在后台线程中执行，其返回值作为最终结果
+        排队任务过多时抛出 QueueFullError
+        """
+        with self._lock:
+            self._prune()
+            active = sum(1 for job in self._jobs.values() if job.status not in FINISHED_STATES)
+            if active >= self.max_pending:
+                raise QueueFullError(f"排队任务已达上限 ({self.max_pending})")
+            job = Job(kind, session_id)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func, args)
+        return job
+
+    def _run(self, job, func, args):
+        if job.cancelled:
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        try:
+            result = func(job, *args)
+            job.result = result
+            self._finish(job, CANCELLED if job.cancelled else COMPLETED)
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, FAILED)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+
+    def _prune(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at and now - job.finished_at > self.retention]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """请求取消任务，返回任务对象（不存在时返回 None）"""
+        job = self.get(job_id)
+        if job and job.status not in FINISHED_STATES:
+            job.cancel_event.set()
+        return job
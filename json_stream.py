@@ -0,0 +1,163 @@
+"""
+流式读取闪卡 JSON 文件
+支持 JSON 数组（[{...}, {...}]）与 JSON Lines（每行一个对象），逐张产出卡片，内存占用与文件大小无关。
+安装了 ijson 时用它解析 JSON 数组，否则使用基于 json.JSONDecoder.raw_decode 的增量解析。
+格式不正确的卡片不会逐条打印警告，而是记录在 ValidationReport 中，读取结束后统一汇总。
+"""
+
+import json
+
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+# 每次从文件读取的字符数与单个数组元素允许的最大长度
+READ_BLOCK_SIZE = 1024 * 1024
+MAX_ELEMENT_CHARS = 16 * 1024 * 1024
+# 汇总警告中列出的示例数
+MAX_REPORTED_ISSUES = 5
+
+WHITESPACE = ' \t\n\r'
+
+
+class JsonStreamError(ValueError):
+    """文件不是 JSON 数组 / JSON Lines，或数组在中途损坏"""
+
+
+class ValidationReport:
+    """收集被跳过的卡片，只保留前几条示例"""
+
+    def __init__(self):
+        self.skipped = 0
+        self.examples = []
+
+    def add(self, position, reason):
+        self.skipped += 1
+        if len(self.examples) < MAX_REPORTED_ISSUES:
+            self.examples.append(f"{position}: {reason}")
+
+    def summary(self):
+        if not self.skipped:
+            return None
+        more = " 等" if self.skipped > len(self.examples) else ""
+        return f"警告: 已跳过 {self.skipped} 张格式不正确的卡片（{'; '.join(self.examples)}{more}）"
+
+
+class _ArrayReader:
+    """在分块读取的文本上增量解析 JSON 数组，逐个产出元素"""
+
+    def __init__(self, f):
+        self.f = f
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        block = self.f.read(READ_BLOCK_SIZE)
+        if not block:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + block
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """跳过空白，返回下一个字符（文件结束时返回空字符串）"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def _expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise JsonStreamError(f"expected one of {chars!r}, got {char or 'end of file'!r}")
+        self.pos += 1
+        return char
+
+    def _decode(self):
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # 值恰好在缓冲区末尾结束时（如被截断的数字）再读一块确认
+                if end < len(self.buffer) or self.eof or not self._fill():
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if len(self.buffer) - self.pos > MAX_ELEMENT_CHARS:
+                    raise JsonStreamError(f"array element too large or malformed: {e.msg}") from e
+                if not self._fill():
+                    raise JsonStreamError(f"malformed JSON array: {e.msg}") from e
+
+    def __iter__(self):
+        self._expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            self.peek()
+            yield self._decode()
+            if self._expect(',]') == ']':
+                return
+
+
+def _iter_array_ijson(path):
+    with open(path, 'rb') as f:
+        if f.read(3) != b'\xef\xbb\xbf':
+            f.seek(0)
+        try:
+            yield from ijson.items(f, 'item')
+        except ijson.JSONError as e:
+            raise JsonStreamError(f"malformed JSON array: {e}") from e
+
+
+def detect_format(path):
+    """根据第一个非空白字符判断文件格式：'array'、'jsonl' 或 None"""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        while True:
+            block = f.read(4096)
+            if not block:
+                return None
+            stripped = block.lstrip(WHITESPACE)
+            if stripped:
+                return {'[': 'array', '{': 'jsonl'}.get(stripped[0])
+
+
+def iter_json_records(path, report=None):
+    """
+    逐条产出文件中的原始记录：JSON 数组逐个元素产出，JSON Lines 逐行产出（无法解析的行记入 report）
+    文件既不是 JSON 数组也不是 JSON Lines 时抛出 JsonStreamError
+    """
+    file_format = detect_format(path)
+    if file_format == 'array':
+        if IJSON_AVAILABLE:
+            yield from _iter_array_ijson(path)
+        else:
+            with open(path, 'r', encoding='utf-8-sig') as f:
+                yield from _ArrayReader(f)
+    elif file_format == 'jsonl':
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    if report is not None:
+                        report.add(f"第 {line_number} 行", e.msg)
+    else:
+        raise JsonStreamError("not a JSON array or JSON Lines file")
+
+
+def iter_flashcards(path, report=None):
+    """逐张产出有效的闪卡 {'question', 'answer'}，无效记录记入 report"""
+    for index, record in enumerate(iter_json_records(path, report), 1):
+        if isinstance(record, dict) and 'question' in record and 'answer' in record:
+            yield record
+        elif report is not None:
+            report.add(f"第 {index} 张", "缺少 question/answer 字段")
@@ -0,0 +1,203 @@
+"""
+常驻 LibreOffice 转换进程池
+启动若干个 headless soffice 监听本地端口，转换任务通过 unoconv --connection 交给空闲的监听进程，
+因此批量转换 .ppt 只需支付一次 LibreOffice 启动开销。
+每个监听进程使用独立的用户配置目录和进程组；转换前做健康检查（本池启动的进程仍在运行，并且能完成
+UNO 握手；未安装 python uno 模块时退化为端口连接检查），失败或进程退出时自动重启。
+- 进程池只在主进程中创建：进程池工作进程中 get_office_pool() 返回 None（回退到一次性的 unoconv/soffice），
+  批量模式在主进程中转换 .ppt，避免各个工作进程在同一组端口上各自启动监听进程且退出时不清理；
+- 首选端口已被其他进程占用时改用系统分配的空闲端口，健康检查不会连到别的进程的 soffice。
+
+环境变量:
+  LIBREOFFICE_POOL_SIZE  监听进程数 (默认: 2，设为 0 时不使用进程池)
+  LIBREOFFICE_BASE_PORT  第一个首选监听端口 (默认: 2002)
+"""
+
+import os
+import time
+import queue
+import atexit
+import signal
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+
+try:
+    import uno
+    from com.sun.star.connection import NoConnectException
+    UNO_AVAILABLE = True
+except ImportError:
+    UNO_AVAILABLE = False
+
+LIBREOFFICE_POOL_SIZE = int(os.environ.get("LIBREOFFICE_POOL_SIZE", "2"))
+LIBREOFFICE_BASE_PORT = int(os.environ.get("LIBREOFFICE_BASE_PORT", "2002"))
+STARTUP_TIMEOUT = 30
+CONVERT_TIMEOUT = 60
+
+
+def port_in_use(port):
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def uno_handshake(connection):
+    """通过 UNO 连接解析远程组件上下文，成功说明监听进程能处理请求"""
+    local_context = uno.getComponentContext()
+    resolver = local_context.ServiceManager.createInstanceWithContext(
+        'com.sun.star.bridge.UnoUrlResolver', local_context)
+    try:
+        resolver.resolve(f'uno:{connection}')
+        return True
+    except NoConnectException:
+        return False
+
+
+class OfficeListener:
+    """一个监听本地端口的 headless LibreOffice 进程"""
+
+    def __init__(self, port):
+        self.port = port
+        self.process = None
+        self.profile_dir = tempfile.mkdtemp(prefix=f'lo_profile_{port}_')
+
+    @property
+    def connection(self):
+        return f"socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext"
+
+    def start(self):
+        if port_in_use(self.port):
+            # 端口属于其他进程（如另一个服务实例的监听进程），换一个空闲端口
+            self.port = free_port()
+        # soffice 会再启动 soffice.bin 子进程，放在独立的进程组中以便整组结束
+        self.process = subprocess.Popen(
+            ['soffice', '--headless', '--invisible', '--nologo', '--norestore', '--nodefault',
+             f'--accept={self.connection}', f'-env:UserInstallation=file://{self.profile_dir}'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+        )
+        deadline = time.time() + STARTUP_TIMEOUT
+        while time.time() < deadline:
+            if self.is_healthy():
+                return True
+            if self.process.poll() is not None:
+                break
+            time.sleep(0.2)
+        print(f"LibreOffice listener on port {self.port} failed to start")
+        self.stop()
+        return False
+
+    def is_healthy(self):
+        if self.process is None or self.process.poll() is not None:
+            return False
+        if UNO_AVAILABLE:
+            return uno_handshake(self.connection)
+        # 启动前端口是空闲的，本进程仍在运行时占用该端口的只能是它
+        return port_in_use(self.port)
+
+    def restart(self):
+        self.stop()
+        return self.start()
+
+    def stop(self):
+        if self.process is not None:
+            for sig in (signal.SIGTERM, signal.SIGKILL):
+                try:
+                    os.killpg(self.process.pid, sig)
+                except ProcessLookupError:
+                    break
+                try:
+                    self.process.wait(timeout=10)
+                    break
+                except subprocess.TimeoutExpired:
+                    continue
+        self.process = None
+
+    def close(self):
+        self.stop()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class LibreOfficePool:
+    """管理一组 OfficeListener，按需启动，空闲的监听进程放在队列中"""
+
+    def __init__(self, size=LIBREOFFICE_POOL_SIZE, base_port=LIBREOFFICE_BASE_PORT):
+        self.size = size
+        self._listeners = [OfficeListener(base_port + i) for i in range(size)]
+        self._idle = queue.Queue()
+        self._started = False
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._started:
+                return
+            for listener in self._listeners:
+                listener.start()
+                self._idle.put(listener)
+            self._started = True
+
+    def convert(self, file_path, output_dir, output_format='pptx', timeout=CONVERT_TIMEOUT):
+        """
+        把 file_path 转换为 output_format，输出到 output_dir（调用方为每个任务提供独立目录）
+        返回转换后的文件路径，失败时返回 None
+        """
+        self._ensure_started()
+        try:
+            listener = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        converted_file = os.path.join(
+            output_dir, os.path.splitext(os.path.basename(file_path))[0] + '.' + output_format)
+        try:
+            if not listener.is_healthy() and not listener.restart():
+                return None
+            subprocess.run(['unoconv', '--connection', listener.connection, '-f', output_format,
+                            '-o', converted_file, file_path],
+                           check=True, capture_output=True, timeout=timeout)
+            return converted_file if os.path.exists(converted_file) else None
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            print(f"LibreOffice conversion failed on port {listener.port}: {e}")
+            # 转换失败或超时时监听进程可能已卡住，重启后再放回池中
+            listener.restart()
+            return None
+        finally:
+            self._idle.put(listener)
+
+    def shutdown(self):
+        with self._lock:
+            for listener in self._listeners:
+                listener.close()
+            self._idle = queue.Queue()
+            self._started = False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_office_pool():
+    """
+    获取共享的转换进程池；未安装 soffice/unoconv、LIBREOFFICE_POOL_SIZE=0 或在进程池工作进程中时返回 None
+    （工作进程不会执行 atexit，在其中启动的监听进程会在批量任务结束后残留）
+    """
+    global _pool
+    if LIBREOFFICE_POOL_SIZE <= 0 or not shutil.which('soffice') or not shutil.which('unoconv'):
+        return None
+    if multiprocessing.parent_process() is not None:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = LibreOfficePool()
+            atexit.register(_pool.shutdown)
+        return _pool
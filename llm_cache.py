@@ -0,0 +1,150 @@
+"""
+LLM 响应缓存
+以 (模型, 提示模板, 语言, temperature, 输入文本) 的哈希为键，把 API 返回的原始文本持久化到 SQLite，
+CLI 与 api.py 共享同一个缓存文件。
+
+环境变量:
+  LLM_CACHE_PATH       缓存文件路径 (默认: <项目目录>/.cache/llm_cache.sqlite3)
+  LLM_CACHE_MAX_BYTES  缓存最大字节数，超出后按最近最少使用淘汰 (默认: 256MB)
+  LLM_CACHE_TTL        缓存有效期（秒），0 表示永不过期 (默认: 30 天)
+  LLM_CACHE_DISABLED   设为 1 时绕过缓存
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import json
+import threading
+
+ROOT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(ROOT_DIRECTORY, '.cache', 'llm_cache.sqlite3')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_TTL = 30 * 24 * 3600
+
+# 每写入多少条记录检查一次淘汰
+EVICT_EVERY = 64
+
+
+def make_key(model, template, language, temperature, text):
+    """根据请求参数计算内容寻址的缓存键"""
+    payload = json.dumps([model, template, language, temperature, text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """基于 SQLite 的持久化响应缓存，支持按大小和时间淘汰，线程安全"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL, enabled=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' created_at REAL NOT NULL,'
+                ' accessed_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key):
+        """返回缓存的响应文本，未命中或已过期时返回 None"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute('SELECT value, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, value, len(value.encode('utf-8')), now, now)
+            )
+            conn.commit()
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict(conn, now)
+
+    def evict(self):
+        with self._lock:
+            self._evict(self._connect(), time.time())
+
+    def _evict(self, conn, now):
+        if self.ttl:
+            conn.execute('DELETE FROM responses WHERE created_at < ?', (now - self.ttl,))
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total > self.max_bytes:
+            # 按最近访问时间从旧到新删除，直到低于上限
+            excess = total - self.max_bytes
+            freed = 0
+            stale_keys = []
+            for key, size in conn.execute('SELECT key, size FROM responses ORDER BY accessed_at'):
+                stale_keys.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            conn.executemany('DELETE FROM responses WHERE key = ?', stale_keys)
+        conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute('DELETE FROM responses')
+            conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._connect().execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+            ).fetchone()
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': entries,
+                'bytes': size,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """获取进程内共享的缓存实例（首次调用时根据环境变量创建）"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(
+                path=os.environ.get('LLM_CACHE_PATH', DEFAULT_CACHE_PATH),
+                max_bytes=int(os.environ.get('LLM_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+                ttl=float(os.environ.get('LLM_CACHE_TTL', DEFAULT_TTL)),
+                enabled=os.environ.get('LLM_CACHE_DISABLED', '') not in ('1', 'true', 'yes'),
+            )
+        return _cache
@@ -0,0 +1,256 @@
+"""
+共享的 LLM API 客户端
+- 首次调用时才创建客户端（未设置 ARK_API_KEY 时导入不会失败），所有线程共用一个 HTTP 连接池；
+- 429 / 5xx / 连接错误按指数退避加随机抖动重试，优先遵循服务端返回的 Retry-After；
+- 请求数/分钟与 token 数/分钟两个令牌桶在线程间共享，并发请求在发送前排队，不会超出配额；
+- 每次请求的延迟、重试次数和 response.usage 中的 token 数记录到 metrics（/api/metrics）；
+- 可传入 token_budget.TokenBudget，发送前按预估用量检查预算，完成后按实际用量结算；
+  流式请求带 stream_options={"include_usage": true}，按最后一块返回的用量结算（接口以 400 拒绝该参数时
+  本进程内不再发送，改按预估用量结算）。
+
+环境变量:
+  ARK_API_KEY           API 密钥
+  ARK_BASE_URL          OpenAI 兼容接口地址
+  ARK_MAX_CONNECTIONS   HTTP 连接池上限 (默认: 64)
+  ARK_MAX_RETRIES       可重试错误的最大重试次数 (默认: 5)
+  ARK_BACKOFF_BASE      首次重试的基础等待秒数 (默认: 0.5)
+  ARK_BACKOFF_MAX       单次重试的最长等待秒数 (默认: 30)
+  ARK_RPM_LIMIT         每分钟请求数上限 (默认: 0，不限制)
+  ARK_TPM_LIMIT         每分钟 token 数上限，按 prompt 估算值 + max_tokens 计 (默认: 0，不限制)
+"""
+
+import os
+import time
+import random
+import threading
+
+from dotenv import load_dotenv
+from openai import OpenAI, DefaultHttpxClient, APIConnectionError, APIStatusError, RateLimitError, BadRequestError
+
+try:
+    import httpx
+except ImportError:  # openai 3.x ships its transport as httpx2
+    import httpx2 as httpx
+
+from token_budget import estimate_prompt_tokens
+from metrics import LLM_REQUEST_SECONDS, LLM_TOKENS, LLM_RETRIES
+
+load_dotenv()
+
+ARK_BASE_URL = os.environ.get("ARK_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3")
+MAX_CONNECTIONS = int(os.environ.get("ARK_MAX_CONNECTIONS", "64"))
+KEEPALIVE_EXPIRY = 30
+MAX_RETRIES = int(os.environ.get("ARK_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.environ.get("ARK_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.environ.get("ARK_BACKOFF_MAX", "30"))
+RPM_LIMIT = int(os.environ.get("ARK_RPM_LIMIT", "0"))
+TPM_LIMIT = int(os.environ.get("ARK_TPM_LIMIT", "0"))
+
+
+class TokenBucket:
+    """按分钟速率匀速补充的令牌桶，桶容量默认为一分钟的配额"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1):
+        """取出 amount 个令牌，不足时阻塞等待，返回等待的秒数；超过桶容量的请求按容量计"""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def refund(self, amount):
+        """归还预扣但未使用的令牌"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return int(self._tokens)
+
+
+class RateLimiter:
+    """请求数与 token 数两个令牌桶，rpm/tpm 为 0 时不限制对应维度"""
+
+    def __init__(self, rpm=RPM_LIMIT, tpm=TPM_LIMIT):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self._waited = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens):
+        waited = 0.0
+        if self.requests:
+            waited += self.requests.acquire(1)
+        if self.tokens:
+            waited += self.tokens.acquire(tokens)
+        if waited:
+            with self._lock:
+                self._waited += waited
+        return waited
+
+    def refund(self, tokens):
+        if self.tokens and tokens > 0:
+            self.tokens.refund(tokens)
+
+    def stats(self):
+        return {
+            'rpm_limit': RPM_LIMIT if self.requests else None,
+            'tpm_limit': TPM_LIMIT if self.tokens else None,
+            'requests_available': self.requests.available() if self.requests else None,
+            'tokens_available': self.tokens.available() if self.tokens else None,
+            'throttled_seconds': round(self._waited, 3),
+        }
+
+
+_client = None
+_limiter = None
+_lock = threading.Lock()
+
+
+def is_configured():
+    return bool(os.environ.get("ARK_API_KEY"))
+
+
+def get_client():
+    """获取共享的 OpenAI 客户端，首次调用时创建；未设置 ARK_API_KEY 时抛出 RuntimeError"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                if not is_configured():
+                    raise RuntimeError("ARK_API_KEY is not set")
+                http_client = DefaultHttpxClient(
+                    limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                        max_keepalive_connections=MAX_CONNECTIONS,
+                                        keepalive_expiry=KEEPALIVE_EXPIRY)
+                )
+                # 重试由 chat_completion 统一处理，以便每次重试都经过限流器
+                _client = OpenAI(api_key=os.environ["ARK_API_KEY"], base_url=ARK_BASE_URL,
+                                 max_retries=0, http_client=http_client)
+    return _client
+
+
+def get_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        with _lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
+
+
+def is_retryable(exc):
+    if isinstance(exc, (RateLimitError, APIConnectionError)):
+        return True
+    return isinstance(exc, APIStatusError) and exc.status_code >= 500
+
+
+def backoff_delay(attempt, exc=None):
+    """第 attempt 次重试（从 0 开始）前的等待秒数：有 Retry-After 时遵循它，否则为带完全抖动的指数退避"""
+    response = getattr(exc, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            return min(BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def record_usage(model, usage, estimated, limiter, budget):
+    """按 response.usage 归还预扣的限流配额、记录 token 指标并结算预算"""
+    if usage is not None and getattr(usage, 'total_tokens', None):
+        limiter.refund(estimated - usage.total_tokens)
+        LLM_TOKENS.inc(usage.prompt_tokens or 0, model=model, kind='prompt')
+        LLM_TOKENS.inc(usage.completion_tokens or 0, model=model, kind='completion')
+    if budget is not None:
+        budget.settle(estimated, usage)
+
+
+def iter_stream_usage(stream, model, estimated, limiter, budget):
+    """转发流式响应的各个块，结束（或提前关闭）时按最后一块携带的 usage 结算"""
+    usage = None
+    try:
+        for chunk in stream:
+            usage = getattr(chunk, 'usage', None) or usage
+            yield chunk
+    finally:
+        record_usage(model, usage, estimated, limiter, budget)
+
+
+# 流式请求让服务端在最后一块返回 usage
+STREAM_USAGE_OPTIONS = {"include_usage": True}
+_stream_usage_unsupported = False
+
+
+def chat_completion(messages, model, max_tokens, max_retries=None, budget=None, **kwargs):
+    """
+    调用 chat.completions.create，经过共享限流器，可重试错误按退避策略重试
+    其余参数（temperature、timeout、stream 等）原样传给 API；stream=True 时只重试建立连接的阶段
+    budget: 可选 token_budget.TokenBudget，发送前预扣 "输入估算 + max_tokens"（不足时抛出
+            BudgetExceededError），完成后按 response.usage 结算；流式响应在读完后结算
+    """
+    global _stream_usage_unsupported
+    if kwargs.get('stream') and 'stream_options' not in kwargs and not _stream_usage_unsupported:
+        kwargs['stream_options'] = STREAM_USAGE_OPTIONS
+    client = get_client()
+    limiter = get_rate_limiter()
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    estimated = estimate_prompt_tokens(messages) + max_tokens
+    if budget is not None:
+        budget.reserve(estimated)
+
+    attempt = 0
+    while True:
+        limiter.acquire(estimated)
+        # 每次尝试单独计时（不含限流排队和退避等待）；stream=True 时只是建立连接、收到响应头的时间
+        start = time.perf_counter()
+        try:
+            response = client.chat.completions.create(
+                model=model, messages=messages, max_tokens=max_tokens, **kwargs)
+        except Exception as exc:
+            if isinstance(exc, BadRequestError) and kwargs.get('stream_options') is STREAM_USAGE_OPTIONS:
+                # 接口不支持 stream_options：去掉后重发，用量改按预估值结算
+                print(f"Streaming usage is not supported by the endpoint, settling streams on estimates: {exc}")
+                _stream_usage_unsupported = True
+                del kwargs['stream_options']
+                limiter.refund(estimated)
+                continue
+            retry = attempt < max_retries and is_retryable(exc)
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, model=model, outcome='retry' if retry else 'error')
+            if not retry:
+                if budget is not None:
+                    budget.release(estimated)
+                raise
+            LLM_RETRIES.inc(model=model)
+            delay = backoff_delay(attempt, exc)
+            attempt += 1
+            print(f"API request failed ({exc.__class__.__name__}), retry {attempt}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, model=model, outcome='ok')
+        if kwargs.get('stream'):
+            return iter_stream_usage(response, model, estimated, limiter, budget)
+        record_usage(model, getattr(response, 'usage', None), estimated, limiter, budget)
+        return response
@@ -0,0 +1,193 @@
+"""
+轻量级指标
+进程内的计数器与直方图，按 Prometheus 文本格式输出（/api/metrics）。记录一次观测只是一次 perf_counter、
+一次二分查找和几次整数加法（在一个锁内），不采集时也只有这点开销；METRICS_ENABLED=0 时完全不记录。
+
+- stage_timer(stage): 上下文管理器，记录一个处理阶段（读 PDF、切分、解析、导出……）的耗时
+- timed_stage(stage): 同上，用作函数装饰器
+- timed_iter(stage, iterable): 只统计生成器自身产出数据所花的时间，不含调用方处理每一块的时间
+- LLM 请求的延迟与 token 用量由 llm_client 记录到 LLM_REQUEST_SECONDS / LLM_TOKENS，
+  各模型 tier 的延迟、解析结果与升级次数由 model_router 记录到 LLM_TIER_SECONDS / LLM_ESCALATIONS /
+  LLM_UNPARSED_RETRIES
+
+环境变量:
+  METRICS_ENABLED  是否记录指标 (默认: 1)
+"""
+
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") not in ('0', 'false', 'no')
+
+# 阶段耗时（秒）的默认分桶
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """单调递增的计数器，按标签值分组"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{format_labels(self.labelnames, key)} {format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """分桶直方图：每组标签保存各桶计数、总和与次数"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # 标签值 -> [各桶计数..., 超出最大桶的计数, 总和]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels[name] for name in self.labelnames))
+        return sum(series[:-1]) if series else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                le = f'le="{bound if bound == "+Inf" else format_value(float(bound))}"'
+                lines.append(f'{self.name}_bucket{format_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labelnames, key)} {format_value(series[-1])}')
+            lines.append(f'{self.name}_count{format_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+STAGE_SECONDS = register(Histogram(
+    'flashcard_stage_seconds', 'Time spent in each processing stage', ['stage']))
+STAGE_ERRORS = register(Counter(
+    'flashcard_stage_errors_total', 'Processing stages that raised an exception', ['stage']))
+LLM_REQUEST_SECONDS = register(Histogram(
+    'llm_request_seconds', 'Latency of each chat completion attempt', ['model', 'outcome']))
+LLM_TOKENS = register(Counter(
+    'llm_tokens_total', 'Tokens reported by response.usage', ['model', 'kind']))
+LLM_RETRIES = register(Counter(
+    'llm_retries_total', 'Chat completion attempts that were retried', ['model']))
+LLM_TIER_SECONDS = register(Histogram(
+    'llm_tier_seconds', 'Latency of routed requests by model tier and whether the output parsed', ['tier', 'outcome']))
+LLM_ESCALATIONS = register(Counter(
+    'llm_escalations_total', 'Requests re-sent to the large model after the tier output was unusable', ['tier']))
+LLM_UNPARSED_RETRIES = register(Counter(
+    'llm_unparsed_retries_total', 'Requests re-sent because the output could not be parsed', ['tier']))
+HTTP_REQUEST_SECONDS = register(Histogram(
+    'http_request_seconds', 'API request latency including JSON serialization', ['endpoint', 'method', 'status']))
+
+
+@contextmanager
+def stage_timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def timed_stage(stage):
+    """函数装饰器：把每次调用的耗时记为 stage 阶段"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_iter(stage, iterable):
+    """逐块转发 iterable，只累计取下一块所花的时间，耗尽（或提前关闭）时记录一次"""
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                return
+            except BaseException:
+                STAGE_ERRORS.inc(stage=stage)
+                raise
+            elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+
+
+def render():
+    """所有指标的 Prometheus 文本格式"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
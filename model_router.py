@@ -0,0 +1,198 @@
+"""
+模型分级路由
+- large: 主模型，处理内容密集的长段落；fast: 小而快的模型，处理闪卡增强和短段落；
+- fast 模型的输出解析不出闪卡（或请求失败）时，自动升级到 large 模型重新请求；large 模型的输出仍解析不出时
+  绕过缓存重试该请求（最多 LLM_PARSE_RETRIES 次），只重试失败的段落而不是整个文档；
+- 按 tier 统计延迟、解析成功率与升级次数（/api/health、/api/metrics）。fast 模型最近的解析成功率
+  低于阈值时暂时改用 large 模型，每 FAST_PROBE_EVERY 个请求仍交给 fast 模型一次，成功率恢复后自动切回。
+未设置 LLM_FAST_MODEL 时所有请求都使用 large 模型。
+
+环境变量:
+  LLM_MODEL              large 模型 (默认: doubao-seed-1-6-251015)
+  LLM_FAST_MODEL         fast 模型 (默认: 不设置)
+  FAST_CHUNK_TOKENS      不超过此 token 数的段落交给 fast 模型生成 (默认: 600)
+  FAST_MIN_SUCCESS_RATE  fast 模型最近的解析成功率低于此值时改用 large (默认: 0.8)
+  LLM_PARSE_RETRIES      large 模型输出解析不出结果时的重试次数 (默认: 1)
+"""
+
+import os
+import time
+import threading
+from collections import deque
+
+from dotenv import load_dotenv
+
+from chunking import estimate_tokens
+from llm_cache import get_cache, make_key
+from token_budget import BudgetExceededError
+from metrics import LLM_TIER_SECONDS, LLM_ESCALATIONS, LLM_UNPARSED_RETRIES
+
+load_dotenv()
+
+LLM_MODEL = os.environ.get("LLM_MODEL", "doubao-seed-1-6-251015")
+LLM_FAST_MODEL = os.environ.get("LLM_FAST_MODEL", "")
+FAST_CHUNK_TOKENS = int(os.environ.get("FAST_CHUNK_TOKENS", "600"))
+FAST_MIN_SUCCESS_RATE = float(os.environ.get("FAST_MIN_SUCCESS_RATE", "0.8"))
+LLM_PARSE_RETRIES = int(os.environ.get("LLM_PARSE_RETRIES", "1"))
+
+TIER_FAST = 'fast'
+TIER_LARGE = 'large'
+
+# 按最近多少个请求计算成功率与延迟，以及开始据此调整路由所需的最少请求数
+STATS_WINDOW = 50
+MIN_SAMPLES = 10
+# fast 模型被暂停期间，每隔多少个本应交给它的请求探测一次
+FAST_PROBE_EVERY = 10
+
+
+class TierStats:
+    """一个 tier 的累计与最近请求统计（只统计真正发出的请求，不含缓存命中）"""
+
+    def __init__(self, model):
+        self.model = model
+        self.requests = 0
+        self.parsed = 0
+        self.errors = 0
+        self.escalated = 0
+        self.seconds = 0.0
+        self.recent = deque(maxlen=STATS_WINDOW)  # (是否解析成功, 耗时)
+
+    def success_rate(self):
+        return sum(parsed for parsed, _ in self.recent) / len(self.recent) if self.recent else None
+
+    def to_dict(self):
+        latencies = sorted(seconds for _, seconds in self.recent)
+        rate = self.success_rate()
+        return {
+            'model': self.model,
+            'requests': self.requests,
+            'parsed': self.parsed,
+            'errors': self.errors,
+            'escalated': self.escalated,
+            'avg_seconds': round(self.seconds / self.requests, 3) if self.requests else None,
+            'recent_p50_seconds': round(latencies[len(latencies) // 2], 3) if latencies else None,
+            'recent_success_rate': round(rate, 3) if rate is not None else None,
+        }
+
+
+class ModelRouter:
+    """选择请求使用的 tier，fast 输出不可用时升级到 large，并记录各 tier 的表现"""
+
+    def __init__(self, large_model=LLM_MODEL, fast_model=LLM_FAST_MODEL, fast_chunk_tokens=FAST_CHUNK_TOKENS,
+                 min_success_rate=FAST_MIN_SUCCESS_RATE):
+        self.tiers = {TIER_LARGE: TierStats(large_model)}
+        if fast_model and fast_model != large_model:
+            self.tiers[TIER_FAST] = TierStats(fast_model)
+        self.fast_chunk_tokens = fast_chunk_tokens
+        self.min_success_rate = min_success_rate
+        self._held_back = 0
+        self._lock = threading.Lock()
+
+    def model(self, tier):
+        return self.tiers[tier].model
+
+    def fast_healthy(self):
+        with self._lock:
+            stats = self.tiers[TIER_FAST]
+            return len(stats.recent) < MIN_SAMPLES or stats.success_rate() >= self.min_success_rate
+
+    def choose(self, text=None):
+        """
+        返回请求应使用的 tier；text 为待生成闪卡的段落，改写类任务（增强）不传
+        长段落总是交给 large；fast 模型最近表现不佳时暂改用 large，但定期探测
+        """
+        if TIER_FAST not in self.tiers:
+            return TIER_LARGE
+        if text is not None and estimate_tokens(text) > self.fast_chunk_tokens:
+            return TIER_LARGE
+        if self.fast_healthy():
+            return TIER_FAST
+        with self._lock:
+            self._held_back += 1
+            return TIER_FAST if self._held_back % FAST_PROBE_EVERY == 0 else TIER_LARGE
+
+    def record(self, tier, seconds, parsed, error=False):
+        """记录一次真正发出的请求"""
+        outcome = 'error' if error else 'parsed' if parsed else 'unparsed'
+        LLM_TIER_SECONDS.observe(seconds, tier=tier, outcome=outcome)
+        with self._lock:
+            stats = self.tiers[tier]
+            stats.requests += 1
+            stats.seconds += seconds
+            stats.parsed += bool(parsed)
+            stats.errors += error
+            stats.recent.append((bool(parsed), seconds))
+
+    def escalate(self, tier):
+        """tier 的输出不可用，改用 large 模型；返回 TIER_LARGE"""
+        LLM_ESCALATIONS.inc(tier=tier)
+        with self._lock:
+            self.tiers[tier].escalated += 1
+        return TIER_LARGE
+
+    def complete(self, call, parse, tier, template, language, temperature, text, use_cache=True):
+        """
+        带缓存与升级地完成一次请求，返回 parse 的结果
+        call(model): 发送请求并返回文本；parse(text): 解析结果，为空表示没有可用的输出
+        缓存按实际使用的模型区分，只缓存能解析出结果的输出（解析不出的缓存内容视为未命中）；
+        fast 模型请求失败或解析结果为空时改用 large 模型，large 模型解析结果为空时绕过缓存读取重试
+        LLM_PARSE_RETRIES 次（成功的结果仍写入缓存），仍为空时返回空结果
+        """
+        cache = get_cache()
+        use_cache = use_cache and cache.enabled
+        read_cache = use_cache
+        retries = LLM_PARSE_RETRIES
+        while True:
+            model = self.model(tier)
+            key = make_key(model, template, language, temperature, text) if use_cache else None
+            cached = cache.get(key) if key and read_cache else None
+            if cached is not None:
+                result = parse(cached)
+                if result:
+                    return result
+
+            start = time.perf_counter()
+            try:
+                raw = call(model)
+            except BudgetExceededError:
+                raise
+            except Exception:
+                self.record(tier, time.perf_counter() - start, False, error=True)
+                if tier == TIER_LARGE:
+                    raise
+                tier = self.escalate(tier)
+                continue
+            seconds = time.perf_counter() - start
+            result = parse(raw)
+            self.record(tier, seconds, bool(result))
+            if result:
+                if key:
+                    cache.set(key, raw)
+                return result
+            if tier != TIER_LARGE:
+                tier = self.escalate(tier)
+            elif retries > 0:
+                retries -= 1
+                read_cache = False
+                LLM_UNPARSED_RETRIES.inc(tier=tier)
+            else:
+                return result
+
+    def stats(self):
+        with self._lock:
+            tiers = {tier: stats.to_dict() for tier, stats in self.tiers.items()}
+        return {'fast_enabled': TIER_FAST in self.tiers, 'fast_chunk_tokens': self.fast_chunk_tokens, 'tiers': tiers}
+
+
+_router = None
+_lock = threading.Lock()
+
+
+def get_router():
+    """获取进程内共享的路由器（CLI 与 API 服务中的所有请求共用统计）"""
+    global _router
+    if _router is None:
+        with _lock:
+            if _router is None:
+                _router = ModelRouter()
+    return _router
@@ -0,0 +1,181 @@
+"""
+PDF 页级并行提取
+把页范围分发到进程池中提取文本；对没有文本的页面按小批量 (first_page/last_page) 光栅化后 OCR，
+因此内存峰值只与批量大小和进程数有关，与文档页数无关。
+"""
+
+import os
+import hashlib
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import PyPDF2
+
+from extraction_cache import ExtractionCache
+
+try:
+    import pytesseract
+    from pdf2image import convert_from_path
+    OCR_AVAILABLE = True
+except ImportError:
+    OCR_AVAILABLE = False
+
+# 进程池大小（默认等于 CPU 核数）
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", os.cpu_count() or 1))
+# 每个文本提取任务处理的页数
+PAGES_PER_TASK = 8
+# 每次光栅化并 OCR 的最大页数
+OCR_BATCH_PAGES = 4
+OCR_LANG = 'eng+chi_sim'
+OCR_DPI = 200
+
+
+def count_pages(file_path):
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def page_fingerprint(page):
+    """
+    计算页面内容指纹：内容流、字体名以及图片等 XObject 的原始数据
+    内容相同的页面即使位于不同文件、不同页码，指纹也相同
+    """
+    sha = hashlib.sha256()
+    contents = page.get_contents()
+    if contents is not None:
+        sha.update(contents.get_data())
+    resources = page.get('/Resources')
+    resources = resources.get_object() if resources is not None else {}
+    fonts = resources.get('/Font')
+    if fonts is not None:
+        for name, font in sorted(fonts.get_object().items()):
+            sha.update(f"{name}={font.get_object().get('/BaseFont')}".encode('utf-8'))
+    xobjects = resources.get('/XObject')
+    if xobjects is not None:
+        for name, xobject in sorted(xobjects.get_object().items()):
+            xobject = xobject.get_object()
+            sha.update(name.encode('utf-8'))
+            sha.update(getattr(xobject, '_data', None) or b'')
+    return sha.hexdigest()
+
+
+def extract_page_range(file_path, start, end, cache=None):
+    """
+    提取 [start, end) 页的文本（页码从 0 开始），在工作进程中执行
+    返回 (texts, keys, cached)：传入 cache 时 keys 为页面指纹，cached 标记命中缓存的页面
+    """
+    texts, keys, cached = [], [], []
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for page_index in range(start, end):
+            page = reader.pages[page_index]
+            key = None
+            if cache is not None:
+                try:
+                    key = page_fingerprint(page)
+                except Exception:
+                    key = None
+            text = cache.get_page(key) if key else None
+            keys.append(key)
+            cached.append(text is not None)
+            if text is None:
+                try:
+                    text = page.extract_text() or ''
+                except Exception as e:
+                    print(f"Page {page_index + 1} text extraction failed: {e}")
+                    text = ''
+            texts.append(text)
+    return texts, keys, cached
+
+
+def ocr_page_range(file_path, first_page, last_page):
+    """光栅化并 OCR 第 first_page 到 last_page 页（页码从 1 开始，含两端），在工作进程中执行"""
+    images = convert_from_path(file_path, dpi=OCR_DPI, first_page=first_page, last_page=last_page)
+    texts = []
+    for img in images:
+        texts.append(pytesseract.image_to_string(img, lang=OCR_LANG))
+        img.close()
+    return texts
+
+
+def split_ranges(page_numbers, max_size):
+    """把页码列表按连续区间切分，每个区间最多 max_size 页，返回 [(first, last), ...]"""
+    ranges = []
+    for page in page_numbers:
+        if ranges and page == ranges[-1][1] + 1 and page - ranges[-1][0] < max_size:
+            ranges[-1] = (ranges[-1][0], page)
+        else:
+            ranges.append((page, page))
+    return ranges
+
+
+def extract_page_range_with_ocr(file_path, start, end, ocr=True, cache_path=None):
+    """
+    提取 [start, end) 页的文本，并对其中没有文本的页面按小批量 OCR，在工作进程中执行
+    传入 cache_path 时按页面指纹读写提取缓存，命中的页面不再提取/OCR
+    返回 [(text, page_key), ...]
+    """
+    cache = ExtractionCache(cache_path) if cache_path else None
+    texts, keys, cached = extract_page_range(file_path, start, end, cache)
+    empty_pages = [start + i + 1 for i, text in enumerate(texts) if not text.strip() and not cached[i]]
+    ocr_done = ocr and OCR_AVAILABLE
+    if empty_pages and ocr_done:
+        print(f"No text found on {len(empty_pages)} page(s) of {start + 1}-{end}. Attempting OCR...")
+        for first, last in split_ranges(empty_pages, OCR_BATCH_PAGES):
+            try:
+                for offset, text in enumerate(ocr_page_range(file_path, first, last)):
+                    texts[first - 1 - start + offset] = text
+            except Exception as e:
+                print(f"OCR processing failed (pages {first}-{last}): {e}")
+    if cache is not None:
+        for i, key in enumerate(keys):
+            # 没有做 OCR 的空白页不缓存，以便之后安装 OCR 后重新识别
+            if key and not cached[i] and (texts[i].strip() or ocr_done):
+                cache.put_page(key, texts[i])
+    return list(zip(texts, keys))
+
+
+def iter_pdf_pages(file_path, max_workers=None, ocr=True, cache_path=None):
+    """
+    按页码顺序逐页产出 (页码, 文本, 页面指纹)，页码从 1 开始；未传入 cache_path 时指纹为 None
+    页范围分发到进程池并行提取/OCR，最多预取 2 * max_workers 个范围，
+    因此调用方可以在后面的页面仍在提取时就开始处理前面的页面
+    """
+    page_count = count_pages(file_path)
+    if page_count == 0:
+        return
+    max_workers = max(1, max_workers or PDF_WORKERS)
+    text_ranges = [(start, min(start + PAGES_PER_TASK, page_count))
+                   for start in range(0, page_count, PAGES_PER_TASK)]
+
+    found_text = False
+    if max_workers == 1 or len(text_ranges) == 1:
+        for start, end in text_ranges:
+            for offset, (text, key) in enumerate(extract_page_range_with_ocr(file_path, start, end, ocr, cache_path)):
+                found_text = found_text or bool(text.strip())
+                yield start + offset + 1, text, key
+    else:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(text_ranges))) as executor:
+            pending = deque()
+            ranges = iter(text_ranges)
+            for start, end in itertools.islice(ranges, 2 * max_workers):
+                pending.append((start, executor.submit(
+                    extract_page_range_with_ocr, file_path, start, end, ocr, cache_path)))
+            try:
+                while pending:
+                    start, future = pending.popleft()
+                    results = future.result()
+                    next_range = next(ranges, None)
+                    if next_range:
+                        pending.append((next_range[0], executor.submit(
+                            extract_page_range_with_ocr, file_path, next_range[0], next_range[1], ocr, cache_path)))
+                    for offset, (text, key) in enumerate(results):
+                        found_text = found_text or bool(text.strip())
+                        yield start + offset + 1, text, key
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    if not found_text and ocr and not OCR_AVAILABLE:
+        print("Warning: No text extracted and OCR not available. Install: pip install pytesseract pdf2image pillow")
@@ -0,0 +1,128 @@
+"""
+闪卡搜索索引
+对问题和答案（大小写折叠后）的字符二元组建立倒排表，子串查询只需取查询中最短的一条倒排表作为候选，
+再逐个确认，不需要扫描整个牌组；中文不分词也能按子串命中。前缀查询同样用倒排表缩小候选范围。
+单字符查询没有二元组可用，退化为顺序扫描。
+
+索引按会话懒加载并缓存（LRU）。卡片集合变化后，下次搜索时按 CardStore 的变更日志增量补上
+新增和修改的卡片；被删除或改掉的旧内容留在倒排表里，由确认步骤过滤。变更日志不完整或卡片被整体替换时才重建。
+
+环境变量:
+  SEARCH_INDEX_CACHE_SIZE  最多缓存多少个会话的索引 (默认: 16)
+"""
+
+import os
+import threading
+from array import array
+from collections import OrderedDict
+
+SEARCH_INDEX_CACHE_SIZE = int(os.environ.get("SEARCH_INDEX_CACHE_SIZE", "16"))
+
+# 修改过的卡片累计超过 max(此值, 卡片数) 次后重建索引，清掉倒排表中的旧内容
+MIN_REBUILD_READDED = 4096
+
+MATCH_SUBSTRING = 'substring'
+MATCH_PREFIX = 'prefix'
+MATCH_MODES = (MATCH_SUBSTRING, MATCH_PREFIX)
+
+
+def bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def card_matches(card, query, mode=MATCH_SUBSTRING):
+    """query 需已大小写折叠"""
+    question, answer = card['question'].casefold(), card['answer'].casefold()
+    if mode == MATCH_PREFIX:
+        return question.startswith(query) or answer.startswith(query)
+    return query in question or query in answer
+
+
+class SearchIndex:
+    """卡片集合的二元组倒排索引：二元组 -> 卡片 ID 数组"""
+
+    def __init__(self, store):
+        self.epoch = store.epoch
+        self.revision = store.revision
+        self.last_id = store.last_id
+        # 修改后重新加入倒排表的次数；旧内容残留过多时重建
+        self.readded = 0
+        self.postings = {}
+        for card_id, card in store.items():
+            self._add(card_id, card)
+
+    def _add(self, card_id, card):
+        # 问题与答案分开取二元组，避免跨字段拼出不存在的子串
+        for gram in bigrams(card['question'].casefold()) | bigrams(card['answer'].casefold()):
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array('q')
+            posting.append(card_id)
+
+    def refresh(self, store):
+        """按变更日志补上新增与修改的卡片，无法增量更新时返回 False"""
+        if self.epoch != store.epoch:
+            return False
+        if self.revision == store.revision:
+            return True
+        changed = store.changed_since(self.revision)
+        if changed is None:
+            return False
+        self.readded += len(changed)
+        if self.readded > max(MIN_REBUILD_READDED, len(store)):
+            return False
+        for card_id in changed:
+            if card_id <= self.last_id:
+                card = store.get(card_id)
+                if card is not None:
+                    self._add(card_id, card)
+        for card_id, card in store.items_after(self.last_id):
+            self._add(card_id, card)
+        self.revision = store.revision
+        self.last_id = store.last_id
+        return True
+
+    def search(self, store, query, mode=MATCH_SUBSTRING):
+        """返回匹配的卡片 ID 列表（按卡片顺序）"""
+        query = query.casefold()
+        grams = bigrams(query)
+        if not grams:
+            return [card_id for card_id, card in store.items() if card_matches(card, query, mode)]
+        postings = [self.postings.get(gram) for gram in grams]
+        if not all(postings):
+            return []
+        # 修改过的卡片会再次追加到倒排表末尾，候选需要去重并按 ID（即卡片顺序）排序
+        matches = set()
+        for card_id in min(postings, key=len):
+            if card_id not in matches:
+                card = store.get(card_id)
+                if card is not None and card_matches(card, query, mode):
+                    matches.add(card_id)
+        return sorted(matches)
+
+
+class SearchIndexCache:
+    """按会话缓存搜索索引，超出容量时淘汰最久未使用的"""
+
+    def __init__(self, max_entries=SEARCH_INDEX_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id, store):
+        with self._lock:
+            index = self._indexes.get(session_id)
+            if index is not None and index.refresh(store):
+                self._indexes.move_to_end(session_id)
+                return index
+        # 在锁外构建，大牌组建索引时不阻塞其他会话的搜索
+        index = SearchIndex(store)
+        with self._lock:
+            self._indexes[session_id] = index
+            self._indexes.move_to_end(session_id)
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+        return index
+
+    def search(self, session_id, store, query, mode=MATCH_SUBSTRING):
+        return self.get(session_id, store).search(store, query, mode)
@@ -0,0 +1,457 @@
+"""
+会话存储
+- MemorySessionStore: 进程内 LRU 存储，按空闲时间 (TTL) 和字节预算淘汰
+- SQLiteSessionStore: 基于 SQLite 的存储，多个 worker 进程可以共享；闪卡按行保存，读取时按需查询
+
+会话记录只保存闪卡和元数据，上传文档的大段文本单独存放（get_text / set_text），
+不会随每次读写会话一起加载。修改会话请使用 update()，它在存储的锁/事务内完成读-改-写；
+需要遍历闪卡的只读操作请使用 read()，避免与并发的修改交错。
+会话中的闪卡保存为 card_store.CardStore（SQLite 存储中为接口相同的 SQLiteCardStore，
+保存时传入的列表会自动转换），卡片有稳定的 ID。
+
+环境变量:
+  SESSION_BACKEND    memory 或 sqlite (默认: memory)
+  SESSION_DB_PATH    SQLite 文件路径 (默认: <项目目录>/.cache/sessions.sqlite3)
+  SESSION_TTL        会话空闲多少秒后过期 (默认: 86400)
+  SESSION_MAX_BYTES  内存存储的字节预算 (默认: 256MB)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from card_store import CardStore, log_change
+
+ROOT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_DB_PATH = os.path.join(ROOT_DIRECTORY, '.cache', 'sessions.sqlite3')
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def new_session():
+    return {'flashcards': CardStore(), 'filename': None}
+
+
+def normalize_session(session):
+    """把会话中以列表保存的闪卡转换为 CardStore"""
+    if not isinstance(session.get('flashcards'), CardStore):
+        session['flashcards'] = CardStore(session.get('flashcards') or [])
+    return session
+
+
+def estimate_size(session):
+    """粗略估算会话占用的字节数"""
+    return 200 + len(session.get('filename') or '') + session['flashcards'].estimate_size()
+
+
+class MemorySessionStore:
+    """进程内 LRU/TTL 会话存储，会话与文本共用一个字节预算"""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()  # session_id -> [session, size, last_access]
+        self._texts = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def _touch(self, session_id):
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        if self.ttl and time.time() - entry[2] > self.ttl:
+            self._remove(session_id)
+            return None
+        entry[2] = time.time()
+        self._sessions.move_to_end(session_id)
+        return entry
+
+    def _remove(self, session_id):
+        entry = self._sessions.pop(session_id, None)
+        if entry:
+            self._bytes -= entry[1]
+        text = self._texts.pop(session_id, None)
+        if text:
+            self._bytes -= len(text)
+
+    def _evict(self):
+        now = time.time()
+        while self._sessions:
+            oldest_id, (_, _, last_access) = next(iter(self._sessions.items()))
+            expired = self.ttl and now - last_access > self.ttl
+            if not expired and self._bytes <= self.max_bytes:
+                break
+            self._remove(oldest_id)
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._touch(session_id)
+            return entry[0] if entry else None
+
+    def save(self, session_id, session):
+        with self._lock:
+            size = estimate_size(normalize_session(session))
+            old = self._sessions.get(session_id)
+            if old:
+                self._bytes -= old[1]
+            self._sessions[session_id] = [session, size, time.time()]
+            self._sessions.move_to_end(session_id)
+            self._bytes += size
+            self._evict()
+
+    def get_or_create(self, session_id):
+        with self._lock:
+            session = self.get(session_id)
+            if session is None:
+                session = new_session()
+                self.save(session_id, session)
+            return session
+
+    def update(self, session_id, func, create=False):
+        """在锁内执行 func(session) 并保存，返回 func 的返回值；会话不存在且 create=False 时返回 None"""
+        with self._lock:
+            session = self.get_or_create(session_id) if create else self.get(session_id)
+            if session is None:
+                return None
+            result = func(session)
+            self.save(session_id, session)
+            return result
+
+    def read(self, session_id, func):
+        """在锁内执行 func(session) 并返回其结果，不保存；会话不存在时返回 None"""
+        with self._lock:
+            session = self.get(session_id)
+            return None if session is None else func(session)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._remove(session_id)
+
+    def get_text(self, session_id):
+        with self._lock:
+            if self._touch(session_id) is None:
+                return ''
+            return self._texts.get(session_id, '')
+
+    def set_text(self, session_id, text):
+        with self._lock:
+            self.get_or_create(session_id)
+            old = self._texts.pop(session_id, '')
+            self._bytes -= len(old)
+            if text:
+                self._texts[session_id] = text
+                self._bytes += len(text)
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'sessions': len(self._sessions), 'bytes': self._bytes,
+                    'max_bytes': self.max_bytes}
+
+
+class SQLiteCardStore:
+    """
+    SQLite 会话中的闪卡：每张卡片是 session_cards 表中的一行，接口与 CardStore 相同
+    epoch、revision 等元数据随会话行读取，读取卡片时才按需查询对应的行，修改直接写入行
+    """
+
+    def __init__(self, conn, session_id, epoch, revision, deck):
+        self._conn = conn
+        self._session_id = session_id
+        self.epoch = epoch
+        self.revision = revision
+        self._next_id = deck['next_id']
+        self._count = deck['count']
+        self._changes = [tuple(change) for change in deck['changes']]
+        self._changes_floor = deck['changes_floor']
+
+    @classmethod
+    def create(cls, conn, session_id):
+        """为新会话创建空的卡片集合（清掉同 ID 过期会话残留的行）"""
+        conn.execute('DELETE FROM session_cards WHERE session_id = ?', (session_id,))
+        empty = CardStore()
+        return cls(conn, session_id, empty.epoch, 0, {'next_id': 1, 'count': 0, 'changes': [], 'changes_floor': 0})
+
+    def deck(self):
+        """随会话行保存的元数据（不含卡片）"""
+        return {'next_id': self._next_id, 'count': self._count, 'changes': self._changes,
+                'changes_floor': self._changes_floor}
+
+    def _query(self, sql, params=()):
+        return self._conn.execute(sql, (self._session_id, *params))
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def __iter__(self):
+        for _, card in self.items():
+            yield card
+
+    def items(self):
+        """按顺序产出 (卡片 ID, 卡片)"""
+        return self.items_after()
+
+    def items_after(self, after=None):
+        """从 ID 为 after 的卡片之后开始按顺序产出 (卡片 ID, 卡片)，只读取实际取用的行"""
+        rows = self._query('SELECT card_id, question, answer FROM session_cards'
+                           ' WHERE session_id = ? AND card_id > ? ORDER BY card_id', (after or 0,))
+        for card_id, question, answer in rows:
+            yield card_id, {'question': question, 'answer': answer}
+
+    @property
+    def last_id(self):
+        return self._next_id - 1
+
+    def changed_since(self, revision):
+        if revision < self._changes_floor:
+            return None
+        return [card_id for changed, card_id in self._changes if changed > revision]
+
+    def ids(self):
+        return [row[0] for row in self._query('SELECT card_id FROM session_cards WHERE session_id = ? ORDER BY card_id')]
+
+    def __contains__(self, card_id):
+        return self.get(card_id) is not None
+
+    def append(self, question, answer):
+        card_id = self._next_id
+        self._query('INSERT INTO session_cards (session_id, card_id, question, answer) VALUES (?, ?, ?, ?)',
+                    (card_id, question, answer))
+        self._next_id += 1
+        self._count += 1
+        self.revision += 1
+        return card_id
+
+    def extend(self, flashcards):
+        return [self.append(card['question'], card['answer']) for card in flashcards]
+
+    def get(self, card_id):
+        row = self._query('SELECT question, answer FROM session_cards WHERE session_id = ? AND card_id = ?',
+                          (card_id,)).fetchone()
+        return None if row is None else {'question': row[0], 'answer': row[1]}
+
+    def update(self, card_id, question, answer):
+        cursor = self._conn.execute('UPDATE session_cards SET question = ?, answer = ? WHERE session_id = ? AND card_id = ?',
+                                    (question, answer, self._session_id, card_id))
+        if not cursor.rowcount:
+            return False
+        self.revision += 1
+        self._changes, self._changes_floor = log_change(self._changes, self._changes_floor, self.revision, card_id)
+        return True
+
+    def delete(self, card_id):
+        if not self._query('DELETE FROM session_cards WHERE session_id = ? AND card_id = ?', (card_id,)).rowcount:
+            return False
+        self._count -= 1
+        self.revision += 1
+        return True
+
+    def replace(self, flashcards):
+        """用 flashcards 替换全部卡片；新卡片的 ID 接着已分配的 ID 递增，旧 ID 不会被复用"""
+        revision = self.revision
+        self._query('DELETE FROM session_cards WHERE session_id = ?')
+        start = self._next_id
+        self._conn.executemany('INSERT INTO session_cards (session_id, card_id, question, answer) VALUES (?, ?, ?, ?)',
+                               ((self._session_id, start + i, card['question'], card['answer'])
+                                for i, card in enumerate(flashcards)))
+        self._count = self._query('SELECT COUNT(*) FROM session_cards WHERE session_id = ?').fetchone()[0]
+        self._next_id = start + self._count
+        self.revision = revision + 1
+        self._changes = []
+        self._changes_floor = self.revision
+
+    def compact(self):
+        """行存储没有删除标记，无需压缩"""
+
+    def id_at(self, index):
+        if not 0 <= index < self._count:
+            return None
+        return self._query('SELECT card_id FROM session_cards WHERE session_id = ? ORDER BY card_id LIMIT 1 OFFSET ?',
+                           (index,)).fetchone()[0]
+
+
+class SQLiteSessionStore:
+    """
+    SQLite 会话存储，多个进程可以共享同一个数据库文件
+    卡片按行保存在 session_cards 表中，会话行只保存元数据与卡片集合的 epoch/revision：
+    ETag 命中的请求不读取卡片，分页只读取该页的行，修改卡片只写入改动的行。
+    """
+
+    # 每多少次写入清理一次过期会话
+    CLEANUP_EVERY = 100
+
+    def __init__(self, path=DEFAULT_DB_PATH, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS sessions ('
+                     ' id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at)')
+        conn.execute('CREATE TABLE IF NOT EXISTS session_texts (id TEXT PRIMARY KEY, text TEXT NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS session_cards ('
+                     ' session_id TEXT NOT NULL, card_id INTEGER NOT NULL, question TEXT NOT NULL,'
+                     ' answer TEXT NOT NULL, PRIMARY KEY (session_id, card_id)) WITHOUT ROWID')
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(sessions)')}
+        for column, kind in (('epoch', 'TEXT'), ('revision', 'INTEGER'), ('deck', 'TEXT')):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE sessions ADD COLUMN {column} {kind}')
+        self._migrate(conn)
+
+    def _migrate(self, conn):
+        """把旧版本整体保存在 data 中的闪卡拆成行"""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for session_id, data in conn.execute('SELECT id, data FROM sessions WHERE deck IS NULL').fetchall():
+                session = json.loads(data)
+                flashcards = session.get('flashcards')
+                store = CardStore.from_dict(flashcards) if isinstance(flashcards, dict) else CardStore(flashcards or [])
+                conn.execute('DELETE FROM session_cards WHERE session_id = ?', (session_id,))
+                conn.executemany('INSERT INTO session_cards (session_id, card_id, question, answer) VALUES (?, ?, ?, ?)',
+                                 ((session_id, card_id, card['question'], card['answer'])
+                                  for card_id, card in store.items()))
+                cards = SQLiteCardStore(conn, session_id, store.epoch, store.revision,
+                                        {'next_id': store.last_id + 1, 'count': len(store),
+                                         'changes': [], 'changes_floor': store.revision})
+                self._store_meta(conn, session_id, session, cards, updated=False)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def _load(self, conn, session_id):
+        """读取会话行（不读取卡片），过期或不存在时返回 None"""
+        row = conn.execute('SELECT data, updated_at, epoch, revision, deck FROM sessions WHERE id = ?',
+                           (session_id,)).fetchone()
+        if row is None or (self.ttl and time.time() - row[1] > self.ttl):
+            return None
+        session = json.loads(row[0])
+        session['flashcards'] = SQLiteCardStore(conn, session_id, row[2], row[3], json.loads(row[4]))
+        return session
+
+    def _store_meta(self, conn, session_id, session, cards, updated=True):
+        data = {key: value for key, value in session.items() if key != 'flashcards'}
+        conn.execute('UPDATE sessions SET data = ?, epoch = ?, revision = ?, deck = ?'
+                     + (', updated_at = ?' if updated else '') + ' WHERE id = ?',
+                     (json.dumps(data, ensure_ascii=False), cards.epoch, cards.revision, json.dumps(cards.deck()),
+                      *((time.time(),) if updated else ()), session_id))
+
+    def _store(self, conn, session_id, session, cards):
+        """
+        保存会话元数据；cards 是该会话的 SQLiteCardStore，修改已经写入行。
+        session['flashcards'] 被换成了列表或 CardStore 时整体替换卡片
+        """
+        flashcards = session.get('flashcards')
+        if flashcards is not cards:
+            # 同一会话的另一个 SQLiteCardStore 读取的正是要被替换的行，先复制出来
+            cards.replace(list(flashcards) if isinstance(flashcards, SQLiteCardStore) else flashcards or [])
+            session['flashcards'] = cards
+        conn.execute('INSERT OR IGNORE INTO sessions (id, data, updated_at) VALUES (?, ?, ?)',
+                     (session_id, '{}', time.time()))
+        self._store_meta(conn, session_id, session, cards)
+
+    def _cleanup(self, conn):
+        self._writes += 1
+        if self.ttl and self._writes % self.CLEANUP_EVERY == 0:
+            cutoff = time.time() - self.ttl
+            expired = '(SELECT id FROM sessions WHERE updated_at < ?)'
+            conn.execute(f'DELETE FROM session_texts WHERE id IN {expired}', (cutoff,))
+            conn.execute(f'DELETE FROM session_cards WHERE session_id IN {expired}', (cutoff,))
+            conn.execute('DELETE FROM sessions WHERE updated_at < ?', (cutoff,))
+
+    def get(self, session_id):
+        """返回会话；其中的闪卡在访问时才按需读取数据库，需要一致的快照请使用 read()"""
+        return self._load(self._connect(), session_id)
+
+    def save(self, session_id, session):
+        """用 session 整体替换会话内容（卡片 ID 接着已分配的 ID 递增）"""
+        def apply(current):
+            current.clear()
+            current.update(session)
+        self.update(session_id, apply, create=True)
+
+    def get_or_create(self, session_id):
+        return self.update(session_id, lambda session: session, create=True)
+
+    def update(self, session_id, func, create=False):
+        """在写事务内执行 func(session) 并保存，返回 func 的返回值；会话不存在且 create=False 时返回 None"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            session = self._load(conn, session_id)
+            if session is None:
+                if not create:
+                    conn.execute('ROLLBACK')
+                    return None
+                conn.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+                session = dict(new_session(), flashcards=SQLiteCardStore.create(conn, session_id))
+            cards = session['flashcards']
+            result = func(session)
+            self._store(conn, session_id, session, cards)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._cleanup(conn)
+        return result
+
+    def read(self, session_id, func):
+        """在读事务内执行 func(session) 并返回其结果，不保存；func 看到的是一致的快照，只读取它访问到的卡片行"""
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            session = self._load(conn, session_id)
+            return None if session is None else func(session)
+        finally:
+            conn.execute('ROLLBACK')
+
+    def delete(self, session_id):
+        conn = self._connect()
+        conn.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+        conn.execute('DELETE FROM session_cards WHERE session_id = ?', (session_id,))
+        conn.execute('DELETE FROM session_texts WHERE id = ?', (session_id,))
+
+    def get_text(self, session_id):
+        row = self._connect().execute('SELECT text FROM session_texts WHERE id = ?', (session_id,)).fetchone()
+        return row[0] if row else ''
+
+    def set_text(self, session_id, text):
+        self.get_or_create(session_id)
+        self._connect().execute('INSERT OR REPLACE INTO session_texts (id, text) VALUES (?, ?)',
+                                (session_id, text or ''))
+
+    def stats(self):
+        count = self._connect().execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+        return {'backend': 'sqlite', 'sessions': count, 'path': self.path}
+
+
+def create_session_store():
+    """根据环境变量创建会话存储"""
+    backend = os.environ.get('SESSION_BACKEND', 'memory').lower()
+    ttl = float(os.environ.get('SESSION_TTL', DEFAULT_TTL))
+    if backend == 'sqlite':
+        return SQLiteSessionStore(path=os.environ.get('SESSION_DB_PATH', DEFAULT_DB_PATH), ttl=ttl)
+    return MemorySessionStore(ttl=ttl, max_bytes=int(os.environ.get('SESSION_MAX_BYTES', DEFAULT_MAX_BYTES)))
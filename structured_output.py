@@ -0,0 +1,337 @@
+"""
+结构化输出：请求格式与闪卡解析（生成、增强与 /api/parse-text 共用）
+- JSON 模式：提示中给出 {"cards": [...]} 的结构并以 response_format=json_object 请求；接口返回 400
+  （不支持该参数）时本进程内退回普通请求，提示中的 JSON 结构保留，解析器两种格式都能处理；
+- parse_cards 先尝试 JSON（允许代码块包裹和前后说明文字；输出被 max_tokens 截断时保留已完整的卡片），
+  不是 JSON 时按行解析；
+- 行解析（CardLineParser，可流式使用）：分隔符为 ; ； 或制表符（问题以问号结尾时在问号后的分隔符处拆分，
+  答案中的分号保留），去掉编号、列表符号、代码块标记和 "问题:"/"Q:" 等标签，支持 "Q: … / A: …" 两行格式
+  和 Markdown 表格，缩进或列表符号开头的续行并入上一张卡片的答案，其余无法解析的行忽略。
+
+环境变量:
+  LLM_JSON_MODE  auto（默认：先尝试 JSON 模式，不支持时退回）、on（总是使用）或 off（只用行格式）
+"""
+
+import os
+import re
+import json
+import threading
+
+from openai import BadRequestError
+
+from metrics import timed_stage
+
+LLM_JSON_MODE = os.environ.get("LLM_JSON_MODE", "auto").lower()
+
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+JSON_FORMAT_PROMPTS = {
+    'zh': '\n\n只输出一个 JSON 对象，格式：{"cards": [{"question": "问题", "answer": "答案"}]}，不要输出其他内容。',
+    'en': '\n\nOutput only a JSON object in the form {"cards": [{"question": "...", "answer": "..."}]} '
+          'with no other text.',
+}
+JSON_INDEXED_FORMAT_PROMPTS = {
+    'zh': '\n\n只输出一个 JSON 对象，格式：{"cards": [{"index": 编号, "question": "问题", "answer": "答案"}]}，'
+          '不要输出其他内容。',
+    'en': '\n\nOutput only a JSON object in the form {"cards": [{"index": number, "question": "...", '
+          '"answer": "..."}]} with no other text.',
+}
+
+DEFAULT_SEPARATORS = (';', '；', '\t')
+
+QUESTION_KEYS = ('question', 'q', 'front', '问题')
+ANSWER_KEYS = ('answer', 'a', 'back', '答案')
+INDEX_KEYS = ('index', 'id', 'number', 'no')
+LIST_KEYS = ('cards', 'flashcards', 'items', 'data')
+
+FENCE = re.compile(r'^\s*(?:```|~~~)')
+# 行首的编号或列表符号：1. 1) 1、 (1) [1] - * • 以及 Markdown 标题
+LIST_MARKER = re.compile(r'^\s*(?:\d{1,4}\s*[.)、．](?!\d)|\(\d{1,4}\)|\[\d{1,4}\]|[-*+•·](?=\s)|#{1,6}(?=\s))\s*')
+BULLET = re.compile(r'^\s*[-*+•·]\s')
+QUESTION_LABEL = re.compile(r'^(?:Q|Question|问题|问)\s*\d*\s*[:：]\s*', re.IGNORECASE)
+ANSWER_LABEL = re.compile(r'^(?:A|Answer|答案|答)\s*\d*\s*[:：]\s*', re.IGNORECASE)
+INLINE_QA = re.compile(r'^(?:Q|Question|问题|问)\s*[:：]\s*(.+?)\s+(?:A|Answer|答案|答)\s*[:：]\s*(.+)$', re.IGNORECASE)
+TABLE_RULE = re.compile(r'^\|?[\s:|-]+\|?$')
+# 批量增强返回的 "编号. 问题;答案" 行
+INDEXED_LINE = re.compile(r'^\s*\[?(\d+)\s*[\]\.\)、:：]\s*(.+)$')
+HEADER_WORDS = {'question', 'answer', 'q', 'a', '问题', '答案', 'front', 'back'}
+
+_json_mode_unsupported = False
+_lock = threading.Lock()
+
+
+def json_mode_enabled():
+    return LLM_JSON_MODE == 'on' or (LLM_JSON_MODE == 'auto' and not _json_mode_unsupported)
+
+
+def format_prompt(language, indexed=False):
+    """JSON 模式下追加到用户提示末尾的输出格式说明，未启用时为空字符串"""
+    if not json_mode_enabled():
+        return ''
+    prompts = JSON_INDEXED_FORMAT_PROMPTS if indexed else JSON_FORMAT_PROMPTS
+    return prompts.get(language, prompts['en'])
+
+
+def user_template(prompt, language, indexed=False):
+    """
+    返回用户提示模板（之后再 format 填入内容，也用作缓存键的一部分）：
+    JSON 模式下为不含行格式要求的 prompt['json_user'] 加上 JSON 输出格式说明，否则为要求行格式的 prompt['user']
+    """
+    output_format = format_prompt(language, indexed)
+    if not output_format:
+        return prompt['user']
+    return prompt['json_user'] + output_format.replace('{', '{{').replace('}', '}}')
+
+
+def structured_completion(send, messages, json_mode, **kwargs):
+    """
+    发送请求并返回响应文本；send 为 llm_client.chat_completion（kwargs 原样传给它）
+    json_mode 为 True 时带 response_format 请求，接口以 400 拒绝且 LLM_JSON_MODE 不是 on 时
+    记下不支持并以普通请求重发
+    """
+    global _json_mode_unsupported
+    if json_mode and not _json_mode_unsupported:
+        try:
+            response = send(messages, response_format=JSON_RESPONSE_FORMAT, **kwargs)
+            return (response.choices[0].message.content or '').strip()
+        except BadRequestError as exc:
+            if LLM_JSON_MODE == 'on':
+                raise
+            with _lock:
+                if not _json_mode_unsupported:
+                    print(f"JSON mode is not supported by the endpoint, falling back to plain text: {exc}")
+                _json_mode_unsupported = True
+    response = send(messages, **kwargs)
+    return (response.choices[0].message.content or '').strip()
+
+
+def strip_fences(text):
+    return '\n'.join(line for line in text.split('\n') if not FENCE.match(line))
+
+
+def clean_field(text):
+    text = text.strip()
+    for marker in ('**', '__'):
+        if len(text) > 2 * len(marker) and text.startswith(marker) and text.endswith(marker):
+            text = text[len(marker):-len(marker)].strip()
+    return text
+
+
+def first_value(item, keys):
+    for key in item:
+        if str(key).strip().lower() in keys:
+            return item[key]
+    return None
+
+
+def json_card(item):
+    """把 JSON 中的一项转换为闪卡，无法转换时返回 None"""
+    if isinstance(item, (list, tuple)) and len(item) >= 2:
+        question, answer = item[0], item[1]
+    elif isinstance(item, dict):
+        question, answer = first_value(item, QUESTION_KEYS), first_value(item, ANSWER_KEYS)
+    else:
+        return None
+    if question is None or answer is None:
+        return None
+    question, answer = clean_field(str(question)), clean_field(str(answer))
+    if not question or not answer:
+        return None
+    return {"question": question, "answer": answer}
+
+
+def json_items(data):
+    if isinstance(data, dict):
+        for key in data:
+            if str(key).lower() in LIST_KEYS and isinstance(data[key], list):
+                return data[key]
+        return [data]
+    return data if isinstance(data, list) else []
+
+
+def salvage_json_objects(text):
+    """逐个解码文本中完整的 JSON 对象（用于被截断或混有说明文字的输出），只保留像闪卡的对象"""
+    decoder = json.JSONDecoder()
+    items = []
+    position = text.find('{')
+    while position != -1:
+        try:
+            item, end = decoder.raw_decode(text, position)
+        except ValueError:
+            position = text.find('{', position + 1)
+            continue
+        if isinstance(item, dict) and json_card(item) is not None:
+            items.append(item)
+            position = text.find('{', end)
+        elif isinstance(item, dict) and any(isinstance(value, list) for value in item.values()):
+            items.extend(json_items(item))
+            position = text.find('{', end)
+        else:
+            position = text.find('{', position + 1)
+    return items
+
+
+def parse_json_items(text):
+    """返回 JSON 输出中的各项；输出不是 JSON 时返回 None"""
+    body = strip_fences(text).strip()
+    start = min((i for i in (body.find('{'), body.find('[')) if i != -1), default=-1)
+    if start == -1:
+        return None
+    try:
+        return json_items(json.loads(body[start:]))
+    except ValueError:
+        pass
+    try:
+        item, _ = json.JSONDecoder().raw_decode(body, start)
+        return json_items(item)
+    except ValueError:
+        return salvage_json_objects(body) or None
+
+
+def split_card(line, separators=DEFAULT_SEPARATORS):
+    """把一行拆成闪卡，无法拆分时返回 None"""
+    pattern = separator_pattern(separators)
+    matches = list(pattern.finditer(line))
+    if not matches:
+        return None
+    # 问题以问号结尾时在问号后的分隔符处拆分，问题中的分号不会把答案截断
+    match = next((m for m in matches if line[:m.start()].rstrip().endswith(('?', '？'))), matches[0])
+    question = QUESTION_LABEL.sub('', clean_field(line[:match.start()]), count=1)
+    answer = ANSWER_LABEL.sub('', clean_field(line[match.end():]), count=1)
+    question, answer = clean_field(question), clean_field(answer)
+    if not question or not answer:
+        return None
+    return {"question": question, "answer": answer}
+
+
+_patterns = {}
+
+
+def separator_pattern(separators):
+    pattern = _patterns.get(separators)
+    if pattern is None:
+        pattern = _patterns[separators] = re.compile('|'.join(re.escape(s) for s in separators))
+    return pattern
+
+
+def table_card(line):
+    if not (line.startswith('|') and line.endswith('|')) or TABLE_RULE.match(line):
+        return None
+    cells = [clean_field(cell) for cell in line.strip('|').split('|')]
+    if len(cells) < 2 or not cells[0] or not cells[1]:
+        return None
+    if cells[0].lower() in HEADER_WORDS and cells[1].lower() in HEADER_WORDS:
+        return None
+    return {"question": cells[0], "answer": cells[1]}
+
+
+class CardLineParser:
+    """
+    流式行解析器：feed() 传入文本片段，返回已经完整的卡片；close() 返回剩余的卡片
+    一张卡片要等到下一张开始（或 close）才产出，因为后面可能还有它的续行
+    """
+
+    def __init__(self, separators=None):
+        self.separators = tuple(separators or DEFAULT_SEPARATORS)
+        self._buffer = ''
+        self._card = None
+        self._question = None
+
+    def feed(self, text):
+        self._buffer += text
+        cards = []
+        while '\n' in self._buffer:
+            line, self._buffer = self._buffer.split('\n', 1)
+            cards.extend(self._line(line))
+        return cards
+
+    def close(self):
+        cards = self._line(self._buffer) if self._buffer else []
+        self._buffer = ''
+        if self._card is not None:
+            cards.append(self._card)
+            self._card = None
+        return cards
+
+    def _line(self, raw):
+        line = raw.strip()
+        if not line or FENCE.match(line):
+            return []
+        card = self._parse(line)
+        if card is not None:
+            done = [self._card] if self._card is not None else []
+            self._card = card
+            return done
+        if self._card is not None and self._question is None and (raw[:1].isspace() or BULLET.match(raw)):
+            self._card['answer'] += '\n' + line
+        return []
+
+    def _parse(self, line):
+        card = table_card(line)
+        if card is not None:
+            return card
+        line = LIST_MARKER.sub('', line, count=1)
+        if not line:
+            return None
+        if self._question is not None and ANSWER_LABEL.match(line):
+            question, self._question = self._question, None
+            answer = clean_field(ANSWER_LABEL.sub('', line, count=1))
+            return {"question": question, "answer": answer} if answer else None
+        card = split_card(line, self.separators)
+        if card is not None:
+            self._question = None
+            return card
+        match = INLINE_QA.match(line)
+        if match:
+            self._question = None
+            question, answer = clean_field(match.group(1)), clean_field(match.group(2))
+            return {"question": question, "answer": answer} if question and answer else None
+        if QUESTION_LABEL.match(line):
+            self._question = clean_field(QUESTION_LABEL.sub('', line, count=1)) or None
+        return None
+
+
+def parse_lines(text, separators=None):
+    parser = CardLineParser(separators)
+    return parser.feed(text) + parser.close()
+
+
+@timed_stage('parse')
+def parse_cards(text, separators=None):
+    """解析模型输出（JSON 或行格式）中的闪卡，separators 只影响行格式"""
+    items = parse_json_items(text)
+    if items is not None:
+        cards = [card for card in map(json_card, items) if card]
+        if cards:
+            return cards
+    return parse_lines(text, separators)
+
+
+@timed_stage('parse')
+def parse_indexed_cards(text, count):
+    """解析批量增强返回的带编号卡片，返回 {序号(从0开始): 闪卡}，编号越界、重复或无法解析的项忽略"""
+    matched = {}
+    items = parse_json_items(text)
+    if items:
+        for position, item in enumerate(items):
+            card = json_card(item)
+            if card is None:
+                continue
+            number = first_value(item, INDEX_KEYS) if isinstance(item, dict) else None
+            try:
+                index = int(number) - 1 if number is not None else position
+            except (TypeError, ValueError):
+                continue
+            if 0 <= index < count and index not in matched:
+                matched[index] = card
+        if matched:
+            return matched
+    for line in text.split('\n'):
+        match = INDEXED_LINE.match(line)
+        if not match:
+            continue
+        index = int(match.group(1)) - 1
+        card = split_card(match.group(2).strip())
+        if card is not None and 0 <= index < count and index not in matched:
+            matched[index] = card
+    return matched
@@ -0,0 +1,54 @@
+import pytest
+
+import api
+
+
+def card(question, answer):
+    return {'question': question, 'answer': answer}
+
+
+@pytest.fixture
+def client():
+    return api.app.test_client()
+
+
+def create_session(client, flashcards):
+    return client.post('/api/import-json', json={'flashcards': flashcards}).get_json()['session_id']
+
+
+def card_ids(client, session_id):
+    return [c['id'] for c in client.get('/api/flashcards', query_string={'session_id': session_id}).get_json()['flashcards']]
+
+
+def test_dedupe_groups_are_card_ids(client):
+    session_id = create_session(client, [card('Q1', 'A1'), card('Q2', 'A2'), card('Q1', 'A1')])
+    client.delete(f'/api/flashcards/id/{card_ids(client, session_id)[1]}', query_string={'session_id': session_id})
+    ids = card_ids(client, session_id)
+
+    result = client.post('/api/dedupe', json={'session_id': session_id, 'dry_run': True}).get_json()
+    assert result['groups'] == [ids]
+
+    result = client.post('/api/dedupe', json={'session_id': session_id}).get_json()
+    assert result['groups'] == [ids]
+    assert card_ids(client, session_id) == ids[:1]
+
+
+def test_batch_edit_with_stale_base_revision_returns_409(client):
+    session_id = create_session(client, [card('Q1', 'A1'), card('Q2', 'A2')])
+    page = client.get('/api/flashcards', query_string={'session_id': session_id}).get_json()
+    first, second = (c['id'] for c in page['flashcards'])
+    client.delete(f'/api/flashcards/id/{second}', query_string={'session_id': session_id})
+
+    response = client.patch('/api/flashcards/batch', json={
+        'session_id': session_id, 'base_revision': page['revision'],
+        'operations': [{'op': 'update', 'id': first, 'answer': 'changed'}]})
+    assert response.status_code == 409
+    assert response.get_json()['revision'] == page['revision'] + 1
+    assert client.get('/api/flashcards', query_string={'session_id': session_id}).get_json()['flashcards'] == [
+        {'id': first, 'question': 'Q1', 'answer': 'A1'}]
+
+    response = client.patch('/api/flashcards/batch', json={
+        'session_id': session_id, 'base_revision': page['revision'] + 1,
+        'operations': [{'op': 'update', 'id': first, 'answer': 'changed'}, {'op': 'add', 'question': 'Q3', 'answer': 'A3'}]})
+    assert response.status_code == 200
+    assert response.get_json()['updated'] == [first]
@@ -0,0 +1,32 @@
+import sqlite3
+
+from apkg_export import note_guid, write_collection
+
+
+def card(question, answer):
+    return {'question': question, 'answer': answer}
+
+
+def read_guids(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute('SELECT guid FROM notes ORDER BY id')]
+    finally:
+        conn.close()
+
+
+def test_cards_with_same_question_get_distinct_guids(tmp_path):
+    db_path = str(tmp_path / 'collection.anki2')
+    assert write_collection([card('What is X?', 'A'), card('What is X?', 'B')], db_path, 'Deck') == 2
+
+    guids = read_guids(db_path)
+    assert len(set(guids)) == 2
+    assert guids[0] == note_guid('Deck', 'What is X?')
+
+
+def test_guids_are_stable_across_exports(tmp_path):
+    cards = [card('What is X?', 'A'), card('What is Y?', 'B'), card('What is X?', 'C')]
+    write_collection(cards, str(tmp_path / 'first.anki2'), 'Deck')
+    write_collection(iter(cards), str(tmp_path / 'second.anki2'), 'Deck')
+
+    assert read_guids(str(tmp_path / 'first.anki2')) == read_guids(str(tmp_path / 'second.anki2'))
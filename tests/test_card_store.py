@@ -0,0 +1,53 @@
+import random
+
+import card_store
+from card_store import CardStore
+
+
+def card(question, answer):
+    return {'question': question, 'answer': answer}
+
+
+def make_store(count):
+    return CardStore([card(f'Q{i}', f'A{i}') for i in range(count)])
+
+
+def test_delete_leaves_tombstone_and_keeps_ids():
+    store = make_store(5)
+    assert store.delete(2)
+    assert not store.delete(2)
+    assert len(store) == 4
+    assert 2 not in store
+    assert store.get(2) is None
+    assert store.ids() == [1, 3, 4, 5]
+    assert store.get(3) == card('Q2', 'A2')
+    assert store.append('Q5', 'A5') == 6
+
+
+def test_compaction_keeps_ids_and_order(monkeypatch):
+    monkeypatch.setattr(card_store, 'COMPACT_MIN_DELETED', 2)
+    store = make_store(6)
+    for card_id in (1, 3, 5):
+        store.delete(card_id)
+    assert len(store._ids) == 3
+    assert list(store.items()) == [(2, card('Q1', 'A1')), (4, card('Q3', 'A3')), (6, card('Q5', 'A5'))]
+
+
+def test_id_at_skips_tombstones():
+    rng = random.Random(0)
+    store = make_store(200)
+    for card_id in rng.sample(range(1, 201), 40):
+        store.delete(card_id)
+    ids = store.ids()
+    assert [store.id_at(i) for i in range(len(store))] == ids
+    assert store.id_at(len(store)) is None
+    assert store.id_at(-1) is None
+
+
+def test_revision_and_change_log():
+    store = make_store(3)
+    revision = store.revision
+    store.update(2, 'Q', 'A')
+    store.delete(3)
+    assert store.revision == revision + 2
+    assert store.changed_since(revision) == [2]
@@ -0,0 +1,45 @@
+from dedupe import dedupe_flashcards, find_duplicate_groups
+
+
+def card(question, answer):
+    return {'question': question, 'answer': answer}
+
+
+def test_exact_duplicates_ignore_case_and_punctuation():
+    cards = [card('What is DNA?', 'Deoxyribonucleic acid'), card('what is dna', 'deoxyribonucleic acid.')]
+    assert find_duplicate_groups(cards) == [[0, 1]]
+
+
+def test_near_duplicates_keep_first_card():
+    cards = [
+        card('Which organelle produces most of the ATP in eukaryotic cells?', 'The mitochondrion'),
+        card('Which organelle produces most of the ATP in eukaryotic cell?', 'The mitochondrion'),
+        card('What is osmosis?', 'Diffusion of water across a membrane'),
+    ]
+    unique, groups = dedupe_flashcards(cards)
+    assert groups == [[0, 1]]
+    assert unique == [cards[0], cards[2]]
+
+
+def test_cjk_questions_differing_in_question_word_are_merged():
+    cards = [card('光合作用的场所是什么？', '叶绿体'), card('光合作用的场所是哪里？', '叶绿体')]
+    assert find_duplicate_groups(cards) == [[0, 1]]
+
+
+def test_different_cjk_cards_are_kept():
+    cards = [
+        card('光合作用的场所是什么？', '叶绿体'),
+        card('光合作用的产物是什么？', '葡萄糖和氧气'),
+        card('呼吸作用的场所是什么？', '线粒体'),
+    ]
+    assert find_duplicate_groups(cards) == []
+
+
+def test_shared_short_answer_alone_does_not_merge():
+    cards = [card('地球是圆的吗？', '是'), card('水在零度结冰吗？', '是')]
+    assert find_duplicate_groups(cards) == []
+
+
+def test_shared_answer_does_not_merge_different_questions():
+    cards = [card('Who wrote Hamlet?', 'Shakespeare'), card('Who wrote Macbeth?', 'Shakespeare')]
+    assert find_duplicate_groups(cards) == []
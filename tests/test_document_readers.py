@@ -0,0 +1,49 @@
+import pytest
+
+import document_readers
+import extraction_cache
+import pdf_extraction
+from fixtures import make_pdf
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = extraction_cache.ExtractionCache(str(tmp_path / 'extraction.sqlite3'))
+    monkeypatch.setattr(document_readers, 'get_extraction_cache', lambda: cache)
+    return cache
+
+
+def read_cached(path):
+    return ''.join(chunk.text for chunk in document_readers.iter_document_cached(path, max_workers=1))
+
+
+def test_cached_pdf_text_matches_uncached(tmp_path, cache):
+    path = make_pdf(str(tmp_path / 'doc.pdf'), 3)
+    uncached = ''.join(chunk.text for chunk in document_readers.iter_document(path, max_workers=1))
+
+    assert read_cached(path) == uncached
+    assert read_cached(path) == uncached
+
+
+def test_cached_pdf_pages_without_fingerprint_match_uncached(tmp_path, cache, monkeypatch):
+    def no_fingerprint(page):
+        raise ValueError('unreadable page')
+
+    monkeypatch.setattr(pdf_extraction, 'page_fingerprint', no_fingerprint)
+    path = make_pdf(str(tmp_path / 'doc.pdf'), 3)
+    uncached = ''.join(chunk.text for chunk in document_readers.iter_document(path, max_workers=1))
+
+    assert read_cached(path) == uncached
+    assert read_cached(path) == uncached
+
+
+def test_eviction_drops_least_recently_used_pages_and_their_documents(tmp_path):
+    cache = extraction_cache.ExtractionCache(str(tmp_path / 'extraction.sqlite3'), max_bytes=10, ttl=0)
+    cache.put_page('old', 'x' * 8)
+    cache.put_document('old-doc', [('old', 1, None)])
+    cache.put_page('new', 'y' * 8)
+    cache.put_document('new-doc', [('new', 1, None)])
+
+    assert cache.get_page('old') is None
+    assert cache.get_document('old-doc') is None
+    assert cache.get_document('new-doc') == [('y' * 8, 1, None)]
@@ -0,0 +1,58 @@
+import json
+import zipfile
+
+import pytest
+
+import Anki_flashcards_from_json as from_json
+from exporters import TEXT_FORMATS, iter_export, iter_export_zip, write_exports
+
+
+def card(question, answer):
+    return {'question': question, 'answer': answer}
+
+
+def write_truncated_deck(path, count):
+    text = json.dumps([card(f'Q{i}', f'A{i}') for i in range(count)])
+    path.write_text(text[:-20], encoding='utf-8')
+
+
+def test_failed_export_leaves_no_output_file(tmp_path):
+    def cards():
+        yield card('Q', 'A')
+        raise ValueError('broken input')
+
+    path = tmp_path / 'deck.txt'
+    with pytest.raises(ValueError):
+        write_exports(cards(), {'txt': str(path), 'csv': str(tmp_path / 'deck.csv')})
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_export_replaces_existing_file(tmp_path):
+    path = tmp_path / 'deck.txt'
+    path.write_text('old', encoding='utf-8')
+    write_exports([card('Q', 'A')], {'txt': str(path)})
+    assert path.read_text(encoding='utf-8') == 'Q;A\n'
+
+
+def test_truncated_deck_falls_back_to_recovered_prefix(tmp_path, monkeypatch):
+    deck = tmp_path / 'deck.json'
+    output = tmp_path / 'out.txt'
+    write_truncated_deck(deck, 5)
+
+    assert not from_json.export_streaming(str(deck), 'deck', 'txt', str(output))
+    assert not output.exists()
+
+    monkeypatch.setattr('sys.argv', ['Anki_flashcards_from_json.py', str(deck), '-f', 'txt', '-o', str(output)])
+    from_json.main()
+    assert output.read_text(encoding='utf-8') == ''.join(f'Q{i};A{i}\n' for i in range(4))
+
+
+def test_zip_export_contains_every_format(tmp_path):
+    cards = [card(f'Q{i}', f'A{i}\nline') for i in range(3000)]
+    archive = tmp_path / 'deck.zip'
+    archive.write_bytes(b''.join(iter_export_zip(iter(cards), 'deck')))
+
+    with zipfile.ZipFile(archive) as zf:
+        assert zf.testzip() is None
+        for fmt in TEXT_FORMATS:
+            assert zf.read(f'deck_anki.{fmt}') == b''.join(iter_export(cards, fmt))
@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+from json_stream import JsonStreamError, ValidationReport, iter_flashcards
+
+
+def card(question, answer):
+    return {'question': question, 'answer': answer}
+
+
+def test_cut_off_array_yields_valid_prefix(tmp_path):
+    path = tmp_path / 'deck.json'
+    path.write_text(json.dumps([card(f'Q{i}', f'A{i}') for i in range(5)])[:-20], encoding='utf-8')
+
+    cards = []
+    with pytest.raises(JsonStreamError):
+        for item in iter_flashcards(str(path)):
+            cards.append(item)
+    assert cards == [card(f'Q{i}', f'A{i}') for i in range(4)]
+
+
+def test_jsonl_skips_bad_lines(tmp_path):
+    path = tmp_path / 'deck.jsonl'
+    lines = [json.dumps(card('Q1', 'A1')), '{"question": "broken', '', json.dumps({'question': 'no answer'}),
+             json.dumps(card('Q2', 'A2'))]
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+    report = ValidationReport()
+    assert list(iter_flashcards(str(path), report)) == [card('Q1', 'A1'), card('Q2', 'A2')]
+    assert report.skipped == 2
+    assert report.examples[0].startswith('第 2 行')
@@ -0,0 +1,58 @@
+import json
+import sqlite3
+import time
+
+from card_store import CardStore
+from session_store import SQLiteSessionStore
+
+
+def card(question, answer):
+    return {'question': question, 'answer': answer}
+
+
+def make_store(tmp_path):
+    return SQLiteSessionStore(str(tmp_path / 'sessions.sqlite3'))
+
+
+def test_sqlite_cards_persist_as_rows(tmp_path):
+    store = make_store(tmp_path)
+    store.update('s', lambda session: session['flashcards'].replace([card(f'Q{i}', f'A{i}') for i in range(5)]),
+                 create=True)
+    store.update('s', lambda session: session['flashcards'].delete(2))
+    store.update('s', lambda session: session['flashcards'].update(4, 'Q', 'A'))
+
+    reopened = make_store(tmp_path)
+    items = reopened.read('s', lambda session: list(session['flashcards'].items_after(1)))
+    assert items == [(3, card('Q2', 'A2')), (4, card('Q', 'A')), (5, card('Q4', 'A4'))]
+    assert reopened.read('s', lambda session: (len(session['flashcards']), session['flashcards'].id_at(1))) == (4, 3)
+    assert reopened.read('s', lambda session: session['flashcards'].changed_since(1)) == [4]
+
+
+def test_sqlite_revision_check_does_not_read_cards(tmp_path):
+    store = make_store(tmp_path)
+    store.update('s', lambda session: session['flashcards'].replace([card('Q', 'A')] * 100), create=True)
+    statements = []
+    store._connect().set_trace_callback(statements.append)
+
+    revision = store.read('s', lambda session: (session['flashcards'].epoch, session['flashcards'].revision))
+    assert revision[1] == 1
+    assert not any('session_cards' in sql for sql in statements)
+
+
+def test_sqlite_migrates_sessions_saved_as_json(tmp_path):
+    path = str(tmp_path / 'sessions.sqlite3')
+    flashcards = CardStore([card('Q1', 'A1'), card('Q2', 'A2')])
+    flashcards.delete(1)
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)')
+    conn.execute('INSERT INTO sessions VALUES (?, ?, ?)',
+                 ('s', json.dumps({'filename': 'a.pdf', 'flashcards': flashcards.to_dict()}), time.time()))
+    conn.commit()
+    conn.close()
+
+    store = SQLiteSessionStore(path)
+    session = store.get('s')
+    assert session['filename'] == 'a.pdf'
+    assert list(session['flashcards'].items()) == [(2, card('Q2', 'A2'))]
+    assert (session['flashcards'].epoch, session['flashcards'].revision) == (flashcards.epoch, flashcards.revision)
+    assert store.update('s', lambda session: session['flashcards'].append('Q3', 'A3')) == 3
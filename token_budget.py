@@ -0,0 +1,162 @@
+"""
+Token 预算与请求规划
+- 发送前按提示估算输入 token 数，按预期的闪卡密度确定 max_tokens（代替固定的 2048）；
+- TokenBudget 在发送前预扣 "输入估算 + max_tokens"，超出预算时抛出 BudgetExceededError 而不发送请求，
+  完成后按 response.usage 的实际用量结算，可同时对比预估与实际用量；
+- 预算可以嵌套：文档预算的 parent 为会话预算，一次请求需同时满足两者。命中响应缓存的请求不消耗预算。
+
+环境变量:
+  DOCUMENT_TOKEN_BUDGET  每个文档（一次生成/增强）最多消耗的 token 数 (默认: 0，不限制)
+  SESSION_TOKEN_BUDGET   每个会话（API 会话或一次 CLI 运行）累计最多消耗的 token 数 (默认: 0，不限制)
+  CARDS_PER_1K_TOKENS    每 1000 个输入 token 预期生成的闪卡数 (默认: 8)
+  TOKENS_PER_CARD        每张闪卡（一行 问题;答案）平均输出的 token 数 (默认: 60)
+  MIN_OUTPUT_TOKENS      max_tokens 下限 (默认: 256)
+  MAX_OUTPUT_TOKENS      max_tokens 上限 (默认: 4096)
+"""
+
+import os
+import math
+import threading
+
+from chunking import estimate_tokens
+
+DOCUMENT_TOKEN_BUDGET = int(os.environ.get("DOCUMENT_TOKEN_BUDGET", "0"))
+SESSION_TOKEN_BUDGET = int(os.environ.get("SESSION_TOKEN_BUDGET", "0"))
+CARDS_PER_1K_TOKENS = float(os.environ.get("CARDS_PER_1K_TOKENS", "8"))
+TOKENS_PER_CARD = int(os.environ.get("TOKENS_PER_CARD", "60"))
+MIN_OUTPUT_TOKENS = int(os.environ.get("MIN_OUTPUT_TOKENS", "256"))
+MAX_OUTPUT_TOKENS = int(os.environ.get("MAX_OUTPUT_TOKENS", "4096"))
+
+# 预期输出之上的余量，密度偏高的段落不至于被截断
+OUTPUT_HEADROOM = 1.5
+# 每条消息在正文之外的格式开销（角色、分隔符）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class BudgetExceededError(Exception):
+    """请求的预估用量超出剩余 token 预算"""
+
+
+def estimate_prompt_tokens(messages):
+    """估算一组消息的输入 token 数"""
+    return sum(estimate_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def clamp_output_tokens(tokens):
+    return max(MIN_OUTPUT_TOKENS, min(MAX_OUTPUT_TOKENS, int(math.ceil(tokens))))
+
+
+def generation_max_tokens(text):
+    """按文本长度和预期闪卡密度确定生成请求的 max_tokens"""
+    expected_cards = max(1, estimate_tokens(text) * CARDS_PER_1K_TOKENS / 1000)
+    return clamp_output_tokens(expected_cards * TOKENS_PER_CARD * OUTPUT_HEADROOM)
+
+
+def rewrite_max_tokens(text):
+    """改写类请求（增强闪卡）的输出与输入长度相近，按输入估算 max_tokens"""
+    return clamp_output_tokens(estimate_tokens(text) * OUTPUT_HEADROOM)
+
+
+def plan_generation(chunks):
+    """发送前的规划：返回 (请求数, 预估总 token 数)"""
+    total = 0
+    for chunk in chunks:
+        total += estimate_tokens(chunk) + generation_max_tokens(chunk)
+    return len(chunks), total
+
+
+class TokenBudget:
+    """
+    线程安全的 token 预算，limit 为 0 时不限制（仍统计用量）
+    used: 此前已消耗的 token 数（如会话在之前的任务中已用掉的部分）
+    """
+
+    def __init__(self, limit=0, name='document', parent=None, used=0):
+        self.limit = limit
+        self.name = name
+        self.parent = parent
+        self.initial = used
+        self.reserved = 0
+        self.requests = 0
+        self.projected = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.spent = 0
+        # 是否有请求因超出预算（本预算或上级预算）而未发送
+        self.exceeded = False
+        self._lock = threading.Condition()
+
+    @property
+    def used(self):
+        return self.initial + self.spent
+
+    def remaining(self):
+        if not self.limit:
+            return None
+        return max(0, self.limit - self.used - self.reserved)
+
+    def reserve(self, tokens):
+        """
+        为一次请求预扣 tokens，超出本预算或上级预算时抛出 BudgetExceededError
+        只是因为并发请求的预扣而放不下时等待它们结算（实际用量通常远低于预扣）
+        """
+        with self._lock:
+            while self.limit and self.used + self.reserved + tokens > self.limit:
+                if not self.reserved or self.used + tokens > self.limit:
+                    self.exceeded = True
+                    raise BudgetExceededError(
+                        f"{self.name} token budget exceeded: {self.used} used, "
+                        f"request needs up to {tokens}, limit {self.limit}")
+                self._lock.wait()
+            self.reserved += tokens
+        if self.parent is not None:
+            try:
+                self.parent.reserve(tokens)
+            except BudgetExceededError:
+                self.exceeded = True
+                self.release(tokens, propagate=False)
+                raise
+
+    def release(self, tokens, propagate=True):
+        """请求失败、没有消耗 token 时归还预扣"""
+        with self._lock:
+            self.reserved -= tokens
+            self._lock.notify_all()
+        if propagate and self.parent is not None:
+            self.parent.release(tokens)
+
+    def settle(self, reserved, usage=None):
+        """按实际用量结算一次请求；没有 usage（如流式响应未返回用量）时按预扣量计"""
+        total = getattr(usage, 'total_tokens', None) or reserved
+        with self._lock:
+            self.reserved -= reserved
+            self.requests += 1
+            self.projected += reserved
+            self.spent += total
+            self.prompt_tokens += getattr(usage, 'prompt_tokens', None) or 0
+            self.completion_tokens += getattr(usage, 'completion_tokens', None) or 0
+            self._lock.notify_all()
+        if self.parent is not None:
+            self.parent.settle(reserved, usage)
+
+    def report(self):
+        with self._lock:
+            return {
+                'limit': self.limit or None,
+                'requests': self.requests,
+                'projected_tokens': self.projected,
+                'used_tokens': self.spent,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'remaining': self.remaining(),
+                'exceeded': self.exceeded,
+            }
+
+    def summary(self):
+        report = self.report()
+        text = (f"Token usage ({self.name}): {report['used_tokens']} used "
+                f"({report['prompt_tokens']} prompt + {report['completion_tokens']} completion), "
+                f"{report['projected_tokens']} projected over {report['requests']} requests")
+        if self.limit:
+            text += f", {self.used}/{self.limit} of budget"
+        return text
@@ -0,0 +1,67 @@
+"""
+流式 zip 打包
+条目数据边压缩边产出：本地文件头设置通用标志位 3，CRC 与大小写在条目数据之后的数据描述符中，
+中央目录在全部条目之后写出。不需要可 seek 的输出，条目也不会先缓存到内存或临时文件，
+可以作为 HTTP 分块响应逐块发送。条目与整个包都不能超过 4GB（不支持 zip64）。
+"""
+
+import time
+import struct
+import zlib
+
+ZIP32_LIMIT = 0xFFFFFFFF
+
+# 通用标志位 3: CRC 与大小在数据描述符中；标志位 11: 文件名使用 UTF-8 编码
+FLAG_DATA_DESCRIPTOR = 0x0008
+FLAG_UTF8 = 0x0800
+METHOD_DEFLATED = 8
+VERSION = 20
+
+
+def dos_datetime(timestamp=None):
+    t = time.localtime(timestamp)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((max(t.tm_year, 1980) - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def iter_zip(members, level=6):
+    """
+    members: (条目名, 字节块可迭代对象) 的可迭代对象，依次产出 zip 文件内容
+    每个条目的字节块在产出该条目时才被读取，压缩后立即产出
+    """
+    dos_time, dos_date = dos_datetime()
+    flags = FLAG_DATA_DESCRIPTOR | FLAG_UTF8
+    offset = 0
+    central = []
+    for name, chunks in members:
+        name = name.encode('utf-8')
+        header = struct.pack('<4s5H3L2H', b'PK\x03\x04', VERSION, flags, METHOD_DEFLATED, dos_time, dos_date,
+                             0, 0, 0, len(name), 0) + name
+        yield header
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        crc = size = compressed_size = 0
+        for data in chunks:
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+            block = compressor.compress(data)
+            if block:
+                compressed_size += len(block)
+                yield block
+        block = compressor.flush()
+        compressed_size += len(block)
+        yield block
+        if max(size, compressed_size) > ZIP32_LIMIT:
+            raise ValueError(f"zip member too large: {name.decode('utf-8')}")
+        descriptor = struct.pack('<4s3L', b'PK\x07\x08', crc, compressed_size, size)
+        yield descriptor
+        central.append(struct.pack('<4s6H3L5H2L', b'PK\x01\x02', VERSION, VERSION, flags, METHOD_DEFLATED,
+                                   dos_time, dos_date, crc, compressed_size, size, len(name), 0, 0, 0, 0,
+                                   0o644 << 16, offset) + name)
+        offset += len(header) + compressed_size + len(descriptor)
+        if offset > ZIP32_LIMIT:
+            raise ValueError("zip archive too large")
+
+    directory = b''.join(central)
+    yield directory
+    yield struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, len(central), len(central), len(directory), offset, 0)